@@ -1,25 +1,49 @@
+import asyncio
+import hashlib
+import json
 import logging
+import math
 import os
 import re
 import sys
+import time
+from datetime import datetime
 
 # --- Path Setup ---
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
-# Import and run logging config before anything else
+# Import and run logging config before anything else; it also loads .env
 from tools.logging_config import setup_logging
 
 setup_logging()
 
-from dotenv import load_dotenv
-
-load_dotenv()
-
-import requests
-from fastapi import BackgroundTasks, FastAPI, HTTPException, Request
+from fastapi import BackgroundTasks, FastAPI, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
-from tools import intent_analysis, search, vector_db
+from tools import (
+    admission,
+    chat_writer,
+    circuit_breaker,
+    conversation,
+    embedding_cache,
+    intent_analysis,
+    metrics,
+    ollama,
+    rate_limit,
+    routing,
+    search,
+    tracing,
+    vector_db,
+)
+from tools.deadline import (
+    DEADLINE_HEADER,
+    Deadline,
+    DeadlineExceeded,
+    RequestCancelled,
+)
+from tools.dispatcher import BACKGROUND
 from tools.system_prompts import (
     get_final_answer_prompt,
     get_user_profile_generator_prompt,
@@ -31,20 +55,46 @@ log = logging.getLogger(__name__)
 
 
 # --- Configuration ---
-OLLAMA_HOST = os.getenv("OLLAMA_HOST_URL")
-OLLAMA_EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text:v1.5")
+OLLAMA_EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL") or "nomic-embed-text:v1.5"
 CONTEXT_SUMMARY_COUNT = int(os.getenv("CONTEXT_SUMMARY_COUNT", 10))
+# Seconds of the request budget held back for the final answer.
+DEADLINE_GENERATE_RESERVE = float(os.getenv("DEADLINE_GENERATE_RESERVE", 20))
+# Intent analysis and search are skipped when less than this is left for them.
+DEADLINE_MIN_SEARCH_SECONDS = float(os.getenv("DEADLINE_MIN_SEARCH_SECONDS", 10))
+# Answers are capped to what the remaining budget can generate at this rate.
+OLLAMA_TOKENS_PER_SECOND = float(os.getenv("OLLAMA_TOKENS_PER_SECOND", 20))
+RESPONSE_MIN_TOKENS = int(os.getenv("RESPONSE_MIN_TOKENS", 64))
+# Shed requests whose estimated queue wait would outlast their deadline.
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() == "true"
+# Requests answered at once, by default as many as Ollama slots.
+ADMISSION_CONCURRENCY = int(
+    os.getenv("ADMISSION_CONCURRENCY", ollama.OLLAMA_MAX_CONCURRENT)
+)
+ADMISSION_MIN_SAMPLES = int(os.getenv("ADMISSION_MIN_SAMPLES", 10))
+DISCONNECT_POLL_INTERVAL = 0.5
+CONTEXT_BULK_MAX = 100  # usernames per /contexts request
+# GET /history has no authentication and returns every user's chats, so it
+# stays off unless the API is only reachable by trusted clients.
+HISTORY_EXPORT_ENABLED = os.getenv("HISTORY_EXPORT_ENABLED", "false").lower() == "true"
 
 # --- Initialize App ---
 app = FastAPI()
+tracing.set_service("api")
+# Mirrors the bot's per-user limit for any other client of the API.
+rate_limiter = rate_limit.from_env("api")
+admission_controller = admission.AdmissionController(
+    "admission", ADMISSION_CONCURRENCY, ADMISSION_MIN_SAMPLES
+)
 
 
 # --- Pydantic Model for Input Validation ---
 class PromptRequest(BaseModel):
     prompt: str
     username: str
-    model: str = "llama2-uncensored:7b"
+    # Leave unset to let the router pick a model tier for the answer.
+    model: str | None = None
     target_user: str | None = None
+    channel_id: str | None = None
 
 
 # --- Input Sanitization Function ---
@@ -54,21 +104,6 @@ def sanitize_input(prompt: str) -> str:
     return sanitized.strip()
 
 
-def get_ollama_embedding(text_to_embed: str, model: str) -> list[float]:
-    """Generates an embedding for a given text using the Ollama API."""
-    try:
-        response = requests.post(
-            f"{OLLAMA_HOST}/api/embeddings",
-            json={"model": model, "prompt": text_to_embed},
-            timeout=60,
-        )
-        response.raise_for_status()
-        return response.json().get("embedding")
-    except requests.RequestException as e:
-        log.error(f"Failed to get embedding from Ollama for model '{model}': {e}")
-        raise
-
-
 # --- Background Task for Saving and Profiling ---
 def process_and_save_background(
     username: str,
@@ -76,6 +111,23 @@ def process_and_save_background(
     response: str,
     model: str,
     search_queries: list[str] | None = None,
+    channel_id: str | None = None,
+):
+    """
+    Runs `_process_and_save` as a span of the current trace. The request
+    hands it over with `tracing.bind`, so it continues the request's trace.
+    """
+    with tracing.span("background", username=username):
+        _process_and_save(username, prompt, response, model, search_queries, channel_id)
+
+
+def _process_and_save(
+    username: str,
+    prompt: str,
+    response: str,
+    model: str,
+    search_queries: list[str] | None,
+    channel_id: str | None,
 ):
     """
     Saves chat, then generates or updates the user profile based on context.
@@ -86,18 +138,23 @@ def process_and_save_background(
         log.debug(
             f"Generating embeddings with Ollama model '{OLLAMA_EMBEDDING_MODEL}'."
         )
-        # Call the new function to get embeddings from Ollama
-        prompt_embedding = get_ollama_embedding(prompt, OLLAMA_EMBEDDING_MODEL)
-        response_embedding = get_ollama_embedding(response, OLLAMA_EMBEDDING_MODEL)
+        # Repeated prompts and stock replies are served from the embedding cache
+        with metrics.timer("stage.background.embed"), tracing.span("embed"):
+            prompt_embedding, response_embedding = embedding_cache.get_embeddings(
+                [prompt, response], OLLAMA_EMBEDDING_MODEL, lane=BACKGROUND
+            )
 
-        vector_db.save_chat(
-            username,
-            prompt,
-            response,
-            prompt_embedding,
-            response_embedding,
-            search_queries,
-        )
+        with metrics.timer("stage.background.save_chat"), tracing.span("save_chat"):
+            chat_writer.save_chat(
+                username,
+                prompt,
+                response,
+                prompt_embedding,
+                response_embedding,
+                search_queries,
+                embedding_model=OLLAMA_EMBEDDING_MODEL,
+                channel_id=channel_id,
+            )
 
         # Check for existing user context/profile
         log.debug(f"Checking for existing profile for '{username}'.")
@@ -107,6 +164,8 @@ def process_and_save_background(
         if not existing_profile:
             # --- CASE 1: No existing profile. Create one from the last 10 chats. ---
             log.info(f"No profile found for '{username}'. Generating a new one.")
+            # Make sure this chat is in the history when write-behind is on.
+            chat_writer.flush()
             chat_history = vector_db.get_recent_chats(username, CONTEXT_SUMMARY_COUNT)
             if chat_history:
                 profile_prompt = get_user_profile_generator_prompt(
@@ -119,27 +178,23 @@ def process_and_save_background(
                 return
         else:
             # --- CASE 2: Profile exists. Update it with the single most recent chat. ---
+            # That chat is the one being saved, so use it directly instead of
+            # reading it back (it may still be in the write-behind buffer).
             log.info(f"Existing profile found for '{username}'. Updating it.")
-            most_recent_chat = vector_db.get_single_most_recent_chat(username)
-            if most_recent_chat:
-                profile_prompt = get_user_profile_updater_prompt(
-                    existing_profile, most_recent_chat, username
-                )
-            else:
-                log.warning(
-                    f"Could not fetch most recent chat for '{username}', skipping profile update."
-                )
-                return
+            profile_prompt = get_user_profile_updater_prompt(
+                existing_profile, prompt, username
+            )
 
         # Generate the new/updated profile
         log.info(f"Generating new/updated user profile for '{username}'.")
-        profile_response = requests.post(
-            f"{OLLAMA_HOST}/api/generate",
-            json={"model": model, "prompt": profile_prompt, "stream": False},
-            timeout=60,
-        )
-        profile_response.raise_for_status()
-        new_profile = profile_response.json().get("response", "").strip()
+        # Waits behind interactive calls, so users are answered first.
+        with metrics.timer("stage.background.profile"), tracing.span("profile"):
+            profile_envelope = ollama.generate(
+                {"model": model, "prompt": profile_prompt},
+                stage="profile",
+                lane=BACKGROUND,
+            )
+        new_profile = profile_envelope.get("response", "").strip()
 
         # Save the new profile
         if new_profile:
@@ -148,6 +203,7 @@ def process_and_save_background(
             log.warning(f"LLM returned an empty profile for '{username}'.")
 
     except Exception as e:
+        metrics.increment("background.errors")
         log.error(f"Error in background task for '{username}': {e}", exc_info=True)
     finally:
         log.info(f"[bold red]ENDING INTERACTION with {username}[/bold red]")
@@ -160,7 +216,21 @@ async def generate_prompt(
 ):
     """
     Receives a prompt, gets a response, and kicks off a background task.
+    The request continues the caller's trace, or starts a new one.
     """
+    trace_id = request.headers.get(tracing.TRACE_HEADER) or tracing.new_trace_id()
+    with tracing.span(
+        "api.generate",
+        trace_id=trace_id,
+        parent_id=request.headers.get(tracing.PARENT_HEADER),
+        username=data.username,
+    ):
+        return await _generate(request, data, background_tasks)
+
+
+async def _generate(
+    request: Request, data: PromptRequest, background_tasks: BackgroundTasks
+):
     log.info(f"[bold red]STARTING INTERACTION with {data.username}[/bold red]")
 
     sanitized_prompt = sanitize_input(data.prompt)
@@ -169,57 +239,106 @@ async def generate_prompt(
             status_code=400, detail="Prompt is empty after sanitization."
         )
 
-    try:
-        # --- GET USER CONTEXTS ---
-        user_context = vector_db.get_user_context(data.username)
-        target_user_profile = None
-        if data.target_user:
-            log.info(f"Prompt is about '{data.target_user}'. Fetching their profile.")
-            target_user_profile = vector_db.get_user_context(data.target_user)
-            if not target_user_profile:
-                log.warning(f"No profile found for target user '{data.target_user}'.")
+    retry_after = await run_in_threadpool(rate_limiter.check, {"user": data.username})
+    if retry_after is not None:
+        log.info(
+            f"[bold red]ENDING INTERACTION with {data.username}, rate limited[/bold red]"
+        )
+        raise HTTPException(
+            status_code=429,
+            detail="Too many requests, slow down.",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
 
-        # --- INTENT ANALYSIS ---
-        search_needed = intent_analysis.decide_if_search_is_needed(
-            prompt=sanitized_prompt, model=data.model
+    # While Ollama is known to be down nothing can be answered, so say so now.
+    ollama_retry_after = ollama.breaker.retry_after()
+    if ollama_retry_after is not None:
+        metrics.increment("request.generate.circuit_open")
+        log.info(
+            f"[bold red]ENDING INTERACTION with {data.username}, Ollama is down[/bold red]"
+        )
+        raise HTTPException(
+            status_code=503,
+            detail="The language model is unavailable, try again later.",
+            headers={"Retry-After": str(max(1, math.ceil(ollama_retry_after)))},
         )
-        search_context, search_queries = None, None
-        if search_needed:
-            log.info("Search is needed. Starting intelligent search process.")
-            search_context, search_queries = search.think_and_search(
-                prompt=sanitized_prompt, model=data.model
-            )
-        else:
-            log.info("Search not needed. Generating a conversational response.")
 
-        # --- GENERATE FINAL RESPONSE ---
-        final_prompt = get_final_answer_prompt(
-            sanitized_prompt,
-            search_context,
-            user_context,
-            target_user_profile,
-            data.target_user,
+    deadline = Deadline.from_header(request.headers.get(DEADLINE_HEADER))
+    log.debug(f"Request budget is {deadline.budget:.1f}s.")
+    try:
+        if ADMISSION_CONTROL:
+            admission_controller.admit(deadline.remaining())
+    except admission.Overloaded as e:
+        log.warning(f"Shedding request from '{data.username}': {e}")
+        log.info(
+            f"[bold red]ENDING INTERACTION with {data.username}, overloaded[/bold red]"
+        )
+        raise HTTPException(
+            status_code=503,
+            detail={
+                "message": "Too busy to answer in time, try again later.",
+                "estimated_wait": round(e.estimated_wait, 1),
+                "queue_depth": e.ahead,
+            },
+            headers={"Retry-After": str(math.ceil(e.retry_after))},
         )
-        response = requests.post(
-            f"{OLLAMA_HOST}/api/generate",
-            json={"model": data.model, "prompt": final_prompt, "stream": False},
-            timeout=60,
+
+    watcher = asyncio.create_task(_cancel_on_disconnect(request, deadline))
+    request_start = time.perf_counter()
+    service_time = None
+    try:
+        # bind() carries the trace into the worker thread.
+        model_response, search_queries = await run_in_threadpool(
+            tracing.bind(_answer_prompt), data, sanitized_prompt, deadline
+        )
+
+        # Remember the turn right away so a quick follow-up can refer to it.
+        conversation.record(
+            data.channel_id, data.username, sanitized_prompt, model_response
         )
-        response.raise_for_status()
-        model_response = response.json().get("response", "No response from model.")
 
         # --- KICK OFF BACKGROUND TASK ---
         background_tasks.add_task(
-            process_and_save_background,
+            tracing.bind(process_and_save_background),
             data.username,
             sanitized_prompt,
             model_response,
-            data.model,
+            data.model or routing.default_model(),
             search_queries,
+            data.channel_id,
         )
+        service_time = time.perf_counter() - request_start
+        metrics.observe("request.generate", service_time)
         return {"response": model_response}
 
+    except RequestCancelled as e:
+        log.info(
+            f"[bold red]ENDING INTERACTION with {data.username}, client left: {e}[/bold red]"
+        )
+        # Nobody is listening; nginx's "client closed request" code for the logs.
+        raise HTTPException(status_code=499, detail="Client closed request.")
+    except circuit_breaker.CircuitOpen as e:
+        metrics.increment("request.generate.circuit_open")
+        log.warning(f"Request for '{data.username}' failed fast: {e}")
+        log.info(
+            f"[bold red]ENDING INTERACTION with {data.username}, Ollama is down[/bold red]"
+        )
+        raise HTTPException(
+            status_code=503,
+            detail="The language model is unavailable, try again later.",
+            headers={"Retry-After": str(max(1, math.ceil(e.retry_after)))},
+        )
+    except DeadlineExceeded as e:
+        # A timed-out request still occupied the server for its whole budget.
+        service_time = time.perf_counter() - request_start
+        metrics.increment("request.generate.deadline_exceeded")
+        log.warning(f"Request for '{data.username}' ran out of time: {e}")
+        log.info(
+            f"[bold red]ENDING INTERACTION with {data.username} due to timeout[/bold red]"
+        )
+        raise HTTPException(status_code=504, detail="Ran out of time to answer.")
     except Exception as e:
+        metrics.increment("request.generate.errors")
         log.error(
             f"An unexpected error occurred in generate_prompt for '{data.username}': {e}",
             exc_info=True,
@@ -230,21 +349,254 @@ async def generate_prompt(
         raise HTTPException(
             status_code=500, detail="An internal server error occurred."
         )
+    finally:
+        watcher.cancel()
+        if ADMISSION_CONTROL:
+            admission_controller.release(service_time)
+
+
+async def _cancel_on_disconnect(request: Request, deadline: Deadline):
+    """Cancels the deadline as soon as the client closes the connection."""
+    while not deadline.cancelled:
+        if await request.is_disconnected():
+            metrics.increment("request.generate.cancelled")
+            log.warning("Client disconnected, cancelling upstream calls.")
+            deadline.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+def _answer_prompt(
+    data: PromptRequest, sanitized_prompt: str, deadline: Deadline
+) -> tuple[str, list[str] | None]:
+    """
+    Runs the blocking pipeline (context, intent, search, answer) within the
+    request's deadline, trading search and answer length for time when the
+    budget runs low.
+    """
+    # --- GET USER CONTEXTS ---
+    with metrics.timer("stage.context"), tracing.span("context"):
+        # Author and target profiles come back from a single query.
+        contexts = vector_db.get_user_contexts([data.username, data.target_user])
+        user_context, _ = contexts.get(data.username, (None, None))
+        target_user_profile = None
+        if data.target_user:
+            log.info(f"Prompt is about '{data.target_user}'. Fetched their profile.")
+            target_user_profile, _ = contexts.get(data.target_user, (None, None))
+            if not target_user_profile:
+                log.warning(f"No profile found for target user '{data.target_user}'.")
+
+    # --- INTENT ANALYSIS ---
+    # Query generation is not routed; the answer's model is chosen below.
+    working_model = data.model or routing.default_model()
+    search_context, search_queries, search_needed = None, None, False
+    deadline.check("intent analysis")
+    if deadline.remaining() - DEADLINE_GENERATE_RESERVE < DEADLINE_MIN_SEARCH_SECONDS:
+        metrics.increment("deadline.search_skipped")
+        log.warning(
+            f"Only {deadline.remaining():.1f}s left, skipping intent analysis and search."
+        )
+    else:
+        with metrics.timer("stage.intent"), tracing.span("intent"):
+            search_needed = intent_analysis.decide_if_search_is_needed(
+                prompt=sanitized_prompt,
+                model=working_model,
+                deadline=deadline,
+                reserve=DEADLINE_GENERATE_RESERVE,
+            )
+        search_budget = deadline.remaining() - DEADLINE_GENERATE_RESERVE
+        if search_needed and search_budget < DEADLINE_MIN_SEARCH_SECONDS:
+            metrics.increment("deadline.search_skipped")
+            log.warning(f"Search needed but only {search_budget:.1f}s left, skipping.")
+        elif search_needed:
+            log.info("Search is needed. Starting intelligent search process.")
+            with metrics.timer("stage.search"), tracing.span("search"):
+                search_context, search_queries = search.think_and_search(
+                    prompt=sanitized_prompt,
+                    model=working_model,
+                    deadline=deadline,
+                    reserve=DEADLINE_GENERATE_RESERVE,
+                )
+        else:
+            log.info("Search not needed. Generating a conversational response.")
+
+    # --- GENERATE FINAL RESPONSE ---
+    recent_turns = conversation.recent(data.channel_id)
+    final_prompt = get_final_answer_prompt(
+        sanitized_prompt,
+        search_context,
+        user_context,
+        target_user_profile,
+        data.target_user,
+        conversation.format_turns(recent_turns),
+    )
+    tier = routing.choose_tier(
+        sanitized_prompt, search_needed, bool(search_context), data.model
+    )
+    deadline_cap = None
+    if deadline.remaining() < DEADLINE_GENERATE_RESERVE:
+        # Less time than the reserve is left, so ask for a shorter answer.
+        affordable_tokens = int(deadline.remaining() * OLLAMA_TOKENS_PER_SECOND)
+        deadline_cap = max(RESPONSE_MIN_TOKENS, affordable_tokens)
+        metrics.increment("deadline.num_predict_capped")
+        log.warning(f"Low on time, limiting the answer to {deadline_cap} tokens.")
+
+    def answer_with(tier: routing.Tier) -> dict:
+        payload = {"model": tier.model, "prompt": final_prompt}
+        num_predict = tier.cap(deadline_cap)
+        if num_predict:
+            payload["options"] = {"num_predict": num_predict}
+        span.set("tier", tier.name)
+        span.set("num_predict", num_predict or 0)
+        return ollama.generate(payload, deadline=deadline, stage="generate")
+
+    generate_start = time.perf_counter()
+    with metrics.timer("stage.generate"), tracing.span("generate") as span:
+        try:
+            envelope = answer_with(tier)
+        except Exception as e:
+            fallback = routing.fallback_tier(tier, e)
+            if fallback is None:
+                raise
+            tier = fallback
+            envelope = answer_with(tier)
+    routing.record_usage(tier, envelope, time.perf_counter() - generate_start)
+    model_response = envelope.get("response") or "No response from model."
+    return model_response, search_queries
+
+
+def _context_etag(username: str, updated_at: datetime) -> str:
+    """A profile's version: it changes whenever `users.updated_at` does."""
+    version = f"{username}:{updated_at.isoformat()}".encode()
+    return f'"{hashlib.sha1(version).hexdigest()[:16]}"'
+
+
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
 
 
 @app.get("/context/{username}")
-async def get_user_context_endpoint(username: str):
-    """Fetches the user profile/context from the database."""
+async def get_user_context_endpoint(username: str, request: Request):
+    """
+    Fetches the user profile/context from the database. The response carries
+    an ETag; a request whose If-None-Match still matches gets an empty 304.
+    """
     log.info(f"Received request for context for user '{username}'.")
-    user_context = vector_db.get_user_context(username)
-    if not user_context:
+    contexts = await run_in_threadpool(vector_db.get_user_contexts, [username])
+    if username not in contexts:
         raise HTTPException(status_code=404, detail="No context found for this user.")
-    return {"username": username, "context": user_context}
+    user_context, updated_at = contexts[username]
+    etag = _context_etag(username, updated_at)
+    if _etag_matches(request.headers.get("If-None-Match"), etag):
+        metrics.increment("context.not_modified")
+        return Response(status_code=304, headers={"ETag": etag})
+    return JSONResponse(
+        {"username": username, "context": user_context}, headers={"ETag": etag}
+    )
+
+
+@app.get("/contexts")
+async def get_user_contexts_endpoint(username: list[str] = Query(...)):
+    """
+    Fetches several profiles with one query, e.g.
+    `/contexts?username=alice&username=bob`. Users without a profile are
+    listed under "missing".
+    """
+    if len(username) > CONTEXT_BULK_MAX:
+        raise HTTPException(
+            status_code=400, detail=f"At most {CONTEXT_BULK_MAX} usernames per request."
+        )
+    contexts = await run_in_threadpool(vector_db.get_user_contexts, username)
+    return {
+        "contexts": {
+            name: {"context": context, "etag": _context_etag(name, updated_at)}
+            for name, (context, updated_at) in contexts.items()
+        },
+        "missing": [name for name in dict.fromkeys(username) if name not in contexts],
+    }
+
+
+@app.get("/history")
+def export_history(
+    username: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    after_id: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1),
+    include_embeddings: bool = False,
+):
+    """
+    Streams chat history as NDJSON, one chat per line, in id order.
+
+    Filter by `username` and a `since`/`until` time range. For keyset
+    pagination, pass the last `id` received as `after_id` together with
+    `limit`. Embeddings are left out unless `include_embeddings` is set.
+
+    The 200 status is sent before the first row, so if the database fails
+    part way through, the last line is an `{"error": ...}` record instead.
+
+    Answers 404 unless HISTORY_EXPORT_ENABLED is set.
+    """
+    if not HISTORY_EXPORT_ENABLED:
+        raise HTTPException(status_code=404, detail="History export is disabled.")
+    log.info(
+        f"Exporting chat history (username={username}, since={since}, "
+        f"until={until}, after_id={after_id}, limit={limit})."
+    )
+    rows = vector_db.iter_chat_history(
+        username=username,
+        since=since,
+        until=until,
+        after_id=after_id,
+        limit=limit,
+        include_embeddings=include_embeddings,
+    )
+
+    def lines():
+        try:
+            for row in rows:
+                yield json.dumps(row) + "\n"
+        except Exception as e:
+            yield json.dumps({"error": f"History export failed: {e}"}) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
 
 
 @app.on_event("startup")
 async def startup_event():
     vector_db.setup_database()
+    # One bulk query, so follow-ups keep working across restarts.
+    conversation.warm_up(
+        vector_db.get_recent_channel_turns(
+            conversation.CONVERSATION_TURNS, conversation.CONVERSATION_MAX_AGE_SECONDS
+        )
+    )
+
+
+@app.on_event("shutdown")
+def shutdown_event():
+    chat_writer.shutdown()
+    tracing.shutdown()
+
+
+@app.get("/queue")
+def queue_estimate():
+    """How long a request sent now is expected to wait before it is served."""
+    return admission_controller.estimate()
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    """Returns in-process counters and per-stage latency percentiles."""
+    return {
+        **metrics.snapshot(),
+        "searxng": search.get_searxng_stats(),
+        "ollama_queue": ollama.dispatcher.stats(),
+        "circuits": circuit_breaker.stats(),
+    }
 
 
 @app.get("/health")
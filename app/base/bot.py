@@ -1,7 +1,10 @@
 import asyncio
 import logging
+import math
 import os
 import sys
+import time
+from collections import OrderedDict
 from urllib.parse import quote
 
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -11,18 +14,35 @@ from tools.logging_config import setup_logging
 
 setup_logging()
 
+from tools import metrics, rate_limit, sharding, tracing
+
 import aiohttp
 import discord
 from discord.ext import commands
-from dotenv import load_dotenv
+from tools.settings import get_settings
 
 # --- Configuration ---
-load_dotenv()
-TOKEN = os.getenv("DISCORD_TOKEN")
-API_BASE_URL = "http://localhost:8000"
+# .env was loaded by setup_logging above.
+settings = get_settings()
+TOKEN = settings.discord_token
+API_BASE_URL = settings.api_base_url
 API_WRAPPER_URL = f"{API_BASE_URL}/generate"
 API_HEALTH_URL = f"{API_BASE_URL}/health"
 API_CONTEXT_URL = f"{API_BASE_URL}/context"
+# How long to wait for an answer. The API is told to finish a little sooner
+# so a late answer is cut short instead of being thrown away.
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", 70))
+API_DEADLINE_MARGIN = 5
+# Profiles are shown from memory for this long, then revalidated with their
+# ETag, which costs the API a lookup but no transfer when nothing changed.
+CONTEXT_CACHE_TTL = float(os.getenv("CONTEXT_CACHE_TTL", 60))
+CONTEXT_CACHE_MAX = 1000
+# Messages discord.py keeps for edit/delete events, which the bot never
+# handles; 0 turns the cache off.
+BOT_MAX_MESSAGES = int(os.getenv("BOT_MAX_MESSAGES", 1000))
+BOT_MINIMAL_INTENTS = os.getenv("BOT_MINIMAL_INTENTS", "true").lower() == "true"
+# How often shard latency, message rates and memory are recorded (0 = never).
+BOT_STATS_INTERVAL = float(os.getenv("BOT_STATS_INTERVAL", 60))
 
 
 # --- Logging Setup ---
@@ -36,9 +56,153 @@ logging.getLogger("discord.gateway").setLevel(logging.WARNING)
 
 
 # --- Bot Setup ---
-intents = discord.Intents.default()
+tracing.set_service("bot")
+if BOT_MINIMAL_INTENTS:
+    # Only guilds and message events: mentioned members arrive with the
+    # message, so member, presence, typing and reaction events are not needed.
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.dm_messages = True
+else:
+    intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+
+bot_options = {
+    "command_prefix": "!",
+    "intents": intents,
+    "max_messages": BOT_MAX_MESSAGES or None,
+}
+if settings.bot_sharding:
+    bot = commands.AutoShardedBot(
+        **bot_options,
+        shard_count=settings.bot_shard_count or None,
+        shard_ids=list(settings.bot_shard_ids) if settings.bot_shard_ids else None,
+    )
+else:
+    bot = commands.Bot(**bot_options)
+
+# --- Shard Stats ---
+shard_stats = sharding.ShardStats()
+_stats_task: asyncio.Task | None = None
+
+
+def shard_latencies() -> list[tuple[int, float]]:
+    if isinstance(bot, commands.AutoShardedBot):
+        return bot.latencies
+    return [(0, bot.latency)]
+
+
+async def report_shard_stats():
+    """Records and logs per-shard latency, message rates and memory use."""
+    while True:
+        await asyncio.sleep(BOT_STATS_INTERVAL)
+        report = shard_stats.report(
+            shard_latencies(), len(bot.guilds), BOT_STATS_INTERVAL
+        )
+        shards = ", ".join(
+            f"shard {shard_id} "
+            + (f"{shard['latency'] * 1000:.0f}ms " if "latency" in shard else "")
+            + f"{shard['messages_per_second']:.2f} msg/s"
+            for shard_id, shard in report["shards"].items()
+        )
+        per_1000 = report.get("memory_mb_per_1000_guilds")
+        log.info(
+            f"{report['guilds']} guilds, {report['memory_mb']:.0f} MB"
+            + (f" ({per_1000:.1f} MB per 1,000 guilds)" if per_1000 else "")
+            + f"; {shards}"
+        )
+
+
+# --- Rate Limiting ---
+rate_limiter = rate_limit.from_env("bot")
+# Authors already told to slow down, and until when, so a flood gets one
+# warning, not many. Entries are dropped once their wait is over.
+_throttle_warned: dict[int, float] = {}
+
+
+async def check_rate_limit(message: discord.Message) -> float | None:
+    """Returns the seconds the author must wait, or None if they may go ahead."""
+    ids = {
+        "user": message.author.id,
+        "channel": message.channel.id,
+        "guild": message.guild.id if message.guild else None,
+    }
+    if isinstance(rate_limiter.store, rate_limit.PostgresBucketStore):
+        # The shared store does blocking database I/O.
+        return await asyncio.to_thread(rate_limiter.check, ids)
+    return rate_limiter.check(ids)
+
+
+def should_warn(author_id: int, retry_after: float) -> bool:
+    """Whether to tell a throttled author to wait: once per throttled period."""
+    now = time.monotonic()
+    if _throttle_warned.get(author_id, 0.0) > now:
+        return False
+    for expired in [a for a, until in _throttle_warned.items() if until <= now]:
+        del _throttle_warned[expired]
+    _throttle_warned[author_id] = now + retry_after
+    return True
+
+
+# --- Profile Cache ---
+# username -> (context, etag, fetched_at), least recently used first.
+_context_cache: OrderedDict[str, tuple[str, str, float]] = OrderedDict()
+
+
+async def fetch_context(session: aiohttp.ClientSession, username: str) -> str | None:
+    """
+    Returns the user's saved context, or None if they have none. Fresh
+    cache entries skip the API; stale ones are revalidated with If-None-Match.
+    """
+    cached = _context_cache.get(username)
+    if cached and time.monotonic() - cached[2] < CONTEXT_CACHE_TTL:
+        _context_cache.move_to_end(username)
+        return cached[0]
+
+    headers = {"If-None-Match": cached[1]} if cached else {}
+    headers.update(tracing.headers())
+    try:
+        # URL-encode the username to handle special characters like '#'
+        async with session.get(
+            f"{API_CONTEXT_URL}/{quote(username)}", headers=headers
+        ) as response:
+            if response.status == 304 and cached:
+                context, etag = cached[0], cached[1]
+            elif response.status == 200:
+                data = await response.json()
+                context = data.get("context", "Context data is missing.")
+                etag = response.headers.get("ETag", "")
+            elif response.status == 404:
+                _context_cache.pop(username, None)
+                return None
+            else:
+                response.raise_for_status()
+                raise aiohttp.ClientError(f"Unexpected status {response.status}")
+    except Exception:
+        if cached:
+            log.warning(f"Could not revalidate context for '{username}', using cache.")
+            return cached[0]
+        raise
+
+    _context_cache[username] = (context, etag, time.monotonic())
+    _context_cache.move_to_end(username)
+    while len(_context_cache) > CONTEXT_CACHE_MAX:
+        _context_cache.popitem(last=False)
+    return context
+
+
+async def unavailable_reply(response: aiohttp.ClientResponse, retry_after: str) -> str:
+    """The reply to a 503, saying how busy the API is when it shed the prompt."""
+    try:
+        detail = (await response.json()).get("detail")
+    except Exception:
+        detail = None
+    if isinstance(detail, dict) and "queue_depth" in detail:
+        opening = f"I'm busy, {detail['queue_depth']} requests ahead of you. "
+    else:
+        opening = "I can't answer right now. "
+    return f"{opening}Try again in about {retry_after} seconds."
 
 
 @bot.event
@@ -46,6 +210,11 @@ async def on_ready():
     """Fires when connected to Discord, then checks for backend readiness."""
     logging.info(f"Connected to Discord as {bot.user}. Waiting for backend API...")
 
+    # on_ready fires again after a reconnect; only one reporter is started.
+    global _stats_task
+    if BOT_STATS_INTERVAL > 0 and _stats_task is None:
+        _stats_task = asyncio.create_task(report_shard_stats())
+
     max_retries = 12  # Try for up to 60 seconds (12 * 5s)
     async with aiohttp.ClientSession() as session:
         for attempt in range(max_retries):
@@ -73,12 +242,26 @@ async def on_ready():
     )
 
 
+@bot.event
+async def on_shard_disconnect(shard_id: int):
+    log.warning(f"Shard {shard_id} lost its gateway connection.")
+    metrics.increment(f"bot.shard.{shard_id}.disconnects")
+
+
+@bot.event
+async def on_shard_resumed(shard_id: int):
+    log.info(f"Shard {shard_id} resumed its session.")
+
+
 @bot.event
 async def on_message(message: discord.Message):
     """Fires on every message sent in a channel the bot can see."""
     if message.author == bot.user:
         return
 
+    # Direct messages always arrive on shard 0.
+    shard_stats.record_message(message.guild.shard_id if message.guild else 0)
+
     # Ignore any message containing @everyone or @here
     if (
         message.mention_everyone
@@ -89,119 +272,147 @@ async def on_message(message: discord.Message):
 
     # Check if the bot was specifically mentioned
     if bot.user in message.mentions:
-        # --- Clean the prompt by removing the bot's mention ---
-        mention_standard = f"<@{bot.user.id}>"
-        mention_nickname = f"<@!{bot.user.id}>"
-        prompt = (
-            message.content.replace(mention_standard, "")
-            .replace(mention_nickname, "")
-            .strip()
-        )
+        # Everything this reply costs, here and in the API, shares one trace.
+        with tracing.span(
+            "bot.message",
+            trace_id=tracing.new_trace_id(),
+            username=str(message.author),
+            channel_id=str(message.channel.id),
+        ):
+            await handle_mention(message)
 
-        username = str(message.author)
-
-        # --- Handle empty prompts after cleaning ---
-        if not prompt:
-            await message.reply("What the fuck do you want idiot?")
-            return
-
-        # --- Handle !context command ---
-        if prompt == "!context":
-            log.info(f"User '{username}' requested their context.")
-            async with message.channel.typing():
-                try:
-                    # URL-encode the username to handle special characters like '#'
-                    encoded_username = quote(username)
-                    async with aiohttp.ClientSession() as session:
-                        async with session.get(
-                            f"{API_CONTEXT_URL}/{encoded_username}"
-                        ) as response:
-                            if response.status == 200:
-                                data = await response.json()
-                                context = data.get(
-                                    "context", "Context data is missing."
-                                )
-                                reply_message = (
-                                    f"Here is your saved context:\n```\n{context}\n```"
-                                )
-                                await message.reply(reply_message)
-                            elif response.status == 404:
-                                await message.reply(
-                                    "I don't have any context saved for you yet."
-                                )
-                            else:
-                                response.raise_for_status()
-                except Exception as e:
-                    log.error(f"Error fetching context for '{username}': {e}")
-                    await message.reply(
-                        "Sorry, I couldn't retrieve your context due to an error."
-                    )
-            return
 
-        # --- Identify if another single user was mentioned ---
-        target_user_name = None
-        other_mentions = [m for m in message.mentions if m.id != bot.user.id]
-        if len(other_mentions) == 1:
-            target_user_name = str(other_mentions[0])
+async def handle_mention(message: discord.Message):
+    """Answers a message that mentions the bot."""
+    # --- Clean the prompt by removing the bot's mention ---
+    mention_standard = f"<@{bot.user.id}>"
+    mention_nickname = f"<@!{bot.user.id}>"
+    prompt = (
+        message.content.replace(mention_standard, "")
+        .replace(mention_nickname, "")
+        .strip()
+    )
+
+    username = str(message.author)
 
-        # --- Resolve all remaining mentions to display names for the API ---
-        if message.mentions:
-            for member in message.mentions:
-                if member.id != bot.user.id:
-                    prompt = prompt.replace(member.mention, member.display_name)
+    # --- Handle empty prompts after cleaning ---
+    if not prompt:
+        await message.reply("What the fuck do you want idiot?")
+        return
 
+    # --- Handle !context command ---
+    if prompt == "!context":
+        log.info(f"User '{username}' requested their context.")
         async with message.channel.typing():
             try:
-                payload = {"prompt": prompt, "username": username}
-                if target_user_name:
-                    payload["target_user"] = target_user_name
-
                 async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        API_WRAPPER_URL, json=payload, timeout=70
-                    ) as response:
-                        response.raise_for_status()
-                        api_data = await response.json()
-                        model_response = api_data.get(
-                            "response", "Sorry, I received an empty response."
-                        )
-
-                # Split and send the response if it exceeds Discord's character limit
-                if len(model_response) > 2000:
-                    logging.warning("Response > 2000 chars, splitting.")
-                    for i in range(0, len(model_response), 1990):
-                        chunk = model_response[i : i + 1990]
-                        if i == 0:
-                            await message.reply(chunk)
-                        else:
-                            await message.channel.send(chunk)
+                    with tracing.span("bot.context"):
+                        context = await fetch_context(session, username)
+                if context is None:
+                    await message.reply("I don't have any context saved for you yet.")
                 else:
-                    await message.reply(model_response)
-
-            except aiohttp.ClientResponseError as http_err:
-                error_detail = "An unknown error occurred."
-                try:
-                    error_json = await http_err.json()
-                    error_detail = error_json.get("detail", error_detail)
-                except Exception:
-                    pass
-                await message.reply(f"An error occurred with the API: {error_detail}")
-                logging.error(f"HTTPError: {error_detail} (Status: {http_err.status})")
-            except asyncio.TimeoutError:
-                await message.reply(
-                    "My brain took too long to respond (timeout). Please try again."
-                )
-                logging.error("API Connection Error: Timeout")
-            except aiohttp.ClientConnectorError as e:
-                await message.reply(
-                    "I couldn't connect to my brain (the API wrapper). Please check if it's running."
-                )
-                logging.error(f"API Connection Error: {e}")
+                    await message.reply(
+                        f"Here is your saved context:\n```\n{context}\n```"
+                    )
             except Exception as e:
+                log.error(f"Error fetching context for '{username}': {e}")
                 await message.reply(
-                    "An unexpected error occurred. Please check the logs."
+                    "Sorry, I couldn't retrieve your context due to an error."
                 )
-                logging.error(f"Unexpected error in on_message: {e}", exc_info=True)
+        return
+
+    # --- Throttle floods before they reach the API ---
+    retry_after = await check_rate_limit(message)
+    if retry_after is not None:
+        log.info(f"Rate limited '{username}' for {retry_after:.1f}s.")
+        if should_warn(message.author.id, retry_after):
+            await message.reply(
+                f"Slow down. Try again in {math.ceil(retry_after)} seconds."
+            )
+        return
+
+    # --- Identify if another single user was mentioned ---
+    target_user_name = None
+    other_mentions = [m for m in message.mentions if m.id != bot.user.id]
+    if len(other_mentions) == 1:
+        target_user_name = str(other_mentions[0])
+
+    # --- Resolve all remaining mentions to display names for the API ---
+    if message.mentions:
+        for member in message.mentions:
+            if member.id != bot.user.id:
+                prompt = prompt.replace(member.mention, member.display_name)
+
+    async with message.channel.typing():
+        try:
+            payload = {
+                "prompt": prompt,
+                "username": username,
+                "channel_id": str(message.channel.id),
+            }
+            if target_user_name:
+                payload["target_user"] = target_user_name
+
+            headers = {
+                "X-Request-Timeout": str(API_TIMEOUT - API_DEADLINE_MARGIN),
+                **tracing.headers(),
+            }
+            async with aiohttp.ClientSession() as session:
+                async with session.post(
+                    API_WRAPPER_URL,
+                    json=payload,
+                    headers=headers,
+                    timeout=API_TIMEOUT,
+                ) as response:
+                    if response.status == 503:
+                        # Overloaded or Ollama is down: it could not answer anyway.
+                        retry_after = response.headers.get("Retry-After", "60")
+                        log.warning(f"API unavailable, retry in {retry_after}s.")
+                        await message.reply(
+                            await unavailable_reply(response, retry_after)
+                        )
+                        return
+                    response.raise_for_status()
+                    api_data = await response.json()
+                    model_response = api_data.get(
+                        "response", "Sorry, I received an empty response."
+                    )
+
+            # Split and send the response if it exceeds Discord's character limit
+            if len(model_response) > 2000:
+                logging.warning("Response > 2000 chars, splitting.")
+                for i in range(0, len(model_response), 1990):
+                    chunk = model_response[i : i + 1990]
+                    if i == 0:
+                        await message.reply(chunk)
+                    else:
+                        await message.channel.send(chunk)
+            else:
+                await message.reply(model_response)
+
+        except aiohttp.ClientResponseError as http_err:
+            error_detail = "An unknown error occurred."
+            try:
+                error_json = await http_err.json()
+                error_detail = error_json.get("detail", error_detail)
+            except Exception:
+                pass
+            await message.reply(f"An error occurred with the API: {error_detail}")
+            logging.error(f"HTTPError: {error_detail} (Status: {http_err.status})")
+        except asyncio.TimeoutError:
+            await message.reply(
+                "My brain took too long to respond (timeout). Please try again."
+            )
+            logging.error("API Connection Error: Timeout")
+        except aiohttp.ClientConnectorError as e:
+            await message.reply(
+                "I couldn't connect to my brain (the API wrapper). Please check if it's running."
+            )
+            logging.error(f"API Connection Error: {e}")
+        except Exception as e:
+            await message.reply("An unexpected error occurred. Please check the logs.")
+            logging.error(f"Unexpected error in on_message: {e}", exc_info=True)
 
 
-bot.run(TOKEN)
+if __name__ == "__main__":
+    bot.run(TOKEN)
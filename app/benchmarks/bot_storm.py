@@ -0,0 +1,240 @@
+"""
+Message-storm load simulator for the Discord bot layer.
+
+Feeds synthetic message objects straight into `on_message` from
+`base/bot.py` without connecting to Discord, while a stub API wrapper
+answers the bot's HTTP calls. Reports event-loop lag, per-message handling
+latency, reply throughput and memory growth as JSON.
+
+Run from the `app` directory:
+
+    python -m benchmarks.bot_storm --rate 50 --duration 30
+"""
+
+import argparse
+import asyncio
+import importlib
+import json
+import os
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+# --- Path Setup ---
+app_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, app_root)
+
+from benchmarks.stubs import StubApiHandler, StubConfig, start_stub_server
+from tools import metrics
+
+
+# --- Fake Discord Objects ---
+class FakeUser:
+    """Just enough of `discord.Member` for `on_message`."""
+
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.name = name
+        self.display_name = name.capitalize()
+        self.mention = f"<@{user_id}>"
+
+    def __eq__(self, other):
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+    def __str__(self):
+        return self.name
+
+
+class _Typing:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeChannel:
+    def __init__(self, stats: dict):
+        self.id = 1000
+        self.stats = stats
+
+    def typing(self):
+        return _Typing()
+
+    async def send(self, content: str):
+        self.stats["sent"] += 1
+        self.stats["chars"] += len(content)
+
+
+class FakeMessage:
+    def __init__(self, content, author, mentions, channel, stats):
+        self.content = content
+        self.author = author
+        self.mentions = mentions
+        self.mention_everyone = False
+        self.channel = channel
+        self.guild = None
+        self.stats = stats
+
+    async def reply(self, content: str):
+        self.stats["replies"] += 1
+        self.stats["chars"] += len(content)
+
+
+def make_message(kind: str, bot_user, users, channel, stats) -> FakeMessage:
+    """Builds one synthetic message of the requested kind."""
+    author = random.choice(users)
+    prefix = f"{bot_user.mention} "
+    if kind == "context":
+        return FakeMessage(prefix + "!context", author, [bot_user], channel, stats)
+    if kind == "target":
+        target = random.choice([u for u in users if u != author])
+        content = f"{prefix}what do you think of {target.mention}?"
+        return FakeMessage(content, author, [bot_user, target], channel, stats)
+    if kind == "long":
+        content = prefix + "[long] explain the history of the roman empire"
+        return FakeMessage(content, author, [bot_user], channel, stats)
+    content = prefix + "hello how are you?"
+    return FakeMessage(content, author, [bot_user], channel, stats)
+
+
+# --- Measurement ---
+async def monitor_loop_lag(interval: float, stop: asyncio.Event):
+    """Records how late the event loop wakes up compared to the requested sleep."""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(interval)
+        metrics.observe("bot.loop_lag", max(0.0, loop.time() - start - interval))
+
+
+async def run_storm(on_message, bot_user, args) -> dict:
+    stats = {"replies": 0, "sent": 0, "chars": 0}
+    channel = FakeChannel(stats)
+    users = [FakeUser(1000 + i, f"user{i}") for i in range(args.users)]
+    kinds = ["plain", "context", "target", "long"]
+    weights = [
+        args.plain_weight,
+        args.context_weight,
+        args.target_weight,
+        args.long_weight,
+    ]
+
+    async def handle(message):
+        start = time.perf_counter()
+        try:
+            await on_message(message)
+        except Exception:
+            metrics.increment("bot.handler_errors")
+        metrics.observe("bot.handle", time.perf_counter() - start)
+
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_loop_lag(args.lag_interval, stop))
+    tasks = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < args.duration:
+        kind = random.choices(kinds, weights)[0]
+        message = make_message(kind, bot_user, users, channel, stats)
+        tasks.append(asyncio.create_task(handle(message)))
+        await asyncio.sleep(random.expovariate(args.rate))
+    dispatched = time.perf_counter() - start
+
+    await asyncio.gather(*tasks)
+    wall = time.perf_counter() - start
+    stop.set()
+    await lag_task
+    return {
+        "messages": len(tasks),
+        "dispatch_seconds": dispatched,
+        "wall_seconds": wall,
+        "replies": stats["replies"],
+        "channel_sends": stats["sent"],
+        "reply_throughput": (stats["replies"] + stats["sent"]) / wall,
+        "reply_chars": stats["chars"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rate", type=float, default=20.0, help="Messages per second.")
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--plain-weight", type=float, default=6)
+    parser.add_argument("--context-weight", type=float, default=1)
+    parser.add_argument("--target-weight", type=float, default=2)
+    parser.add_argument("--long-weight", type=float, default=1)
+    parser.add_argument("--api-latency", default="lognormal:0.5,0.5")
+    parser.add_argument("--lag-interval", type=float, default=0.05)
+    parser.add_argument(
+        "--rate-limits",
+        action="store_true",
+        help="Keep the RATE_LIMIT_* limits instead of disabling them.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bot_storm_results.json")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    config = StubConfig(api_latency=args.api_latency)
+    _, api_url = start_stub_server(StubApiHandler, config)
+    os.environ["API_BASE_URL"] = api_url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    if not args.rate_limits:
+        for scope in ("USER", "CHANNEL", "GUILD"):
+            os.environ[f"RATE_LIMIT_{scope}"] = "off"
+
+    # Importing the bot module builds the client but does not connect it.
+    bot_module = importlib.import_module("base.bot")
+    bot_user = FakeUser(1, "oswald")
+    bot_module.bot = SimpleNamespace(user=bot_user)
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    metrics.reset()
+    run = asyncio.run(run_storm(bot_module.on_message, bot_user, args))
+
+    memory_after, memory_peak = tracemalloc.get_traced_memory()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    snapshot = metrics.snapshot()
+    results = {
+        "config": vars(args),
+        **run,
+        "handler_errors": snapshot["counters"].get("bot.handler_errors", 0),
+        "throttled": snapshot["counters"].get("rate_limit.bot.throttled", 0),
+        "handle_latency": snapshot["timings"].get("bot.handle"),
+        "loop_lag": snapshot["timings"].get("bot.loop_lag"),
+        "memory": {
+            "traced_growth_bytes": memory_after - memory_before,
+            "traced_peak_bytes": memory_peak,
+            "max_rss_growth_kb": rss_after - rss_before,
+        },
+        "api_requests": dict(config.requests_seen),
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    handle, lag = results["handle_latency"], results["loop_lag"]
+    print(
+        f"{run['messages']} messages in {run['wall_seconds']:.1f}s, "
+        f"{run['reply_throughput']:.1f} replies/s"
+    )
+    print(
+        f"handling p50={handle['p50']:.3f}s p95={handle['p95']:.3f}s "
+        f"p99={handle['p99']:.3f}s"
+    )
+    print(f"loop lag p99={lag['p99'] * 1000:.1f}ms max={lag['max'] * 1000:.1f}ms")
+    growth_kib = results["memory"]["traced_growth_bytes"] / 1024
+    print(f"traced memory growth {growth_kib:.0f} KiB")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
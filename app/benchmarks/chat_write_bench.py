@@ -0,0 +1,152 @@
+"""
+Rows/sec of the per-row save_chat path vs. the write-behind batch writer.
+
+Both paths write the same synthetic chats (with 768-dimension embeddings)
+from several threads, like concurrent background tasks do, into a scratch
+schema that is dropped afterwards.
+
+Needs the PostgreSQL server configured by the DB_* variables. Run from the
+`app` directory:
+
+    python -m benchmarks.chat_write_bench --rows 2000 --threads 8
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# --- Path Setup ---
+app_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, app_root)
+
+# Settings are read once, so the benchmark's own schema is set before that.
+BENCH_SCHEMA = "chat_write_bench"
+os.environ["DB_SCHEMA"] = BENCH_SCHEMA
+
+from tools.logging_config import setup_logging
+
+setup_logging()
+
+from tools import chat_writer, vector_db
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+
+def make_chats(rows: int, seed: int) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(rows * 2, 768)).astype(np.float32)
+    return [
+        {
+            "username": f"bench{i % 50}",
+            "prompt": f"benchmark prompt number {i}",
+            "response": f"benchmark response number {i}",
+            "prompt_embedding": vectors[2 * i],
+            "response_embedding": vectors[2 * i + 1],
+            "search_queries": None,
+        }
+        for i in range(rows)
+    ]
+
+
+def run_per_row(chats: list[dict], threads: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(lambda chat: vector_db.save_chat(**chat), chats))
+    return time.perf_counter() - start
+
+
+def run_batched(chats, threads, batch_size, flush_interval) -> float:
+    writer = chat_writer.ChatWriteBuffer(
+        batch_size=batch_size,
+        flush_interval=flush_interval,
+        max_buffered=len(chats) + 1,
+    )
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(writer.submit, chats))
+    writer.flush(timeout=600)
+    elapsed = time.perf_counter() - start
+    writer.close()
+    return elapsed
+
+
+def count_rows() -> int:
+    conn = vector_db.get_db_connection()
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT COUNT(*) FROM {BENCH_SCHEMA}.chat_logs;")
+        count = cur.fetchone()[0]
+        cur.execute(f"TRUNCATE {BENCH_SCHEMA}.chat_logs;")
+    conn.commit()
+    conn.close()
+    return count
+
+
+def drop_schema():
+    conn = vector_db.get_db_connection()
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE;")
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--flush-interval", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="chat_write_results.json")
+    args = parser.parse_args()
+
+    conn = vector_db.get_db_connection()
+    if conn is None:
+        sys.exit(1)
+    conn.close()
+    drop_schema()
+    vector_db.setup_database()
+    chats = make_chats(args.rows, args.seed)
+
+    # The per-row path logs every insert at INFO; keep the output readable.
+    logging.getLogger("tools.vector_db").setLevel(logging.WARNING)
+    results = {"config": vars(args)}
+    try:
+        per_row = run_per_row(chats, args.threads)
+        results["per_row"] = {
+            "seconds": per_row,
+            "rows_per_sec": args.rows / per_row,
+            "rows_written": count_rows(),
+        }
+        batched = run_batched(chats, args.threads, args.batch_size, args.flush_interval)
+        results["batched"] = {
+            "seconds": batched,
+            "rows_per_sec": args.rows / batched,
+            "rows_written": count_rows(),
+        }
+    finally:
+        drop_schema()
+
+    results["speedup"] = (
+        results["batched"]["rows_per_sec"] / results["per_row"]["rows_per_sec"]
+    )
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for name in ("per_row", "batched"):
+        stats = results[name]
+        print(
+            f"{name:<8} {stats['rows_per_sec']:8.0f} rows/s "
+            f"({stats['rows_written']} rows in {stats['seconds']:.1f}s)"
+        )
+    print(f"speedup {results['speedup']:.1f}x, results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
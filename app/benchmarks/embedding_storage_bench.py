@@ -0,0 +1,248 @@
+"""
+Compares full-precision, halfvec and int8 embedding storage.
+
+Loads the same synthetic chat embeddings into a scratch schema three ways
+and reports on-disk size, insert throughput and nearest-neighbour recall
+against exact float32 search. The baseline stores one inline VECTOR per
+chat row like chat_logs does today; the compact layouts store each distinct
+text once and reference it by hash.
+
+Needs a PostgreSQL server with pgvector >= 0.7 (for halfvec), configured
+through the usual DB_* variables. Run from the `app` directory:
+
+    python -m benchmarks.embedding_storage_bench --rows 20000
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+# --- Path Setup ---
+app_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, app_root)
+
+from tools.logging_config import setup_logging
+
+setup_logging()
+
+from psycopg2.extras import execute_values
+from tools import metrics, vector_db
+from tools.embeddings import dequantize_int8, quantize_int8
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+BENCH_SCHEMA = "embedding_storage_bench"
+DIMENSIONS = 768
+
+
+def make_dataset(rows: int, duplicate_ratio: float, seed: int):
+    """
+    Clustered unit vectors, with a share of rows repeating an earlier text
+    the way stock replies do. Returns (unique vectors, row -> unique index).
+    """
+    rng = np.random.default_rng(seed)
+    unique_count = max(1, int(rows * (1 - duplicate_ratio)))
+    centers = rng.normal(size=(64, DIMENSIONS))
+    vectors = centers[rng.integers(0, 64, unique_count)] + rng.normal(
+        scale=0.6, size=(unique_count, DIMENSIONS)
+    )
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    assignments = np.concatenate(
+        [np.arange(unique_count), rng.integers(0, unique_count, rows - unique_count)]
+    )
+    rng.shuffle(assignments)
+    return vectors.astype(np.float32), assignments
+
+
+def table_size(cur, *tables: str) -> int:
+    total = 0
+    for table in tables:
+        cur.execute("SELECT pg_total_relation_size(%s);", (f"{BENCH_SCHEMA}.{table}",))
+        total += cur.fetchone()[0]
+    return total
+
+
+def load_inline(conn, vectors, assignments, batch_size) -> dict:
+    """Baseline: one full-precision VECTOR per chat row."""
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            CREATE TABLE {BENCH_SCHEMA}.chats_vector (
+                id SERIAL PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                embedding VECTOR({DIMENSIONS})
+            );
+            """
+        )
+        start = time.perf_counter()
+        for offset in range(0, len(assignments), batch_size):
+            rows = [
+                (str(i), vectors[i]) for i in assignments[offset : offset + batch_size]
+            ]
+            execute_values(
+                cur,
+                f"INSERT INTO {BENCH_SCHEMA}.chats_vector "
+                "(content_hash, embedding) VALUES %s",
+                rows,
+            )
+            conn.commit()
+        elapsed = time.perf_counter() - start
+        return {
+            "insert_rows_per_sec": len(assignments) / elapsed,
+            "size_bytes": table_size(cur, "chats_vector"),
+        }
+
+
+def load_compact(conn, mode, vectors, assignments, batch_size) -> dict:
+    """Compact: chat rows hold a hash; each distinct vector is stored once."""
+    column_type = f"HALFVEC({DIMENSIONS})" if mode == "halfvec" else "BYTEA"
+    template = "(%s, %s::halfvec, NULL)" if mode == "halfvec" else "(%s, %s, %s)"
+    with conn.cursor() as cur:
+        cur.execute(
+            f"""
+            CREATE TABLE {BENCH_SCHEMA}.store_{mode} (
+                content_hash TEXT PRIMARY KEY,
+                embedding {column_type} NOT NULL,
+                embedding_scale REAL
+            );
+            CREATE TABLE {BENCH_SCHEMA}.chats_{mode} (
+                id SERIAL PRIMARY KEY,
+                content_hash TEXT NOT NULL
+            );
+            """
+        )
+        start = time.perf_counter()
+        for offset in range(0, len(assignments), batch_size):
+            batch = assignments[offset : offset + batch_size]
+            store_rows = []
+            for i in dict.fromkeys(batch):
+                if mode == "halfvec":
+                    store_rows.append((str(i), vectors[i]))
+                else:
+                    store_rows.append((str(i), *quantize_int8(vectors[i])))
+            execute_values(
+                cur,
+                f"INSERT INTO {BENCH_SCHEMA}.store_{mode} VALUES %s "
+                "ON CONFLICT (content_hash) DO NOTHING",
+                store_rows,
+                template=template,
+            )
+            execute_values(
+                cur,
+                f"INSERT INTO {BENCH_SCHEMA}.chats_{mode} (content_hash) VALUES %s",
+                [(str(i),) for i in batch],
+            )
+            conn.commit()
+        elapsed = time.perf_counter() - start
+        return {
+            "insert_rows_per_sec": len(assignments) / elapsed,
+            "size_bytes": table_size(cur, f"store_{mode}", f"chats_{mode}"),
+        }
+
+
+def measure_recall(conn, mode, vectors, queries, k) -> dict:
+    """Recall@k of each layout against exact float32 cosine search."""
+    truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :k]
+    recalls = []
+    int8_matrix = None
+    if mode == "int8":
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT content_hash, embedding, embedding_scale "
+                f"FROM {BENCH_SCHEMA}.store_int8;"
+            )
+            rows = cur.fetchall()
+        ids = np.array([int(r[0]) for r in rows])
+        int8_matrix = np.stack([dequantize_int8(bytes(r[1]), r[2]) for r in rows])
+        int8_matrix /= np.linalg.norm(int8_matrix, axis=1, keepdims=True)
+
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        if mode == "int8":
+            found = ids[np.argsort(-(int8_matrix @ query))[:k]]
+        else:
+            table = "chats_vector" if mode == "vector" else "store_halfvec"
+            cast = "vector" if mode == "vector" else "halfvec"
+            with conn.cursor() as cur:
+                # Over-fetch so duplicate rows in the inline table still yield k ids.
+                cur.execute(
+                    f"SELECT content_hash FROM {BENCH_SCHEMA}.{table} "
+                    f"ORDER BY embedding <=> %s::{cast} LIMIT %s;",
+                    (query, k * 4),
+                )
+                found = list(dict.fromkeys(int(r[0]) for r in cur.fetchall()))[:k]
+        metrics.observe(f"embedding_bench.query.{mode}", time.perf_counter() - start)
+        recalls.append(len(set(found) & set(expected.tolist())) / k)
+    return {
+        "recall_at_k": float(np.mean(recalls)),
+        "query_latency": metrics.snapshot()["timings"][f"embedding_bench.query.{mode}"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch schema.")
+    parser.add_argument("--output", default="embedding_storage_results.json")
+    args = parser.parse_args()
+
+    conn = vector_db.get_db_connection()
+    if conn is None:
+        sys.exit(1)
+
+    vectors, assignments = make_dataset(args.rows, args.duplicate_ratio, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    queries = vectors[rng.integers(0, len(vectors), args.queries)] + rng.normal(
+        scale=0.05, size=(args.queries, DIMENSIONS)
+    ).astype(np.float32)
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True)
+
+    results = {"config": vars(args), "unique_vectors": len(vectors), "modes": {}}
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE;")
+            cur.execute(f"CREATE SCHEMA {BENCH_SCHEMA};")
+        conn.commit()
+
+        for mode in ("vector", "halfvec", "int8"):
+            log.info(f"Benchmarking '{mode}' storage.")
+            if mode == "vector":
+                stats = load_inline(conn, vectors, assignments, args.batch_size)
+            else:
+                stats = load_compact(conn, mode, vectors, assignments, args.batch_size)
+            stats.update(measure_recall(conn, mode, vectors, queries, args.k))
+            results["modes"][mode] = stats
+    finally:
+        if not args.keep:
+            with conn.cursor() as cur:
+                cur.execute(f"DROP SCHEMA IF EXISTS {BENCH_SCHEMA} CASCADE;")
+            conn.commit()
+        conn.close()
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = results["modes"]["vector"]["size_bytes"]
+    for mode, stats in results["modes"].items():
+        print(
+            f"{mode:<8} size={stats['size_bytes'] / 1e6:8.1f} MB "
+            f"({stats['size_bytes'] / baseline:5.2f}x) "
+            f"insert={stats['insert_rows_per_sec']:8.0f} rows/s "
+            f"recall@{args.k}={stats['recall_at_k']:.3f}"
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
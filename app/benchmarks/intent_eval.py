@@ -0,0 +1,172 @@
+"""
+Accuracy and latency evaluation of the intent classifier.
+
+Runs every labelled example in models/intent_analysis/data.json through
+`decide_if_search_is_needed` and reports accuracy, precision and recall
+(with "search needed" as the positive class), the confusion matrix,
+latency percentiles and how often each fallback answered instead of the
+model. Compare models by running it once per model.
+
+Run from the `app` directory, against the configured Ollama:
+
+    python -m benchmarks.intent_eval --model intent_analysis:latest
+
+or against a local stub that answers correctly 90% of the time, to check
+the harness itself:
+
+    python -m benchmarks.intent_eval --stub --stub-accuracy 0.9
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Path Setup ---
+app_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, app_root)
+
+from benchmarks.stubs import StubConfig, StubOllamaHandler, start_stub_server
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+DATA_PATH = os.path.join(
+    os.path.dirname(app_root), "models", "intent_analysis", "data.json"
+)
+
+
+def load_examples(limit: int | None) -> list[tuple[str, bool]]:
+    with open(DATA_PATH) as f:
+        examples = [
+            (example["text"], example["label"]["search_needed"])
+            for example in json.load(f)
+        ]
+    return examples[:limit] if limit else examples
+
+
+def score(outcomes: list[tuple[bool, bool]]) -> dict:
+    """Accuracy, precision, recall and F1 for (expected, predicted) pairs."""
+    tp = sum(1 for expected, predicted in outcomes if expected and predicted)
+    fp = sum(1 for expected, predicted in outcomes if not expected and predicted)
+    fn = sum(1 for expected, predicted in outcomes if expected and not predicted)
+    tn = sum(1 for expected, predicted in outcomes if not expected and not predicted)
+    precision = tp / (tp + fp) if tp + fp else 0.0
+    recall = tp / (tp + fn) if tp + fn else 0.0
+    return {
+        "accuracy": (tp + tn) / len(outcomes) if outcomes else 0.0,
+        "precision": precision,
+        "recall": recall,
+        "f1": (
+            2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        ),
+        "confusion_matrix": {
+            "search_predicted_search": tp,
+            "chat_predicted_search": fp,
+            "search_predicted_chat": fn,
+            "chat_predicted_chat": tn,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", help="Intent model (default OLLAMA_INTENT_MODEL).")
+    parser.add_argument("--limit", type=int, help="Only use the first N examples.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Parallel requests; keep at 1 for undisturbed latency numbers.",
+    )
+    parser.add_argument("--stub", action="store_true", help="Use a local stub model.")
+    parser.add_argument("--stub-accuracy", type=float, default=0.9)
+    parser.add_argument("--stub-malformed", type=float, default=0.02)
+    parser.add_argument("--stub-latency", default="lognormal:0.08,0.3")
+    parser.add_argument("--output", default="intent_eval_results.json")
+    args = parser.parse_args()
+
+    examples = load_examples(args.limit)
+    if args.stub:
+        config = StubConfig(
+            generate_latency=args.stub_latency,
+            intent_labels=dict(examples),
+            intent_accuracy=args.stub_accuracy,
+            malformed_probability=args.stub_malformed,
+        )
+        _, ollama_url = start_stub_server(StubOllamaHandler, config)
+        os.environ["OLLAMA_HOST_URL"] = ollama_url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    # Configuration is read at import time, so import after the environment is set.
+    from tools import intent_analysis, metrics
+    from tools.logging_config import setup_logging
+
+    setup_logging()
+
+    if args.model:
+        intent_analysis.OLLAMA_INTENT_MODEL = args.model
+    model = intent_analysis.OLLAMA_INTENT_MODEL
+
+    def classify(example: tuple[str, bool]) -> tuple[bool, bool, float]:
+        text, expected = example
+        start = time.perf_counter()
+        predicted = intent_analysis.decide_if_search_is_needed(text, model)
+        return expected, predicted, time.perf_counter() - start
+
+    metrics.reset()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        runs = list(pool.map(classify, examples))
+    wall = time.perf_counter() - started
+
+    counters = metrics.snapshot()["counters"]
+    fallbacks = {
+        name.removeprefix("intent.fallback."): count
+        for name, count in counters.items()
+        if name.startswith("intent.fallback.")
+    }
+    results = {
+        "model": model,
+        "stub": args.stub,
+        "examples": len(examples),
+        **score([(expected, predicted) for expected, predicted, _ in runs]),
+        "latency": metrics.summarize([seconds for _, _, seconds in runs]),
+        "throughput": len(runs) / wall,
+        "fallbacks": fallbacks,
+        "fallback_rate": sum(fallbacks.values()) / len(runs) if runs else 0.0,
+        "errors": [
+            {"text": text, "expected": expected, "predicted": predicted}
+            for (text, _), (expected, predicted, _) in zip(examples, runs)
+            if expected != predicted
+        ],
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    latency, matrix = results["latency"], results["confusion_matrix"]
+    print(f"{model}: {len(runs)} examples")
+    print(
+        f"accuracy={results['accuracy']:.3f} precision={results['precision']:.3f} "
+        f"recall={results['recall']:.3f} f1={results['f1']:.3f}"
+    )
+    print(
+        "confusion (expected/predicted): "
+        f"search/search={matrix['search_predicted_search']} "
+        f"chat/search={matrix['chat_predicted_search']} "
+        f"search/chat={matrix['search_predicted_chat']} "
+        f"chat/chat={matrix['chat_predicted_chat']}"
+    )
+    print(
+        f"latency p50={latency['p50'] * 1000:.0f}ms p95={latency['p95'] * 1000:.0f}ms "
+        f"p99={latency['p99'] * 1000:.0f}ms"
+    )
+    print(f"fallbacks {fallbacks or 'none'} ({results['fallback_rate']:.1%})")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Offline end-to-end benchmark for the /generate pipeline.
+
+Starts stub Ollama and SearXNG servers, runs the API wrapper in-process
+against them (with an in-memory database unless --db postgres is given),
+fires prompts at /generate with a fixed concurrency and writes latency
+percentiles, per-stage timings and throughput to a JSON file.
+
+Run from the `app` directory:
+
+    python -m benchmarks.pipeline_bench --requests 200 --concurrency 8
+"""
+
+import argparse
+import importlib
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Path Setup ---
+app_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, app_root)
+
+from benchmarks.stubs import (
+    InMemoryVectorDB,
+    StubConfig,
+    StubOllamaHandler,
+    StubSearxngHandler,
+    start_stub_server,
+)
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+DATA_PATH = os.path.join(
+    os.path.dirname(app_root), "models", "intent_analysis", "data.json"
+)
+
+
+def load_prompts() -> list[str]:
+    """Uses the intent training set as a realistic mix of chat and search prompts."""
+    with open(DATA_PATH) as f:
+        return [example["text"] for example in json.load(f)]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_services(config: StubConfig, use_memory_db: bool):
+    """
+    Starts the stubs, points the environment at them and imports the API.
+
+    Configuration is read at import time, so the environment must be set
+    before any of the application modules are imported.
+    """
+    _, ollama_url = start_stub_server(StubOllamaHandler, config)
+    _, searxng_url = start_stub_server(StubSearxngHandler, config)
+    os.environ["OLLAMA_HOST_URL"] = ollama_url
+    os.environ["SEARXNG_URL"] = searxng_url
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    # A handful of bench users would otherwise be throttled within seconds.
+    for scope in ("USER", "CHANNEL", "GUILD"):
+        os.environ.setdefault(f"RATE_LIMIT_{scope}", "off")
+    # Measure the whole offered load rather than what survives load shedding.
+    os.environ.setdefault("ADMISSION_CONTROL", "false")
+
+    api = importlib.import_module("base.api-wrapper")
+    from tools import metrics, vector_db
+
+    if use_memory_db:
+        InMemoryVectorDB().install(vector_db)
+    return api, metrics
+
+
+def start_api(app) -> tuple[object, str]:
+    """Runs the FastAPI app under uvicorn in a background thread."""
+    import uvicorn
+
+    port = _free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning")
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, f"http://127.0.0.1:{port}"
+
+
+def drive(base_url: str, prompts: list[str], total: int, concurrency: int) -> dict:
+    """Sends `total` requests with `concurrency` in flight and times each one."""
+    import requests
+
+    latencies, failures = [], 0
+    lock = threading.Lock()
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    session.mount("http://", adapter)
+
+    def one(i: int):
+        nonlocal failures
+        payload = {"prompt": random.choice(prompts), "username": f"bench{i % 20}"}
+        start = time.perf_counter()
+        try:
+            response = session.post(f"{base_url}/generate", json=payload, timeout=300)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                failures += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - start
+    return {"latencies": latencies, "failures": failures, "wall_seconds": wall}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--generate-latency", default="lognormal:0.15,0.4")
+    parser.add_argument("--embed-latency", default="fixed:0.01")
+    parser.add_argument("--search-latency", default="lognormal:0.3,0.6")
+    parser.add_argument("--token-rate", type=float, default=60.0)
+    parser.add_argument("--response-tokens", type=int, default=120)
+    parser.add_argument("--search-probability", type=float, default=0.5)
+    parser.add_argument(
+        "--db",
+        choices=["memory", "postgres"],
+        default="memory",
+        help="'postgres' uses the DB_* environment variables.",
+    )
+    parser.add_argument(
+        "--drain",
+        type=float,
+        default=2.0,
+        help="Seconds to wait for background tasks before reading metrics.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    config = StubConfig(
+        generate_latency=args.generate_latency,
+        embed_latency=args.embed_latency,
+        search_latency=args.search_latency,
+        token_rate=args.token_rate,
+        response_tokens=args.response_tokens,
+        search_probability=args.search_probability,
+    )
+    api, metrics = start_services(config, use_memory_db=args.db == "memory")
+    if args.db == "postgres":
+        api.vector_db.setup_database()
+    server, base_url = start_api(api.app)
+
+    prompts = load_prompts()
+    metrics.reset()
+    run = drive(base_url, prompts, args.requests, args.concurrency)
+    time.sleep(args.drain)
+    server.should_exit = True
+
+    completed = len(run["latencies"])
+    wall = run["wall_seconds"]
+    results = {
+        "config": vars(args),
+        "completed": completed,
+        "failures": run["failures"],
+        "wall_seconds": run["wall_seconds"],
+        "throughput_rps": completed / wall if wall else 0,
+        "end_to_end": metrics.summarize(run["latencies"]),
+        "stages": metrics.snapshot(),
+        "upstream_requests": dict(config.requests_seen),
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    e2e = results["end_to_end"]
+    print(
+        f"{completed} ok / {run['failures']} failed in {run['wall_seconds']:.1f}s "
+        f"({results['throughput_rps']:.2f} req/s)"
+    )
+    print(
+        f"end-to-end p50={e2e['p50']:.3f}s p95={e2e['p95']:.3f}s "
+        f"p99={e2e['p99']:.3f}s"
+    )
+    for name, stats in sorted(results["stages"]["timings"].items()):
+        print(
+            f"  {name:<32} n={stats['count']:<5} p50={stats['p50']:.3f}s "
+            f"p95={stats['p95']:.3f}s p99={stats['p99']:.3f}s"
+        )
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""
+Replays real chat history through the /generate pipeline.
+
+Reads prompts from `chat_logs` (--source db, filtered by --since, --until,
+--username and --limit) or from an NDJSON file exported with `GET /history`
+(--source FILE, needs HISTORY_EXPORT_ENABLED on the API). It then sends them, with their original usernames and
+channels, to the API wrapper running in-process against the stubs and an
+in-memory database, so nothing is written back to the real one.
+
+Requests keep the gaps between the original chats, divided by --speed
+(1 = real time, 60 = an hour per minute, 0 = back to back). Gaps longer
+than --max-gap seconds, such as overnight silences, are shortened to it.
+Reports per-stage latency, the prompt sizes sent to Ollama and the cache
+hit rates. Run from the `app` directory:
+
+    python -m benchmarks.replay --source history.ndjson --speed 60
+    python -m benchmarks.replay --source db --since 2025-06-01 --limit 2000
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+# --- Path Setup ---
+app_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, app_root)
+
+from benchmarks.pipeline_bench import start_api, start_services
+from benchmarks.stubs import InMemoryVectorDB, StubConfig
+
+# Hit and miss counters of each cache, summed into one hit rate per cache.
+CACHES = {
+    "embedding_cache": (
+        ["embedding_cache.hits.memory", "embedding_cache.hits.table"],
+        ["embedding_cache.misses"],
+    ),
+    "search_cache": (["search.cache.hits"], ["search.cache.misses"]),
+    "conversation": (["conversation.hits"], ["conversation.misses"]),
+}
+
+
+def load_chats(args, vector_db) -> list[dict]:
+    """Returns the chats to replay, oldest first, from the database or a file."""
+    if args.source == "db":
+        rows = vector_db.iter_chat_history(
+            username=args.username,
+            since=datetime.fromisoformat(args.since) if args.since else None,
+            until=datetime.fromisoformat(args.until) if args.until else None,
+            limit=args.limit,
+        )
+    else:
+        with open(args.source) as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        if rows and "error" in rows[-1]:
+            sys.exit(f"{args.source} is incomplete: {rows[-1]['error']}")
+        if args.username:
+            rows = [row for row in rows if row["username"] == args.username]
+        rows = rows[: args.limit]
+
+    chats = []
+    for row in rows:
+        if not row.get("prompt") or not row.get("created_at"):
+            continue
+        chats.append(
+            {
+                "prompt": row["prompt"],
+                "username": row["username"],
+                "channel_id": row.get("channel_id"),
+                "created_at": datetime.fromisoformat(row["created_at"]),
+            }
+        )
+    return sorted(chats, key=lambda chat: chat["created_at"])
+
+
+def schedule(chats: list[dict], speed: float, max_gap: float) -> list[float]:
+    """Seconds after the start of the replay at which each chat is sent."""
+    offsets, offset = [], 0.0
+    for previous, chat in zip([None] + chats, chats):
+        if previous is not None and speed > 0:
+            gap = (chat["created_at"] - previous["created_at"]).total_seconds()
+            offset += min(max(gap, 0.0), max_gap) / speed
+        offsets.append(offset)
+    return offsets
+
+
+def replay(base_url: str, chats: list[dict], offsets: list[float], args) -> dict:
+    """Sends every chat at its offset and times each request."""
+    import requests
+
+    from tools.deadline import DEADLINE_HEADER
+
+    latencies, statuses, lateness = [], {}, []
+    lock = threading.Lock()
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=args.max_in_flight)
+    session.mount("http://", adapter)
+    headers = {DEADLINE_HEADER: str(args.timeout)}
+
+    def one(chat: dict):
+        payload = {"prompt": chat["prompt"], "username": chat["username"]}
+        if chat["channel_id"]:
+            payload["channel_id"] = chat["channel_id"]
+        start = time.perf_counter()
+        try:
+            response = session.post(
+                f"{base_url}/generate",
+                json=payload,
+                headers=headers,
+                timeout=args.timeout + 30,
+            )
+            status = str(response.status_code)
+        except requests.RequestException as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - start
+        with lock:
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == "200":
+                latencies.append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.max_in_flight) as pool:
+        for chat, offset in zip(chats, offsets):
+            delay = start + offset - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                # The replay fell behind the original traffic.
+                lateness.append(-delay)
+            pool.submit(one, chat)
+    wall = time.perf_counter() - start
+    return {
+        "latencies": latencies,
+        "statuses": statuses,
+        "lateness": lateness,
+        "wall_seconds": wall,
+    }
+
+
+def cache_hit_rates(counters: dict) -> dict:
+    rates = {}
+    for cache, (hit_names, miss_names) in CACHES.items():
+        hits = sum(counters.get(name, 0) for name in hit_names)
+        misses = sum(counters.get(name, 0) for name in miss_names)
+        rates[cache] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else None,
+        }
+    return rates
+
+
+def answer_prompt_tokens(counters: dict) -> dict:
+    """Mean prompt tokens of the final answer per routing tier."""
+    tiers = {}
+    for name, requests in counters.items():
+        if name.startswith("routing.") and name.endswith(".requests") and requests:
+            tier = name.removeprefix("routing.").removesuffix(".requests")
+            prompt_tokens = counters.get(f"routing.{tier}.prompt_tokens", 0)
+            tiers[tier] = {"answers": requests, "mean": prompt_tokens / requests}
+    return tiers
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--source",
+        required=True,
+        help="'db' to read chat_logs (DB_* variables), or an NDJSON file.",
+    )
+    parser.add_argument("--since", help="ISO timestamp, inclusive (db only).")
+    parser.add_argument("--until", help="ISO timestamp, exclusive (db only).")
+    parser.add_argument("--username")
+    parser.add_argument("--limit", type=int)
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="Time compression: 1 = original timing, 0 = back to back.",
+    )
+    parser.add_argument("--max-gap", type=float, default=300.0)
+    parser.add_argument("--max-in-flight", type=int, default=32)
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=65.0,
+        help="Budget sent in X-Request-Timeout, as the bot does.",
+    )
+    parser.add_argument("--generate-latency", default="lognormal:0.15,0.4")
+    parser.add_argument("--embed-latency", default="fixed:0.01")
+    parser.add_argument("--search-latency", default="lognormal:0.3,0.6")
+    parser.add_argument("--token-rate", type=float, default=60.0)
+    parser.add_argument("--response-tokens", type=int, default=120)
+    parser.add_argument("--search-probability", type=float, default=0.5)
+    parser.add_argument(
+        "--drain",
+        type=float,
+        default=5.0,
+        help="Seconds to wait for background tasks before reading metrics.",
+    )
+    parser.add_argument("--output", default="replay_results.json")
+    args = parser.parse_args()
+
+    config = StubConfig(
+        generate_latency=args.generate_latency,
+        embed_latency=args.embed_latency,
+        search_latency=args.search_latency,
+        token_rate=args.token_rate,
+        response_tokens=args.response_tokens,
+        search_probability=args.search_probability,
+    )
+    api, metrics = start_services(config, use_memory_db=False)
+    # History is read from the real database before the in-memory one
+    # replaces it for the replay itself.
+    chats = load_chats(args, api.vector_db)
+    if not chats:
+        sys.exit("No chats to replay.")
+    InMemoryVectorDB().install(api.vector_db)
+    server, base_url = start_api(api.app)
+
+    offsets = schedule(chats, args.speed, args.max_gap)
+    print(
+        f"Replaying {len(chats)} chats from {chats[0]['created_at']:%Y-%m-%d %H:%M} "
+        f"over about {offsets[-1]:.0f}s"
+    )
+    metrics.reset()
+    run = replay(base_url, chats, offsets, args)
+    time.sleep(args.drain)
+    server.should_exit = True
+
+    snapshot = metrics.snapshot()
+    completed = len(run["latencies"])
+    wall = run["wall_seconds"]
+    results = {
+        "config": vars(args),
+        "chats": len(chats),
+        "completed": completed,
+        "statuses": run["statuses"],
+        "wall_seconds": wall,
+        "throughput_rps": completed / wall if wall else 0,
+        "behind_schedule": metrics.summarize(run["lateness"]),
+        "end_to_end": metrics.summarize(run["latencies"]),
+        "stages": {
+            name: stats
+            for name, stats in snapshot["timings"].items()
+            if name.startswith("stage.")
+        },
+        "prompt_tokens": {
+            kind: metrics.summarize(sizes)
+            for kind, sizes in config.prompt_tokens.items()
+        },
+        "answer_prompt_tokens": answer_prompt_tokens(snapshot["counters"]),
+        "cache_hit_rates": cache_hit_rates(snapshot["counters"]),
+        "metrics": snapshot,
+        "upstream_requests": dict(config.requests_seen),
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+
+    e2e = results["end_to_end"]
+    print(f"{completed} ok of {len(chats)} in {wall:.1f}s, statuses {run['statuses']}")
+    print(
+        f"end-to-end p50={e2e['p50']:.3f}s p95={e2e['p95']:.3f}s "
+        f"p99={e2e['p99']:.3f}s"
+    )
+    if run["lateness"]:
+        late = results["behind_schedule"]
+        print(f"{late['count']} requests sent late, up to {late['max']:.1f}s")
+    for name, stats in sorted(results["stages"].items()):
+        print(
+            f"  {name:<32} n={stats['count']:<5} p50={stats['p50']:.3f}s "
+            f"p95={stats['p95']:.3f}s p99={stats['p99']:.3f}s"
+        )
+    for kind, stats in sorted(results["prompt_tokens"].items()):
+        print(
+            f"  prompt tokens {kind:<18} n={stats['count']:<5} "
+            f"p50={stats['p50']:.0f} p95={stats['p95']:.0f} max={stats['max']:.0f}"
+        )
+    for cache, stats in results["cache_hit_rates"].items():
+        rate = stats["hit_rate"]
+        shown = f"{rate:.1%}" if rate is not None else "unused"
+        print(f"  {cache:<18} hit rate {shown} ({stats['hits']:.0f} hits)")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Cold-start time of each entry point.
+
+Starts a fresh interpreter per run and measures, for each entry point:
+
+- api: importing base/api-wrapper.py and running its startup handlers
+  (schema setup and conversation warm-up) until it could serve requests.
+- bot: importing base/bot.py up to the point where it would connect.
+- main: the supervisor, until it has launched both services ("import")
+  and finished its own setup ("ready"). The services are not started.
+
+Each run uses `python -X importtime`, so the slowest imports are reported
+too. The database is an in-memory stand-in unless --postgres is given, in
+which case the API's startup includes the real `setup_database` check.
+Run from the `app` directory:
+
+    python -m benchmarks.startup_bench --runs 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import time
+
+# --- Path Setup ---
+app_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, app_root)
+
+from tools import metrics
+
+# Code run in the child interpreter for each entry point. It prints one JSON
+# line with the time to import and the time until the entry point is ready.
+ENTRY_POINTS = {
+    "api": """
+        import asyncio, importlib, json, time
+        start = time.perf_counter()
+        if not USE_POSTGRES:
+            # Loads .env before vector_db reads its configuration.
+            from tools.logging_config import setup_logging
+            setup_logging()
+            from benchmarks.stubs import InMemoryVectorDB
+            from tools import vector_db
+            InMemoryVectorDB().install(vector_db)
+        api = importlib.import_module("base.api-wrapper")
+        imported = time.perf_counter()
+        asyncio.run(api.app.router.startup())
+        ready = time.perf_counter()
+    """,
+    "bot": """
+        import importlib, json, time
+        start = time.perf_counter()
+        importlib.import_module("base.bot")
+        imported = ready = time.perf_counter()
+    """,
+    "main": """
+        import json, runpy, subprocess, time
+
+        # The services are not really launched; "import" is when both would be.
+        launched = []
+
+        class FakeProcess:
+            def __init__(self, *args, **kwargs):
+                launched.append(time.perf_counter())
+
+            def wait(self, timeout=None):
+                return 0
+
+            def poll(self):
+                return 0
+
+        subprocess.Popen = FakeProcess
+        start = time.perf_counter()
+        runpy.run_path("main.py", run_name="__main__")
+        imported, ready = launched[-1], time.perf_counter()
+    """,
+}
+
+REPORT = """
+print(json.dumps({"import": imported - start, "ready": ready - start}))
+"""
+
+
+def parse_importtime(stderr: str, top: int) -> list[tuple[str, float]]:
+    """Top-level packages by cumulative import time (seconds) from -X importtime."""
+    totals: dict[str, float] = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        try:
+            _, cumulative, name = line[12:].split("|")
+            cumulative_us = int(cumulative)
+        except ValueError:
+            continue
+        # Nested imports are indented; only count each top-level import once.
+        name = name.removeprefix(" ")
+        if not name.startswith(" "):
+            package = name.split(".")[0]
+            totals[package] = totals.get(package, 0) + cumulative_us / 1e6
+    return sorted(totals.items(), key=lambda item: -item[1])[:top]
+
+
+def run_once(entry_point: str, use_postgres: bool, top: int) -> dict:
+    code = (
+        f"USE_POSTGRES = {use_postgres}\n"
+        + textwrap.dedent(ENTRY_POINTS[entry_point])
+        + REPORT
+    )
+    env = {**os.environ, "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING")}
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=app_root,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        raise RuntimeError(f"{entry_point} failed to start:\n{result.stderr[-2000:]}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    return {
+        **timings,
+        "process": wall,
+        "slowest_imports": parse_importtime(result.stderr, top),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--entry-points",
+        default=",".join(ENTRY_POINTS),
+        help="Comma-separated subset of: " + ", ".join(ENTRY_POINTS),
+    )
+    parser.add_argument(
+        "--postgres",
+        action="store_true",
+        help="Run the API's schema setup against the DB_* database.",
+    )
+    parser.add_argument("--top", type=int, default=8, help="Slowest imports to list.")
+    parser.add_argument("--output", default="startup_bench_results.json")
+    args = parser.parse_args()
+
+    results = {}
+    for entry_point in args.entry_points.split(","):
+        # The first run also warms the bytecode cache, so it is not counted.
+        run_once(entry_point, args.postgres, args.top)
+        runs = [
+            run_once(entry_point, args.postgres, args.top) for _ in range(args.runs)
+        ]
+        results[entry_point] = {
+            "import": metrics.summarize([run["import"] for run in runs]),
+            "ready": metrics.summarize([run["ready"] for run in runs]),
+            "process": metrics.summarize([run["process"] for run in runs]),
+            "slowest_imports": runs[-1]["slowest_imports"],
+        }
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for entry_point, result in results.items():
+        ready, process = result["ready"], result["process"]
+        print(
+            f"{entry_point}: ready p50={ready['p50'] * 1000:.0f}ms "
+            f"p95={ready['p95'] * 1000:.0f}ms, whole process "
+            f"p50={process['p50'] * 1000:.0f}ms ({args.runs} runs)"
+        )
+        slowest = ", ".join(
+            f"{name} {seconds * 1000:.0f}ms"
+            for name, seconds in result["slowest_imports"]
+        )
+        print(f"  slowest imports: {slowest}")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
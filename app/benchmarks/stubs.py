@@ -0,0 +1,422 @@
+"""
+Local stand-ins for the services the pipeline talks to.
+
+None of these talk to a real model or search engine. They answer with the
+same JSON shapes as Ollama and SearXNG after sleeping for a configurable
+amount of time, so the pipeline can be benchmarked on any machine.
+"""
+
+import hashlib
+import json
+import logging
+import math
+import random
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from tools import tracing
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+EMBEDDING_DIMENSIONS = 768
+FILLER_WORDS = (
+    "the quick brown fox jumps over the lazy dog while oswald mocks "
+    "everyone in the channel for asking such an obvious question"
+).split()
+
+
+# --- Latency Distributions ---
+def parse_latency(spec: str):
+    """
+    Turns a latency spec into a zero-argument sampler returning seconds.
+
+    Supported specs:
+        fixed:0.05            always 50 ms
+        uniform:0.02,0.2      uniformly between 20 ms and 200 ms
+        lognormal:0.1,0.5     median 100 ms, sigma 0.5 (long right tail)
+    """
+    kind, _, raw_args = spec.partition(":")
+    args = [float(a) for a in raw_args.split(",") if a]
+    if kind == "fixed" and len(args) == 1:
+        return lambda: args[0]
+    if kind == "uniform" and len(args) == 2:
+        return lambda: random.uniform(args[0], args[1])
+    if kind == "lognormal" and len(args) == 2:
+        mu = math.log(args[0])
+        return lambda: random.lognormvariate(mu, args[1])
+    raise ValueError(f"Invalid latency spec: '{spec}'")
+
+
+@dataclass
+class StubConfig:
+    """Knobs shared by the stub servers."""
+
+    generate_latency: str = "lognormal:0.15,0.4"
+    embed_latency: str = "fixed:0.01"
+    search_latency: str = "lognormal:0.3,0.6"
+    token_rate: float = 60.0  # generated tokens per second
+    response_tokens: int = 120
+    search_probability: float = 0.5
+    # When labels are given, intent answers are right this often instead of
+    # random; malformed answers exercise the JSON fallback.
+    intent_labels: dict = field(default_factory=dict)
+    intent_accuracy: float = 0.9
+    malformed_probability: float = 0.0
+    results_per_query: int = 8
+    duplicate_probability: float = 0.2
+    api_latency: str = "lognormal:0.5,0.5"
+    long_response_chars: int = 4500
+    requests_seen: dict = field(default_factory=dict)
+    # Prompt sizes in tokens, as reported back in prompt_eval_count, by kind.
+    prompt_tokens: dict = field(default_factory=dict)
+    # Spans received by the stand-in trace collector, in the exported format.
+    spans: list = field(default_factory=list)
+
+    def __post_init__(self):
+        self.sample_generate = parse_latency(self.generate_latency)
+        self.sample_embed = parse_latency(self.embed_latency)
+        self.sample_search = parse_latency(self.search_latency)
+        self.sample_api = parse_latency(self.api_latency)
+        self._lock = threading.Lock()
+
+    def count(self, path: str):
+        with self._lock:
+            self.requests_seen[path] = self.requests_seen.get(path, 0) + 1
+
+    def record_prompt(self, kind: str, tokens: int):
+        with self._lock:
+            self.prompt_tokens.setdefault(kind, []).append(tokens)
+
+    def record_spans(self, spans: list[dict]):
+        with self._lock:
+            self.spans.extend(spans)
+
+
+def fake_embedding(text: str) -> list[float]:
+    """A deterministic unit vector derived from the text, so equal text embeds equally."""
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    vector = [rng.gauss(0, 1) for _ in range(EMBEDDING_DIMENSIONS)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    """Shared plumbing for the stub handlers."""
+
+    config: StubConfig
+
+    def log_message(self, format, *args):
+        # The default handler writes every request to stderr; keep benchmarks quiet.
+        pass
+
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        if not length:
+            return {}
+        return json.loads(self.rfile.read(length))
+
+    def _send_json(self, payload: dict, status: int = 200):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+# --- Ollama ---
+class StubOllamaHandler(_JSONHandler):
+    """Mimics /api/generate, /api/embeddings and /api/embed."""
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        self.config.count(path)
+        body = self._read_json()
+
+        if path == "/api/generate":
+            self._send_json(self._generate(body))
+        elif path == "/api/embeddings":
+            time.sleep(self.config.sample_embed())
+            self._send_json({"embedding": fake_embedding(body.get("prompt", ""))})
+        elif path == "/api/embed":
+            inputs = body.get("input", [])
+            if isinstance(inputs, str):
+                inputs = [inputs]
+            time.sleep(self.config.sample_embed())
+            self._send_json({"embeddings": [fake_embedding(t) for t in inputs]})
+        else:
+            self._send_json({"error": "not found"}, status=404)
+
+    def _generate(self, body: dict) -> dict:
+        prompt = body.get("prompt", "")
+        options = body.get("options") or {}
+        done_reason = "stop"
+        prompt_tokens = len(prompt) // 4
+
+        if body.get("format") == "json" and "search_queries" in prompt:
+            # Search query generation
+            kind = "search_queries"
+            tokens = 30
+            text = json.dumps(
+                {"search_queries": [f"{prompt[-40:]} {i}" for i in range(3)]}
+            )
+        elif body.get("format") == "json":
+            # Intent analysis
+            kind = "intent"
+            tokens = 8
+            label = self.config.intent_labels.get(prompt)
+            if label is None:
+                search_needed = random.random() < self.config.search_probability
+            else:
+                correct = random.random() < self.config.intent_accuracy
+                search_needed = label if correct else not label
+            text = json.dumps({"search_needed": search_needed})
+            if random.random() < self.config.malformed_probability:
+                text = '{"search_needed": }'
+        else:
+            # Answers and profile updates
+            kind = "generate"
+            tokens = self.config.response_tokens
+            num_predict = int(options.get("num_predict") or -1)
+            if 0 <= num_predict < tokens:
+                tokens, done_reason = num_predict, "length"
+            text = " ".join(FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(tokens))
+
+        self.config.record_prompt(kind, prompt_tokens)
+        eval_seconds = tokens / self.config.token_rate
+        time.sleep(self.config.sample_generate() + eval_seconds)
+        return {
+            "model": body.get("model"),
+            "response": text,
+            "done": True,
+            "done_reason": done_reason,
+            "prompt_eval_count": prompt_tokens,
+            "eval_count": tokens,
+            "eval_duration": int(eval_seconds * 1e9),
+        }
+
+
+# --- SearXNG ---
+class StubSearxngHandler(_JSONHandler):
+    """Mimics /search?q=...&format=json."""
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        self.config.count(parsed.path)
+        if parsed.path != "/search":
+            self._send_json({"error": "not found"}, status=404)
+            return
+
+        query = parse_qs(parsed.query).get("q", [""])[0]
+        time.sleep(self.config.sample_search())
+        results = []
+        for i in range(self.config.results_per_query):
+            if results and random.random() < self.config.duplicate_probability:
+                # The same article mirrored on another site.
+                mirror = dict(results[-1])
+                mirror["url"] = mirror["url"].replace("example.com", "mirror.example")
+                results.append(mirror)
+                continue
+            rng = random.Random(f"{query}-{i}")
+            results.append(
+                {
+                    "url": f"https://example.com/{rng.randrange(10**6)}",
+                    "title": f"Result {i} for {query}",
+                    "content": " ".join(rng.choice(FILLER_WORDS) for _ in range(40)),
+                    "engine": "stub",
+                    "engines": ["stub"],
+                }
+            )
+        self._send_json({"query": query, "results": results})
+
+
+# --- API Wrapper ---
+class StubApiHandler(_JSONHandler):
+    """
+    Mimics the API wrapper for exercising the bot on its own.
+
+    Prompts containing "[long]" get a response longer than Discord's
+    2000 character limit so the reply splitting path is exercised.
+    """
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        self.config.count(path)
+        if path == "/health":
+            self._send_json({"status": "ok"})
+        elif path.startswith("/context/"):
+            time.sleep(self.config.sample_embed())
+            username = path.removeprefix("/context/")
+            self._send_json({"username": username, "context": "A stub profile."})
+        else:
+            self._send_json({"detail": "Not Found"}, status=404)
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        self.config.count(path)
+        if path != "/generate":
+            self._send_json({"detail": "Not Found"}, status=404)
+            return
+
+        body = self._read_json()
+        time.sleep(self.config.sample_api())
+        if "[long]" in body.get("prompt", ""):
+            words = " ".join(FILLER_WORDS)
+            response = (words * (self.config.long_response_chars // len(words) + 1))[
+                : self.config.long_response_chars
+            ]
+        else:
+            response = " ".join(FILLER_WORDS[:12])
+        self._send_json({"response": response})
+
+
+# --- Trace Collector ---
+class StubCollectorHandler(_JSONHandler):
+    """Mimics an OTLP/HTTP collector's JSON /v1/traces endpoint."""
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        self.config.count(path)
+        if path != "/v1/traces":
+            self._send_json({"error": "not found"}, status=404)
+            return
+        self.config.record_spans(tracing.from_otlp(self._read_json()))
+        self._send_json({"partialSuccess": {}})
+
+
+# --- Server Helpers ---
+def start_stub_server(
+    handler_cls, config: StubConfig, port: int = 0
+) -> tuple[ThreadingHTTPServer, str]:
+    """Starts a handler on `port` (a free one by default) in a daemon thread."""
+    handler = type(handler_cls.__name__, (handler_cls,), {"config": config})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    log.info(f"Started {handler_cls.__name__} at {url}")
+    return server, url
+
+
+# --- Embedded Database ---
+class InMemoryVectorDB:
+    """
+    An in-process stand-in for `tools.vector_db`.
+
+    It implements the same functions with the same signatures, so it can be
+    swapped in with `install()` when no PostgreSQL instance is available.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.chats: list[dict] = []
+        self.profiles: dict[str, tuple[str, datetime]] = {}
+        self.embeddings: dict[str, object] = {}
+
+    def setup_database(self):
+        pass
+
+    def get_user_context(self, username: str) -> str | None:
+        context, _ = self.profiles.get(username, (None, None))
+        return context
+
+    def get_user_contexts(self, usernames):
+        with self._lock:
+            return {
+                name: self.profiles[name] for name in usernames if name in self.profiles
+            }
+
+    def get_recent_chats(self, username: str, limit: int) -> str:
+        with self._lock:
+            prompts = [c["prompt"] for c in self.chats if c["username"] == username]
+        return "\n".join(prompts[-limit:])
+
+    def get_single_most_recent_chat(self, username: str) -> str | None:
+        with self._lock:
+            for chat in reversed(self.chats):
+                if chat["username"] == username:
+                    return chat["prompt"]
+        return None
+
+    def update_user_profile(self, username: str, profile: str):
+        with self._lock:
+            self.profiles[username] = (profile, datetime.now(timezone.utc))
+
+    def save_chat(
+        self,
+        username,
+        prompt,
+        response,
+        prompt_embedding,
+        response_embedding,
+        search_queries=None,
+        embedding_model=None,
+        channel_id=None,
+    ):
+        with self._lock:
+            self.chats.append(
+                {
+                    "username": username,
+                    "prompt": prompt,
+                    "response": response,
+                    "search_queries": search_queries,
+                    "channel_id": channel_id,
+                    "created_at": datetime.now(timezone.utc),
+                }
+            )
+
+    def save_chats(self, chats):
+        for chat in chats:
+            self.save_chat(**chat)
+        return True
+
+    def get_recent_channel_turns(self, per_channel: int, max_age_seconds: int):
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=max_age_seconds)
+        turns: dict[str, list] = {}
+        with self._lock:
+            for chat in self.chats:
+                if chat["channel_id"] and chat["created_at"] >= cutoff:
+                    turns.setdefault(chat["channel_id"], []).append(chat)
+        fields = ("channel_id", "username", "prompt", "response", "created_at")
+        rows = [
+            tuple(chat[name] for name in fields)
+            for chats in turns.values()
+            for chat in chats[-per_channel:]
+        ]
+        return sorted(rows, key=lambda row: row[4])
+
+    def get_embeddings_by_hash(self, content_hashes):
+        with self._lock:
+            return {
+                key: self.embeddings[key]
+                for key in content_hashes
+                if key in self.embeddings
+            }
+
+    def save_embeddings(self, rows):
+        with self._lock:
+            for key, model, vector in rows:
+                self.embeddings.setdefault(key, vector)
+
+    def install(self, module):
+        """Points every public function of `module` at this store."""
+        for name in (
+            "setup_database",
+            "get_user_context",
+            "get_user_contexts",
+            "get_recent_chats",
+            "get_single_most_recent_chat",
+            "update_user_profile",
+            "save_chat",
+            "save_chats",
+            "get_recent_channel_turns",
+            "get_embeddings_by_hash",
+            "save_embeddings",
+        ):
+            setattr(module, name, getattr(self, name))
@@ -0,0 +1,174 @@
+"""
+Finds the slowest stage of individual traced replies.
+
+Reads the spans written with TRACE_EXPORTER=file. With --collect it instead
+runs a stand-in OTLP collector on --port: point TRACE_OTLP_ENDPOINT at it
+(with TRACE_EXPORTER=otlp) and it appends the spans it receives to the file
+until stopped.
+
+A span's self time is its duration minus the time covered by its children,
+so the slowest stage is the span with the largest self time, whether that
+is an Ollama call, SearXNG, a queue or the bot itself. Run from the `app`
+directory:
+
+    python -m benchmarks.trace_report traces.jsonl --slowest 10
+    python -m benchmarks.trace_report traces.jsonl --trace 1a2b3c4d
+    python -m benchmarks.trace_report traces.jsonl --collect --port 4318
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+# --- Path Setup ---
+app_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, app_root)
+
+from benchmarks.stubs import StubCollectorHandler, StubConfig, start_stub_server
+from tools import metrics
+
+
+def load_traces(path: str) -> dict[str, list[dict]]:
+    """Spans from a JSONL file, grouped by trace ID."""
+    traces: dict[str, list[dict]] = {}
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                span = json.loads(line)
+                traces.setdefault(span["trace_id"], []).append(span)
+    return traces
+
+
+def _children(spans: list[dict]) -> dict[str | None, list[dict]]:
+    """Spans by parent ID; roots (or orphans) are under None."""
+    ids = {span["span_id"] for span in spans}
+    children: dict[str | None, list[dict]] = {}
+    for span in sorted(spans, key=lambda s: s["start"]):
+        parent = span["parent_id"] if span["parent_id"] in ids else None
+        children.setdefault(parent, []).append(span)
+    return children
+
+
+def self_times(spans: list[dict]) -> dict[str, float]:
+    """Each span's duration minus the part of it its children cover."""
+    children = _children(spans)
+    times = {}
+    for span in spans:
+        start, end = span["start"], span["start"] + span["duration"]
+        covered, cursor = 0.0, start
+        for child in children.get(span["span_id"], []):
+            child_start = max(child["start"], cursor)
+            child_end = min(child["start"] + child["duration"], end)
+            if child_end > child_start:
+                covered += child_end - child_start
+                cursor = child_end
+        times[span["span_id"]] = max(0.0, span["duration"] - covered)
+    return times
+
+
+def reply_time(spans: list[dict]) -> float:
+    """Duration of the trace's first root span: what the user waited for."""
+    return _children(spans)[None][0]["duration"]
+
+
+def slowest_stage(spans: list[dict]) -> tuple[dict, float]:
+    times = self_times(spans)
+    span = max(spans, key=lambda s: times[s["span_id"]])
+    return span, times[span["span_id"]]
+
+
+def print_tree(spans: list[dict]):
+    children = _children(spans)
+    times = self_times(spans)
+    trace_start = min(span["start"] for span in spans)
+    slowest, _ = slowest_stage(spans)
+
+    def show(span: dict, depth: int):
+        offset = (span["start"] - trace_start) * 1000
+        duration = span["duration"] * 1000
+        own = times[span["span_id"]] * 1000
+        marker = "  <- slowest" if span is slowest else ""
+        error = f"  [{span['error']}]" if span["error"] else ""
+        print(
+            f"{offset:>8.0f}ms {'  ' * depth}{span['name']:<{34 - 2 * depth}} "
+            f"{duration:>7.0f}ms  self {own:>6.0f}ms  ({span['service']})"
+            f"{error}{marker}"
+        )
+        for child in children.get(span["span_id"], []):
+            show(child, depth + 1)
+
+    for root in children[None]:
+        show(root, 0)
+
+
+def collect(port: int, output: str):
+    """Runs the stand-in collector, appending received spans to `output`."""
+    config = StubConfig()
+    _, url = start_stub_server(StubCollectorHandler, config, port)
+    print(f"Collecting spans at {url}/v1/traces into {output} (Ctrl+C to stop)")
+    written = 0
+    try:
+        while True:
+            time.sleep(1)
+            written = _append(config.spans, written, output)
+    except KeyboardInterrupt:
+        written = _append(config.spans, written, output)
+        print(f"\n{written} spans written to {output}")
+
+
+def _append(spans: list[dict], written: int, output: str) -> int:
+    new = spans[written:]
+    if new:
+        with open(output, "a") as f:
+            f.write("".join(json.dumps(span) + "\n" for span in new))
+    return written + len(new)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("path", help="JSONL span file (TRACE_FILE).")
+    parser.add_argument("--trace", help="Show one trace; a prefix is enough.")
+    parser.add_argument("--slowest", type=int, default=10)
+    parser.add_argument("--collect", action="store_true")
+    parser.add_argument("--port", type=int, default=4318)
+    args = parser.parse_args()
+
+    if args.collect:
+        collect(args.port, args.path)
+        return
+
+    traces = load_traces(args.path)
+    if args.trace:
+        matches = [tid for tid in traces if tid.startswith(args.trace)]
+        if len(matches) != 1:
+            sys.exit(f"{len(matches)} traces match '{args.trace}'.")
+        print_tree(traces[matches[0]])
+        return
+
+    ranked = sorted(traces.items(), key=lambda item: -reply_time(item[1]))
+    print(f"Slowest {min(args.slowest, len(ranked))} of {len(ranked)} traces:")
+    for trace_id, spans in ranked[: args.slowest]:
+        stage, seconds = slowest_stage(spans)
+        print(
+            f"  {trace_id[:8]}  reply {reply_time(spans):>6.2f}s  slowest stage "
+            f"{stage['name']} {seconds:.2f}s"
+        )
+
+    by_name: dict[str, list[float]] = {}
+    for spans in traces.values():
+        times = self_times(spans)
+        for span in spans:
+            by_name.setdefault(span["name"], []).append(times[span["span_id"]])
+    print("Self time by stage:")
+    for name, samples in sorted(by_name.items(), key=lambda item: -sum(item[1])):
+        stats = metrics.summarize(samples)
+        print(
+            f"  {name:<24} n={stats['count']:<5} p50={stats['p50']:.3f}s "
+            f"p95={stats['p95']:.3f}s max={stats['max']:.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
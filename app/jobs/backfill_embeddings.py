@@ -0,0 +1,181 @@
+"""
+Bulk backfill and re-embedding of chat_logs vectors.
+
+Finds chat rows whose vectors are missing (the background task failed
+before saving them) or were produced by a different model than
+OLLAMA_EMBEDDING_MODEL, embeds them in large batches with a bounded number
+of concurrent Ollama requests, and writes them back with one UPDATE per
+batch, recording the model that produced them. Rows are stored in the
+current EMBEDDING_STORAGE format.
+
+Progress is checkpointed by chat id after every batch, and rows already
+done no longer match, so an interrupted run simply starts again. Run from
+the `app` directory:
+
+    python -m jobs.backfill_embeddings --batch-size 64 --concurrency 4
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+# --- Path Setup ---
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from tools.logging_config import setup_logging
+
+setup_logging()
+
+from tools import embedding_cache, vector_db
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+PROGRESS_INTERVAL = 10  # seconds between progress lines
+
+
+def load_checkpoint(path: str, model: str) -> int:
+    """Returns the last chat id finished for `model`, or 0."""
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        state = json.load(f)
+    if state.get("model") != model:
+        log.info("Checkpoint is for another model, starting from the beginning.")
+        return 0
+    log.info(f"Resuming after chat id {state['last_id']}.")
+    return state["last_id"]
+
+
+def save_checkpoint(path: str, model: str, last_id: int):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"model": model, "last_id": last_id}, f)
+    os.replace(tmp_path, path)
+
+
+def embed_batch(rows: list[tuple], model: str) -> list[tuple]:
+    """Embeds the prompts and responses of a batch with one Ollama request."""
+    texts = [text for _, prompt, response in rows for text in (prompt, response)]
+    # Repeated texts are embedded once; the table tier is written on update.
+    vectors = embedding_cache.get_embeddings(texts, model, persist=False)
+    return [
+        (chat_id, prompt, response, vectors[2 * i], vectors[2 * i + 1])
+        for i, (chat_id, prompt, response) in enumerate(rows)
+    ]
+
+
+def batches(rows, size: int):
+    rows = iter(rows)
+    while batch := list(islice(rows, size)):
+        yield batch
+
+
+class Backfill:
+    """Writes embedded batches back in id order and tracks progress."""
+
+    def __init__(self, args, total: int):
+        self.args = args
+        self.total = total
+        self.written, self.failed = 0, 0
+        self.started = self.last_report = time.monotonic()
+
+    def write(self, batch: list[tuple], future):
+        try:
+            embedded = future.result()
+        except Exception as e:
+            log.error(f"Embedding a batch failed: {e}")
+            self.failed += len(batch)
+        else:
+            if vector_db.update_chat_embeddings(self.args.model, embedded):
+                self.written += len(embedded)
+                # Only move the checkpoint past ids that are all done.
+                if not self.failed:
+                    last_id = batch[-1][0]
+                    save_checkpoint(self.args.checkpoint, self.args.model, last_id)
+            else:
+                self.failed += len(batch)
+
+        if time.monotonic() - self.last_report >= PROGRESS_INTERVAL:
+            self.report()
+            self.last_report = time.monotonic()
+
+    def report(self):
+        elapsed = time.monotonic() - self.started
+        rate = self.written / elapsed if elapsed else 0.0
+        log.info(f"Embedded {self.written}/{self.total} chat rows ({rate:.0f} rows/s).")
+
+
+def run(args) -> int:
+    if args.label_existing:
+        labelled = vector_db.label_unlabelled_embeddings(args.label_existing)
+        log.info(f"Labelled {labelled} existing rows as '{args.label_existing}'.")
+
+    after_id = 0 if args.restart else load_checkpoint(args.checkpoint, args.model)
+    total = vector_db.count_chats_needing_embeddings(args.model, after_id)
+    log.info(
+        f"Embedding {total} chat rows with '{args.model}' "
+        f"({vector_db.EMBEDDING_STORAGE} storage)."
+    )
+
+    rows = vector_db.iter_chats_needing_embeddings(
+        args.model, after_id, fetch_size=args.batch_size * args.concurrency * 2
+    )
+    backfill = Backfill(args, total)
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        # Batches are written in id order, oldest first, with at most
+        # `concurrency` of them being embedded at any time.
+        in_flight: deque = deque()
+        for batch in batches(rows, args.batch_size):
+            in_flight.append((batch, pool.submit(embed_batch, batch, args.model)))
+            if len(in_flight) >= args.concurrency:
+                backfill.write(*in_flight.popleft())
+        while in_flight:
+            backfill.write(*in_flight.popleft())
+
+    backfill.report()
+    if backfill.failed:
+        log.warning(
+            f"{backfill.failed} rows failed; the checkpoint stops before the "
+            "first of them so the next run retries them."
+        )
+    elif os.path.exists(args.checkpoint):
+        # Everything is done, so the next run scans from the start again.
+        os.remove(args.checkpoint)
+    return backfill.written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", default=vector_db.OLLAMA_EMBEDDING_MODEL)
+    parser.add_argument(
+        "--batch-size", type=int, default=64, help="Chat rows per Ollama request."
+    )
+    parser.add_argument(
+        "--concurrency", type=int, default=4, help="Concurrent Ollama requests."
+    )
+    parser.add_argument(
+        "--label-existing",
+        metavar="MODEL",
+        help="First record MODEL as the producer of vectors saved before "
+        "rows tracked their model, instead of re-embedding them.",
+    )
+    parser.add_argument("--checkpoint", default="backfill_embeddings.checkpoint.json")
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignore the existing checkpoint."
+    )
+    args = parser.parse_args()
+
+    vector_db.setup_database()
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
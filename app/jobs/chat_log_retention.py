@@ -0,0 +1,62 @@
+"""
+Maintenance job for the partitioned chat_logs table.
+
+Creates upcoming monthly partitions and archives partitions that have
+fallen out of the retention window to gzipped CSV files. Meant to be run
+daily from cron; every step is idempotent.
+
+Run from the `app` directory:
+
+    python -m jobs.chat_log_retention
+    python -m jobs.chat_log_retention --migrate   # one-time conversion
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+# --- Path Setup ---
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from tools.logging_config import setup_logging
+
+setup_logging()
+
+from tools import vector_db
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--migrate",
+        action="store_true",
+        help="Convert an existing unpartitioned chat_logs table first.",
+    )
+    parser.add_argument(
+        "--retention-months",
+        type=int,
+        default=vector_db.CHAT_LOGS_RETENTION_MONTHS,
+    )
+    parser.add_argument("--archive-dir", default=vector_db.CHAT_LOGS_ARCHIVE_DIR)
+    parser.add_argument(
+        "--months-ahead", type=int, default=vector_db.CHAT_LOGS_PREMAKE_MONTHS
+    )
+    args = parser.parse_args()
+
+    if args.migrate:
+        vector_db.migrate_chat_logs_to_partitioned()
+
+    vector_db.ensure_chat_log_partitions(args.months_ahead)
+    archived = vector_db.archive_old_chat_log_partitions(
+        args.retention_months, args.archive_dir
+    )
+    log.info(f"Retention run complete. Archived {len(archived)} partitions.")
+
+
+if __name__ == "__main__":
+    main()
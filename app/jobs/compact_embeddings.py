@@ -0,0 +1,48 @@
+"""
+One-time migration of inline chat_logs vectors to compact storage.
+
+Moves every full-precision prompt/response vector into the shared
+embeddings table in the format chosen by EMBEDDING_STORAGE (halfvec or
+int8), deduplicating identical texts. Safe to interrupt and rerun.
+
+Run from the `app` directory:
+
+    EMBEDDING_STORAGE=halfvec python -m jobs.compact_embeddings
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+# --- Path Setup ---
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from tools.logging_config import setup_logging
+
+setup_logging()
+
+from tools import vector_db
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--model",
+        default=vector_db.OLLAMA_EMBEDDING_MODEL,
+        help="Embedding model that produced the existing vectors.",
+    )
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    vector_db.setup_database()
+    migrated = vector_db.migrate_embeddings_to_compact(args.model, args.batch_size)
+    log.info(f"Migrated {migrated} chat rows to '{vector_db.EMBEDDING_STORAGE}'.")
+
+
+if __name__ == "__main__":
+    main()
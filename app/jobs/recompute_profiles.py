@@ -0,0 +1,278 @@
+"""
+Nightly batch recomputation of every user profile.
+
+Profiles are otherwise only nudged one chat at a time, so they drift. This
+job walks the users table in username order, streams each user's recent
+prompts through a server-side cursor and regenerates their profile from
+scratch, running a bounded number of Ollama calls at once.
+
+Progress is checkpointed to a JSON file after every user, so an
+interrupted run (or one that reaches the end of its off-peak window)
+continues where it stopped on the next run, retrying the users that failed
+before it stopped first. Run from the `app` directory:
+
+    python -m jobs.recompute_profiles --workers 2 --window 01:00-06:00
+    python -m jobs.recompute_profiles --restart   # ignore the checkpoint
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from datetime import time as clock_time
+from datetime import timedelta
+
+# --- Path Setup ---
+project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, project_root)
+
+from tools.logging_config import setup_logging
+
+setup_logging()
+
+from tools import ollama, vector_db
+from tools.system_prompts import get_user_profile_generator_prompt
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+PROFILE_MODEL = os.getenv("OLLAMA_PROFILE_MODEL", "llama2-uncensored:7b")
+CONTEXT_SUMMARY_COUNT = int(os.getenv("CONTEXT_SUMMARY_COUNT", 10))
+PROGRESS_INTERVAL = 30  # seconds between progress lines
+
+
+def parse_window(spec: str | None) -> tuple[clock_time, clock_time] | None:
+    """Parses "HH:MM-HH:MM" (local time, may wrap past midnight)."""
+    if not spec:
+        return None
+    start, end = (datetime.strptime(part, "%H:%M").time() for part in spec.split("-"))
+    return start, end
+
+
+def in_window(window, now: datetime) -> bool:
+    if window is None:
+        return True
+    start, end = window
+    if start <= end:
+        return start <= now.time() < end
+    return now.time() >= start or now.time() < end
+
+
+def seconds_until_window(window, now: datetime) -> float:
+    start = datetime.combine(now.date(), window[0])
+    if start <= now:
+        start += timedelta(days=1)
+    return (start - now).total_seconds()
+
+
+class Checkpoint:
+    """
+    Remembers the last username below which every user is finished, and
+    the users that failed, until a later attempt at them succeeds.
+
+    Users complete out of order, so the watermark only moves past a user
+    once every user submitted before it is done. Retried users are already
+    behind the watermark and leave it alone.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state = {"last_username": None, "done": 0, "failed": []}
+        self._pending: list[str] = []
+        self._finished: set[str] = set()
+        self._retrying: set[str] = set()
+        self._lock = threading.Lock()
+
+    def load(self):
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                self.state.update(json.load(f))
+            log.info(
+                f"Resuming after '{self.state['last_username']}' "
+                f"({self.state['done']} users done before)."
+            )
+
+    def to_retry(self) -> list[str]:
+        """Failed users behind the watermark, which a resumed run would skip."""
+        after = self.state["last_username"]
+        if after is None:
+            return []
+        return [name for name in self.state["failed"] if name <= after]
+
+    def submitted(self, username: str, retry: bool = False):
+        with self._lock:
+            if retry:
+                self._retrying.add(username)
+            else:
+                self._pending.append(username)
+
+    def finished(self, username: str, ok: bool):
+        with self._lock:
+            failed = self.state["failed"]
+            if ok:
+                self.state["done"] += 1
+                if username in failed:
+                    failed.remove(username)
+            elif username not in failed:
+                failed.append(username)
+
+            if username in self._retrying:
+                self._retrying.discard(username)
+            else:
+                self._finished.add(username)
+            while self._pending and self._pending[0] in self._finished:
+                self._finished.discard(self._pending[0])
+                self.state["last_username"] = self._pending.pop(0)
+            self._save()
+
+    def clear(self):
+        """Forgets the checkpoint once a run has covered every user."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _save(self):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def recompute_profile(username: str, chat_history: str, model: str) -> bool:
+    """Regenerates one profile from the user's recent prompts."""
+    if not chat_history.strip():
+        log.debug(f"No chat history for '{username}', keeping their profile.")
+        return True
+    try:
+        envelope = ollama.generate(
+            {
+                "model": model,
+                "prompt": get_user_profile_generator_prompt(chat_history, username),
+            }
+        )
+        profile = envelope.get("response", "").strip()
+        if not profile:
+            log.warning(f"LLM returned an empty profile for '{username}'.")
+            return False
+        vector_db.update_user_profile(username, profile)
+        return True
+    except Exception as e:
+        log.error(f"Failed to recompute profile for '{username}': {e}")
+        return False
+
+
+def iter_histories(history: int, after: str | None, retry: list[str]):
+    """Histories of the users to retry, then of every user after `after`."""
+    if retry:
+        yield from vector_db.iter_user_histories(history, usernames=retry)
+    yield from vector_db.iter_user_histories(history, after)
+
+
+def report(done: int, total: int, started: float):
+    elapsed = time.monotonic() - started
+    rate = done / elapsed if elapsed else 0.0
+    eta = (total - done) / rate if rate else float("inf")
+    log.info(
+        f"Recomputed {done}/{total} profiles "
+        f"({rate * 60:.1f}/min, about {eta / 60:.0f} min left)."
+    )
+
+
+def run(args) -> int:
+    window = parse_window(args.window)
+    now = datetime.now()
+    if not in_window(window, now):
+        if not args.wait:
+            log.info(f"Outside the {args.window} window, nothing to do.")
+            return 0
+        delay = seconds_until_window(window, now)
+        log.info(f"Waiting {delay / 60:.0f} min for the {args.window} window.")
+        time.sleep(delay)
+
+    checkpoint = Checkpoint(args.checkpoint)
+    if not args.restart:
+        checkpoint.load()
+    after = checkpoint.state["last_username"]
+    retry = checkpoint.to_retry()
+    if retry:
+        log.info(f"Retrying {len(retry)} profiles that failed before first.")
+    total = vector_db.count_users(after) + len(retry)
+    log.info(f"Recomputing {total} profiles with {args.workers} workers.")
+
+    started, last_report, processed = time.monotonic(), time.monotonic(), 0
+    histories = iter_histories(args.history, after, retry)
+    finished_all = True
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        in_flight = set()
+        for username, chat_history in histories:
+            if not in_window(window, datetime.now()):
+                log.info("Off-peak window closed, stopping after in-flight users.")
+                finished_all = False
+                break
+            # Keep the queue short so the cursor, not memory, holds the backlog.
+            while len(in_flight) >= args.workers * 2:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                processed += len(done)
+            checkpoint.submitted(username, retry=username in retry)
+            future = pool.submit(recompute_profile, username, chat_history, args.model)
+            future.add_done_callback(
+                lambda f, name=username: checkpoint.finished(name, f.result())
+            )
+            in_flight.add(future)
+
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                report(processed, total, started)
+                last_report = time.monotonic()
+        histories.close()
+        processed += len(wait(in_flight).done)
+
+    report(processed, total, started)
+    failed = checkpoint.state["failed"]
+    if failed:
+        log.warning(f"{len(failed)} profiles failed: {', '.join(failed)}")
+    if finished_all:
+        # The next run starts from the first user again.
+        checkpoint.clear()
+    else:
+        log.info(f"Stopped early; the next run resumes from {args.checkpoint}.")
+    return processed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--model", default=PROFILE_MODEL)
+    parser.add_argument(
+        "--workers", type=int, default=2, help="Concurrent Ollama requests."
+    )
+    parser.add_argument(
+        "--history",
+        type=int,
+        default=CONTEXT_SUMMARY_COUNT,
+        help="Recent prompts used per user.",
+    )
+    parser.add_argument(
+        "--window",
+        help="Only run between these local times, e.g. 01:00-06:00.",
+    )
+    parser.add_argument(
+        "--wait",
+        action="store_true",
+        help="Sleep until the window opens instead of exiting.",
+    )
+    parser.add_argument("--checkpoint", default="recompute_profiles.checkpoint.json")
+    parser.add_argument(
+        "--restart", action="store_true", help="Ignore the existing checkpoint."
+    )
+    args = parser.parse_args()
+
+    vector_db.setup_database()
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,83 +1,95 @@
-import multiprocessing
 import os
 import signal
 import subprocess
 import sys
-import time
 
-from tools.logging_config import setup_logging
+from tools.settings import Settings, get_settings
 
 
-def run_fastapi():
+def start_fastapi(reload: bool) -> subprocess.Popen:
     """Starts the FastAPI application using uvicorn."""
-    process = subprocess.Popen(
-        [
-            sys.executable,
-            "-m",
-            "uvicorn",
-            "base.api-wrapper:app",
-            "--log-level",
-            "warning",
-            "--reload",
-        ],
-        stdout=sys.stdout,
-        stderr=sys.stderr,
-    )
-    # Wait for the subprocess to complete, but handle the interrupt gracefully.
-    try:
-        process.wait()
-    except KeyboardInterrupt:
-        print("FastAPI process interrupted, terminating uvicorn.")
-        process.terminate()
-        process.wait()  # Wait for termination to complete
+    command = [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "base.api-wrapper:app",
+        "--log-level",
+        "warning",
+    ]
+    if reload:
+        # Development only: the file watcher is an extra process to start.
+        command.append("--reload")
+    return subprocess.Popen(command, stdout=sys.stdout, stderr=sys.stderr)
 
 
-def run_discord_bot():
+def start_discord_bot(env: dict | None = None) -> subprocess.Popen:
     """Starts the Discord bot."""
-    process = subprocess.Popen(
+    return subprocess.Popen(
         [sys.executable, "base/bot.py"],
         stdout=sys.stdout,
         stderr=sys.stderr,
+        env=env,
     )
-    # Wait for the subprocess to complete, but handle the interrupt gracefully.
-    try:
-        process.wait()
-    except KeyboardInterrupt:
-        print("Discord bot process interrupted, terminating bot.")
-        process.terminate()
-        process.wait()  # Wait for termination to complete
 
 
-if __name__ == "__main__":
-    # Set the start method to 'spawn' for better cross-platform compatibility
-    # and to avoid issues with inherited resources.
-    multiprocessing.set_start_method("spawn", force=True)
+def start_discord_bots(settings: Settings) -> dict[str, subprocess.Popen]:
+    """Starts one bot process, or BOT_PROCESSES of them with a shard range each."""
+    if settings.bot_processes == 1:
+        return {"Discord bot": start_discord_bot()}
+
+    # Only needed for multi-process sharding, so imported here.
+    from tools import sharding
 
-    api_process = multiprocessing.Process(target=run_fastapi)
-    bot_process = multiprocessing.Process(target=run_discord_bot)
+    shard_count = settings.bot_shard_count
+    if not shard_count:
+        # Every process must agree on the total, so ask Discord once up front.
+        shard_count = sharding.recommended_shard_count(settings.discord_token)
+    processes = min(settings.bot_processes, shard_count)
 
-    api_process.start()
-    bot_process.start()
+    bots = {}
+    for index in range(processes):
+        shard_ids = sharding.shard_ids_for(index, processes, shard_count)
+        env = {
+            **os.environ,
+            "BOT_SHARDING": "true",
+            "BOT_SHARD_COUNT": str(shard_count),
+            "BOT_SHARD_IDS": ",".join(map(str, shard_ids)),
+        }
+        name = f"Discord bot (shards {shard_ids[0]}-{shard_ids[-1]} of {shard_count})"
+        bots[name] = start_discord_bot(env)
+    return bots
+
+
+if __name__ == "__main__":
+    # Both services are started straight away as their own interpreters; a
+    # wrapper process per service would only add another interpreter start.
+    settings = get_settings()
+    services = {
+        "FastAPI": start_fastapi(settings.api_reload),
+        **start_discord_bots(settings),
+    }
+
+    # Imported after the services are launched so Rich does not delay them.
+    from tools.logging_config import setup_logging
 
     setup_logging()
 
     try:
-        api_process.join()
-        bot_process.join()
+        for process in services.values():
+            process.wait()
     except KeyboardInterrupt:
         print("\n--- Shutting down services ---")
 
-        if api_process.pid:
-            os.kill(api_process.pid, signal.SIGINT)
-        if bot_process.pid:
-            os.kill(bot_process.pid, signal.SIGINT)
-
-        api_process.join(timeout=5)
-        bot_process.join(timeout=5)
+        for process in services.values():
+            if process.poll() is None:
+                os.kill(process.pid, signal.SIGINT)
 
-        if api_process.is_alive():
-            api_process.terminate()
-        if bot_process.is_alive():
-            bot_process.terminate()
+        for name, process in services.items():
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                print(f"{name} did not stop, terminating it.")
+                process.terminate()
+                process.wait()
 
         print("--- Services stopped ---")
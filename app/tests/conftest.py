@@ -0,0 +1,56 @@
+import importlib
+import os
+import sys
+import time
+
+import pytest
+
+# --- Path Setup ---
+app_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, app_root)
+
+
+class FakeClock:
+    """Stands in for time.monotonic so tests can move time forward."""
+
+    def __init__(self, start: float = 1000.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    fake = FakeClock()
+    monkeypatch.setattr(time, "monotonic", fake)
+    return fake
+
+
+@pytest.fixture
+def memory_db():
+    """The benchmarks' in-memory stand-in, installed over tools.vector_db."""
+    from benchmarks.stubs import InMemoryVectorDB
+    from tools import vector_db
+
+    saved = dict(vars(vector_db))
+    store = InMemoryVectorDB()
+    store.install(vector_db)
+    yield store
+    vars(vector_db).update(saved)
+
+
+@pytest.fixture
+def api(memory_db):
+    """The API wrapper module, reading from `memory_db`."""
+    return importlib.import_module("base.api-wrapper")
+
+
+@pytest.fixture
+def client(api):
+    from fastapi.testclient import TestClient
+
+    return TestClient(api.app)
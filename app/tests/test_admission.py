@@ -0,0 +1,127 @@
+import itertools
+
+import pytest
+from tools.admission import AdmissionController, Overloaded
+from tools.deadline import DeadlineExceeded, RequestCancelled
+
+
+def warmed_up(concurrency: int, service_time: float) -> AdmissionController:
+    controller = AdmissionController("test", concurrency, min_samples=3)
+    for _ in range(3):
+        controller.admit(1000)
+        controller.release(service_time)
+    return controller
+
+
+def in_flight(controller: AdmissionController) -> int:
+    return controller.estimate()["in_flight"]
+
+
+def test_nothing_is_shed_before_enough_samples():
+    controller = AdmissionController("test", 1, min_samples=3)
+    for _ in range(5):
+        assert controller.admit(0.001) == 0.0
+    assert in_flight(controller) == 5
+
+
+def test_wait_grows_with_the_requests_ahead():
+    controller = warmed_up(concurrency=2, service_time=10)
+
+    assert controller.admit(100) == 0.0
+    assert controller.admit(100) == 0.0
+    # Both places are taken: one request ahead, served at 2 per 10s.
+    assert controller.estimate()["estimated_wait"] == 5.0
+    assert controller.admit(100) == 5.0
+    assert controller.estimate() == {
+        "in_flight": 3,
+        "concurrency": 2,
+        "estimated_wait": 10.0,
+        "service_time": 10,
+    }
+
+
+def test_sheds_requests_that_would_outlast_their_budget():
+    controller = warmed_up(concurrency=2, service_time=10)
+    controller.admit(100)
+    controller.admit(100)
+
+    with pytest.raises(Overloaded) as raised:
+        controller.admit(12)
+
+    assert raised.value.ahead == 2
+    assert raised.value.estimated_wait == 5.0
+    assert raised.value.retry_after == 3.0
+    assert in_flight(controller) == 2
+
+
+def test_release_without_a_service_time_is_not_sampled():
+    controller = warmed_up(concurrency=1, service_time=10)
+    for _ in range(5):
+        controller.admit(100)
+        controller.release()
+
+    assert controller.estimate()["service_time"] == 10
+    assert in_flight(controller) == 0
+
+
+# --- /generate ---
+usernames = (f"user{n}" for n in itertools.count())
+
+
+@pytest.fixture
+def controller(api, monkeypatch) -> AdmissionController:
+    controller = AdmissionController("test", 1, min_samples=1)
+    monkeypatch.setattr(api, "ADMISSION_CONTROL", True)
+    monkeypatch.setattr(api, "admission_controller", controller)
+    monkeypatch.setattr(api, "process_and_save_background", lambda *args: None)
+    return controller
+
+
+def generate(client):
+    return client.post("/generate", json={"prompt": "hi", "username": next(usernames)})
+
+
+def test_answered_request_gives_back_its_place(client, api, controller, monkeypatch):
+    monkeypatch.setattr(api, "_answer_prompt", lambda *args: ("hello", None))
+
+    assert generate(client).status_code == 200
+    assert in_flight(controller) == 0
+    assert controller.estimate()["service_time"] is not None
+
+
+@pytest.mark.parametrize(
+    "error, status",
+    [
+        (RuntimeError("boom"), 500),
+        (DeadlineExceeded("no time left"), 504),
+        (RequestCancelled("client went away"), 499),
+    ],
+)
+def test_failed_request_gives_back_its_place(
+    client, api, controller, monkeypatch, error, status
+):
+    def answer(*args):
+        raise error
+
+    monkeypatch.setattr(api, "_answer_prompt", answer)
+
+    assert generate(client).status_code == status
+    assert in_flight(controller) == 0
+
+
+def test_shed_request_is_answered_503(client, api, controller):
+    controller.admit(1000)
+    controller.release(100)
+    controller.admit(1000)
+
+    response = client.post(
+        "/generate",
+        json={"prompt": "hi", "username": next(usernames)},
+        headers={"X-Request-Timeout": "30"},
+    )
+
+    assert response.status_code == 503
+    # 100s of waiting and 100s of service against what is left of 30s.
+    assert int(response.headers["Retry-After"]) in (170, 171)
+    assert response.json()["detail"]["queue_depth"] == 1
+    assert in_flight(controller) == 1
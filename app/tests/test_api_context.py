@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+
+UPDATED = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+def test_context_carries_an_etag(client, memory_db):
+    memory_db.profiles["alice"] = ("Likes cats.", UPDATED)
+
+    response = client.get("/context/alice")
+
+    assert response.status_code == 200
+    assert response.json() == {"username": "alice", "context": "Likes cats."}
+    assert response.headers["ETag"].startswith('"')
+
+
+def test_unknown_user_is_not_found(client):
+    assert client.get("/context/nobody").status_code == 404
+
+
+def test_matching_if_none_match_is_not_modified(client, memory_db):
+    memory_db.profiles["alice"] = ("Likes cats.", UPDATED)
+    etag = client.get("/context/alice").headers["ETag"]
+
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = client.get("/context/alice", headers={"If-None-Match": header})
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["ETag"] == etag
+
+
+def test_etag_changes_when_the_profile_is_updated(client, memory_db):
+    memory_db.profiles["alice"] = ("Likes cats.", UPDATED)
+    old_etag = client.get("/context/alice").headers["ETag"]
+    memory_db.profiles["alice"] = ("Likes dogs now.", UPDATED + timedelta(hours=1))
+
+    response = client.get("/context/alice", headers={"If-None-Match": old_etag})
+
+    assert response.status_code == 200
+    assert response.json()["context"] == "Likes dogs now."
+    assert response.headers["ETag"] != old_etag
+
+
+def test_contexts_lists_profiles_and_missing_users(client, memory_db):
+    memory_db.profiles["alice"] = ("Likes cats.", UPDATED)
+    etag = client.get("/context/alice").headers["ETag"]
+
+    response = client.get(
+        "/contexts", params=[("username", "alice"), ("username", "bob")]
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "contexts": {"alice": {"context": "Likes cats.", "etag": etag}},
+        "missing": ["bob"],
+    }
+
+
+def test_contexts_accepts_at_most_100_usernames(client):
+    usernames = [("username", f"user{n}") for n in range(101)]
+
+    assert client.get("/contexts", params=usernames[:100]).status_code == 200
+    response = client.get("/contexts", params=usernames)
+    assert response.status_code == 400
+    assert "100" in response.json()["detail"]
@@ -0,0 +1,44 @@
+import json
+
+import pytest
+
+ROWS = [
+    {"id": 1, "username": "alice", "prompt": "hi", "response": "hello"},
+    {"id": 2, "username": "bob", "prompt": "hey", "response": "hi bob"},
+]
+
+
+@pytest.fixture
+def history(api, monkeypatch):
+    """Serves ROWS from `iter_chat_history` and records how it was called."""
+    calls = []
+
+    def iter_chat_history(**kwargs):
+        calls.append(kwargs)
+        yield from ROWS
+
+    monkeypatch.setattr(api.vector_db, "iter_chat_history", iter_chat_history)
+    return calls
+
+
+def test_export_is_disabled_by_default(client, api, history):
+    assert not api.HISTORY_EXPORT_ENABLED
+
+    response = client.get("/history")
+
+    assert response.status_code == 404
+    assert history == []
+
+
+def test_enabled_export_streams_ndjson(client, api, history, monkeypatch):
+    monkeypatch.setattr(api, "HISTORY_EXPORT_ENABLED", True)
+
+    response = client.get("/history?username=alice&after_id=5&limit=10")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert [json.loads(line) for line in response.text.splitlines()] == ROWS
+    assert history[0]["username"] == "alice"
+    assert history[0]["after_id"] == 5
+    assert history[0]["limit"] == 10
+    assert history[0]["include_embeddings"] is False
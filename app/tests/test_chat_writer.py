@@ -0,0 +1,191 @@
+import contextlib
+import threading
+import time
+
+import pytest
+from tools import chat_writer, metrics, vector_db
+
+
+class FakeConnection:
+    def cursor(self):
+        return contextlib.nullcontext()
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class FakeDatabase:
+    """Records the batches `_insert_chats` is given; `failures` fail first."""
+
+    def __init__(self):
+        self.batches: list[list[str]] = []
+        self.failures = 0
+        self.hold: dict[str, threading.Event] = {}
+        self.entered = threading.Event()
+        self._lock = threading.Lock()
+
+    def insert(self, cur, schema_name: str, chats: list[dict]):
+        prompts = [chat["prompt"] for chat in chats]
+        gate = self.hold.get(prompts[0])
+        if gate is not None:
+            self.entered.set()
+            gate.wait(5)
+        with self._lock:
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("database is down")
+            self.batches.append(prompts)
+
+
+@pytest.fixture
+def db(monkeypatch) -> FakeDatabase:
+    fake = FakeDatabase()
+    monkeypatch.setattr(vector_db, "get_db_connection", FakeConnection)
+    monkeypatch.setattr(vector_db, "_insert_chats", fake.insert)
+    return fake
+
+
+@pytest.fixture
+def sleeps(monkeypatch) -> list[float]:
+    """Backoff sleeps between retries, recorded instead of slept."""
+    recorded: list[float] = []
+    monkeypatch.setattr(chat_writer.time, "sleep", recorded.append)
+    return recorded
+
+
+@pytest.fixture
+def make_buffer():
+    buffers = []
+
+    def make(**kwargs) -> chat_writer.ChatWriteBuffer:
+        buffer = chat_writer.ChatWriteBuffer(**kwargs)
+        buffers.append(buffer)
+        return buffer
+
+    yield make
+    for buffer in buffers:
+        buffer.close(timeout=5)
+
+
+def chat(prompt: str) -> dict:
+    return {"username": "alice", "prompt": prompt, "response": "hi"}
+
+
+def wait_for(condition, timeout: float = 5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        threading.Event().wait(0.01)
+
+
+def test_flushes_a_full_batch_without_waiting(db, make_buffer):
+    buffer = make_buffer(batch_size=3, flush_interval=1, max_buffered=100)
+    for prompt in "abcd":
+        buffer.submit(chat(prompt))
+
+    wait_for(lambda: db.batches, timeout=0.5)
+    assert db.batches[0] == ["a", "b", "c"]
+
+
+def test_flushes_a_partial_batch_after_the_interval(db, make_buffer):
+    buffer = make_buffer(batch_size=100, flush_interval=0.05, max_buffered=100)
+    buffer.submit(chat("a"))
+    buffer.submit(chat("b"))
+
+    wait_for(lambda: db.batches)
+    assert db.batches == [["a", "b"]]
+
+
+def test_flush_waits_for_everything_submitted(db, make_buffer):
+    buffer = make_buffer(batch_size=100, flush_interval=1, max_buffered=100)
+    buffer.submit(chat("a"))
+
+    assert buffer.flush(timeout=5)
+    assert db.batches == [["a"]]
+
+
+def test_writes_directly_when_the_buffer_is_full(db, make_buffer):
+    db.hold["a"] = threading.Event()
+    direct = metrics.get_counter("chat_writer.direct_writes")
+    buffer = make_buffer(batch_size=1, flush_interval=1, max_buffered=1)
+    buffer.submit(chat("a"))
+    db.entered.wait(5)
+
+    buffer.submit(chat("b"))  # Waits in the buffer behind "a".
+    buffer.submit(chat("c"))  # No room left, written by the caller.
+
+    assert db.batches == [["c"]]
+    assert metrics.get_counter("chat_writer.direct_writes") == direct + 1
+    db.hold["a"].set()
+    assert buffer.flush(timeout=5)
+    assert db.batches == [["c"], ["a"], ["b"]]
+
+
+def test_retries_a_failed_batch(db, sleeps, make_buffer, monkeypatch):
+    monkeypatch.setattr(chat_writer, "CHAT_WRITE_RETRIES", 3)
+    db.failures = 2
+    buffer = make_buffer(batch_size=100, flush_interval=1, max_buffered=100)
+    buffer.submit(chat("a"))
+
+    assert buffer.flush(timeout=5)
+    assert db.batches == [["a"]]
+    assert sleeps == [1, 2]
+
+
+def test_drops_a_batch_after_the_last_retry(db, sleeps, make_buffer, monkeypatch):
+    monkeypatch.setattr(chat_writer, "CHAT_WRITE_RETRIES", 2)
+    dropped = metrics.get_counter("chat_writer.rows_dropped")
+    db.failures = 3
+    buffer = make_buffer(batch_size=100, flush_interval=1, max_buffered=100)
+    buffer.submit(chat("a"))
+    buffer.submit(chat("b"))
+
+    assert buffer.flush(timeout=5)
+    assert db.batches == []
+    assert sleeps == [1, 2]
+    assert metrics.get_counter("chat_writer.rows_dropped") == dropped + 2
+
+    # The writer carries on with the next batch.
+    buffer.submit(chat("c"))
+    assert buffer.flush(timeout=5)
+    assert db.batches == [["c"]]
+
+
+def test_close_writes_what_is_still_buffered(db, make_buffer):
+    buffer = make_buffer(batch_size=100, flush_interval=0.2, max_buffered=100)
+    for prompt in "abc":
+        buffer.submit(chat(prompt))
+
+    buffer.close(timeout=5)
+
+    assert db.batches == [["a", "b", "c"]]
+    assert not buffer._thread.is_alive()
+
+
+def test_shutdown_flushes_the_module_writer(db, monkeypatch):
+    monkeypatch.setattr(chat_writer, "CHAT_WRITE_BEHIND", True)
+    writer = chat_writer.ChatWriteBuffer(batch_size=100, flush_interval=0.2)
+    monkeypatch.setattr(chat_writer, "_writer", writer)
+    chat_writer.save_chat("alice", "a", "hi", [0.0], [0.0])
+
+    chat_writer.shutdown()
+
+    assert db.batches == [["a"]]
+    assert chat_writer._writer is None
+    assert not writer._thread.is_alive()
+
+
+def test_flush_gives_up_when_the_writer_has_stopped(db, make_buffer):
+    buffer = make_buffer(batch_size=100, flush_interval=0.05, max_buffered=1)
+    buffer.close(timeout=5)
+    buffer.submit(chat("a"))  # Nobody drains the buffer any more.
+
+    started = time.monotonic()
+    assert not buffer.flush(timeout=0.2)
+    assert time.monotonic() - started < 2
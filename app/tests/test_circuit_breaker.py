@@ -0,0 +1,123 @@
+import pytest
+import requests
+from tools.circuit_breaker import (
+    CLOSED,
+    HALF_OPEN,
+    OPEN,
+    CircuitBreaker,
+    CircuitOpen,
+    is_failure,
+)
+from tools.deadline import DeadlineExceeded, RequestCancelled
+
+
+def http_error(status: int | None) -> requests.exceptions.HTTPError:
+    if status is None:
+        return requests.exceptions.HTTPError("no response")
+    response = requests.Response()
+    response.status_code = status
+    return requests.exceptions.HTTPError(f"{status}", response=response)
+
+
+@pytest.mark.parametrize(
+    "error, expected",
+    [
+        (http_error(500), True),
+        (http_error(503), True),
+        (http_error(None), True),
+        (http_error(400), False),
+        (http_error(404), False),
+        (http_error(429), False),
+        (requests.exceptions.ConnectionError(), True),
+        (requests.exceptions.ReadTimeout(), True),
+        (requests.exceptions.ConnectTimeout(), True),
+        (TimeoutError(), True),
+        (DeadlineExceeded("no time left"), False),
+        (RequestCancelled("client went away"), False),
+        (ValueError("bad json"), False),
+    ],
+)
+def test_is_failure(error, expected):
+    assert is_failure(error) is expected
+
+
+def fail(breaker: CircuitBreaker, error: BaseException):
+    with pytest.raises(type(error)):
+        with breaker.guard():
+            raise error
+
+
+def succeed(breaker: CircuitBreaker):
+    with breaker.guard():
+        pass
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+    for _ in range(2):
+        fail(breaker, requests.exceptions.ConnectionError())
+    assert breaker.state == CLOSED
+
+    fail(breaker, requests.exceptions.ConnectionError())
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen) as raised:
+        succeed(breaker)
+    assert raised.value.retry_after == pytest.approx(30)
+
+
+def test_success_resets_the_failure_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+    fail(breaker, requests.exceptions.ConnectionError())
+    succeed(breaker)
+    fail(breaker, requests.exceptions.ConnectionError())
+
+    assert breaker.state == CLOSED
+    assert breaker.stats()["consecutive_failures"] == 1
+
+
+def test_caller_errors_do_not_count(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    fail(breaker, http_error(404))
+    fail(breaker, DeadlineExceeded("no time left"))
+    fail(breaker, ValueError("bad json"))
+
+    assert breaker.state == CLOSED
+    assert breaker.stats()["consecutive_failures"] == 0
+
+
+def test_half_open_trial_closes_the_breaker(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    fail(breaker, requests.exceptions.ConnectionError())
+    clock.advance(29)
+    assert breaker.retry_after() == pytest.approx(1)
+
+    clock.advance(1)
+    with breaker.guard():
+        assert breaker.state == HALF_OPEN
+        # Only one trial call at a time.
+        with pytest.raises(CircuitOpen):
+            succeed(breaker)
+    assert breaker.state == CLOSED
+    assert breaker.retry_after() is None
+
+
+def test_failed_trial_reopens_the_breaker(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        fail(breaker, requests.exceptions.ConnectionError())
+    clock.advance(30)
+
+    fail(breaker, requests.exceptions.ReadTimeout())
+    assert breaker.state == OPEN
+    assert breaker.retry_after() == pytest.approx(30)
+
+
+def test_trial_ending_in_a_caller_error_allows_another_trial(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    fail(breaker, requests.exceptions.ConnectionError())
+    clock.advance(30)
+
+    fail(breaker, DeadlineExceeded("no time left"))
+    assert breaker.state == HALF_OPEN
+    succeed(breaker)
+    assert breaker.state == CLOSED
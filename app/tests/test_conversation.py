@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+
+import pytest
+from tools import conversation
+
+
+@pytest.fixture(autouse=True)
+def empty_buffers(monkeypatch):
+    monkeypatch.setattr(conversation, "CONVERSATION_TURNS", 3)
+    monkeypatch.setattr(conversation, "CONVERSATION_MAX_CHANNELS", 2)
+    monkeypatch.setattr(conversation, "CONVERSATION_MAX_CHARS", 20)
+    monkeypatch.setattr(conversation, "CONVERSATION_MAX_AGE_SECONDS", 3600)
+    conversation.clear()
+    yield
+    conversation.clear()
+
+
+def prompts(channel_id: str) -> list[str]:
+    return [turn.prompt for turn in conversation.recent(channel_id)]
+
+
+def test_keeps_the_latest_turns_oldest_first():
+    for n in range(5):
+        conversation.record("c1", "alice", f"prompt {n}", f"answer {n}")
+
+    assert prompts("c1") == ["prompt 2", "prompt 3", "prompt 4"]
+
+
+def test_channels_are_kept_apart():
+    conversation.record("c1", "alice", "in c1", "ok")
+    conversation.record("c2", "bob", "in c2", "ok")
+
+    assert prompts("c1") == ["in c1"]
+    assert prompts("c2") == ["in c2"]
+    assert prompts("c3") == []
+
+
+def test_evicts_the_idlest_channel():
+    conversation.record("c1", "alice", "one", "ok")
+    conversation.record("c2", "bob", "two", "ok")
+    # Reading c1 makes c2 the idlest channel.
+    conversation.recent("c1")
+
+    conversation.record("c3", "carol", "three", "ok")
+
+    assert prompts("c1") == ["one"]
+    assert prompts("c2") == []
+    assert prompts("c3") == ["three"]
+
+
+def test_clips_long_prompts_and_responses():
+    conversation.record("c1", "alice", "x" * 50, "y" * 20)
+
+    turn = conversation.recent("c1")[0]
+    assert turn.prompt == "x" * 17 + "..."
+    assert turn.response == "y" * 20
+
+
+def test_leaves_out_turns_past_the_age_limit():
+    now = datetime.now(timezone.utc).timestamp()
+    conversation.record("c1", "alice", "stale", "ok", timestamp=now - 3601)
+    conversation.record("c1", "alice", "fresh", "ok", timestamp=now - 60)
+
+    assert prompts("c1") == ["fresh"]
+
+
+def test_ignores_turns_without_a_channel():
+    conversation.record(None, "alice", "direct message", "ok")
+
+    assert conversation.recent(None) == []
+
+
+def test_format_turns():
+    conversation.record("c1", "alice", "hi", "hello alice")
+
+    assert conversation.format_turns(conversation.recent("c1")) == (
+        "alice: hi\nOswald: hello alice"
+    )
+
+
+def test_warm_up_fills_the_buffers_in_order():
+    now = datetime.now(timezone.utc)
+    conversation.warm_up(
+        [
+            ("c1", "alice", "first", "ok", now),
+            ("c2", "bob", "other", "ok", now),
+            ("c1", "alice", "second", "ok", now),
+        ]
+    )
+
+    assert prompts("c1") == ["first", "second"]
+    assert prompts("c2") == ["other"]
@@ -0,0 +1,134 @@
+import pytest
+import requests
+from tools.circuit_breaker import CLOSED, OPEN, CircuitBreaker
+from tools.deadline import (
+    REQUEST_DEFAULT_TIMEOUT,
+    Deadline,
+    DeadlineExceeded,
+    RequestCancelled,
+    bounded,
+)
+
+
+def test_from_header():
+    assert Deadline.from_header("12.5").budget == 12.5
+    assert Deadline.from_header(None).budget == REQUEST_DEFAULT_TIMEOUT
+    assert Deadline.from_header("soon").budget == REQUEST_DEFAULT_TIMEOUT
+    assert Deadline.from_header("-3").budget == 0.0
+
+
+def test_timeout_is_capped_and_keeps_the_reserve(clock):
+    deadline = Deadline(30)
+
+    assert deadline.timeout(60) == 30
+    assert deadline.timeout(10) == 10
+    assert deadline.timeout(60, reserve=20) == 10
+    clock.advance(25)
+    assert deadline.timeout(60) == 5
+
+
+def test_timeout_raises_when_the_reserve_uses_up_the_budget(clock):
+    deadline = Deadline(30)
+    clock.advance(10)
+
+    with pytest.raises(DeadlineExceeded, match="search"):
+        deadline.timeout(60, reserve=20, stage="search")
+
+
+def test_check(clock):
+    deadline = Deadline(5)
+    deadline.check("intent")
+
+    clock.advance(5)
+    with pytest.raises(DeadlineExceeded):
+        deadline.check("intent")
+
+
+def test_cancelled_deadline_raises_request_cancelled(clock):
+    deadline = Deadline(30)
+    deadline.cancel()
+
+    with pytest.raises(RequestCancelled):
+        deadline.timeout(60)
+
+
+# --- bounded() ---
+def call(clock, deadline, timeout, cap, elapsed, error):
+    """An upstream call made with `timeout` that fails after `elapsed` seconds."""
+    with bounded(deadline, timeout, cap, "generate"):
+        clock.advance(elapsed)
+        raise error
+
+
+def test_timeout_cut_by_the_deadline_becomes_deadline_exceeded(clock):
+    with pytest.raises(DeadlineExceeded, match="generate"):
+        call(clock, Deadline(5), 5, 60, 5, requests.exceptions.ReadTimeout())
+
+
+def test_timeout_at_the_full_cap_is_raised_as_is(clock):
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        call(clock, Deadline(90), 60, 60, 60, requests.exceptions.ReadTimeout())
+
+
+def test_quick_failure_is_raised_as_is(clock):
+    with pytest.raises(requests.exceptions.ConnectionError):
+        call(clock, Deadline(5), 5, 60, 0.1, requests.exceptions.ConnectionError())
+
+
+def test_without_a_deadline_errors_are_raised_as_is(clock):
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        call(clock, None, 5, 60, 5, requests.exceptions.ReadTimeout())
+
+
+def test_other_errors_pass_through(clock):
+    with pytest.raises(ValueError):
+        call(clock, Deadline(5), 5, 60, 5, ValueError("bad json"))
+
+
+# --- Deadline and circuit breaker ---
+def guarded_call(clock, breaker, deadline, cap, elapsed, error):
+    """A call as the pipeline makes it: the breaker outside, bounded() inside."""
+    timeout = deadline.timeout(cap) if deadline else cap
+    with breaker.guard(), bounded(deadline, timeout, cap, "generate"):
+        clock.advance(elapsed)
+        raise error
+
+
+def test_deadline_limited_timeouts_do_not_open_the_breaker(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+
+    for _ in range(5):
+        deadline = Deadline(3)
+        with pytest.raises(DeadlineExceeded):
+            guarded_call(
+                clock, breaker, deadline, 60, 3, requests.exceptions.ReadTimeout()
+            )
+
+    assert breaker.state == CLOSED
+    assert breaker.stats()["consecutive_failures"] == 0
+
+
+def test_timeouts_at_the_full_cap_open_the_breaker(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+
+    for _ in range(2):
+        deadline = Deadline(90)
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            guarded_call(
+                clock, breaker, deadline, 60, 60, requests.exceptions.ReadTimeout()
+            )
+
+    assert breaker.state == OPEN
+
+
+def test_quick_failures_under_a_deadline_open_the_breaker(clock):
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=30)
+
+    for _ in range(2):
+        deadline = Deadline(3)
+        with pytest.raises(requests.exceptions.ConnectionError):
+            guarded_call(
+                clock, breaker, deadline, 60, 0.1, requests.exceptions.ConnectionError()
+            )
+
+    assert breaker.state == OPEN
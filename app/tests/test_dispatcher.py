@@ -0,0 +1,147 @@
+import threading
+import time
+
+import pytest
+from tools import metrics
+from tools.deadline import Deadline, DeadlineExceeded
+from tools.dispatcher import BACKGROUND, INTERACTIVE, PriorityDispatcher
+
+
+def wait_for(condition, timeout: float = 5.0):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, "timed out"
+        time.sleep(0.01)
+
+
+class Call(threading.Thread):
+    """A call holding a dispatcher slot until `release()`."""
+
+    def __init__(self, dispatcher, lane, started: list | None = None, **kwargs):
+        super().__init__(daemon=True)
+        self.dispatcher, self.lane, self.kwargs = dispatcher, lane, kwargs
+        self.started = started if started is not None else []
+        self.running = threading.Event()
+        self.done = threading.Event()
+        self.error = None
+        self._release = threading.Event()
+
+    def run(self):
+        try:
+            with self.dispatcher.slot(self.lane, **self.kwargs):
+                self.started.append(self.lane)
+                self.running.set()
+                self._release.wait(5)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done.set()
+
+    def release(self):
+        self._release.set()
+        self.done.wait(5)
+
+
+def waiting(dispatcher, lane: str) -> int:
+    return dispatcher.stats()["waiting"][lane]
+
+
+def running(dispatcher, lane: str) -> int:
+    return dispatcher.stats()["running"][lane]
+
+
+@pytest.fixture
+def calls():
+    started = []
+    yield started
+    for thread in threading.enumerate():
+        if isinstance(thread, Call):
+            thread.release()
+
+
+def test_interactive_calls_go_first(calls):
+    dispatcher = PriorityDispatcher("test", 1, 1, max_defer=60)
+    holder = Call(dispatcher, INTERACTIVE)
+    holder.start()
+    holder.running.wait(5)
+
+    background = Call(dispatcher, BACKGROUND, calls)
+    background.start()
+    wait_for(lambda: waiting(dispatcher, BACKGROUND) == 1)
+    interactive = Call(dispatcher, INTERACTIVE, calls)
+    interactive.start()
+    wait_for(lambda: waiting(dispatcher, INTERACTIVE) == 1)
+
+    calls.clear()
+    holder.release()
+    interactive.running.wait(5)
+    assert calls == [INTERACTIVE]
+    assert not background.running.is_set()
+
+    interactive.release()
+    background.running.wait(5)
+    assert calls == [INTERACTIVE, BACKGROUND]
+
+
+def test_background_calls_keep_to_their_slots(calls):
+    dispatcher = PriorityDispatcher("test", 3, 1, max_defer=60)
+    first = Call(dispatcher, BACKGROUND)
+    first.start()
+    first.running.wait(5)
+
+    second = Call(dispatcher, BACKGROUND)
+    second.start()
+    wait_for(lambda: waiting(dispatcher, BACKGROUND) == 1)
+
+    # The free slots still serve users.
+    with dispatcher.slot(INTERACTIVE):
+        assert running(dispatcher, INTERACTIVE) == 1
+        assert running(dispatcher, BACKGROUND) == 1
+
+    first.release()
+    assert second.running.wait(5)
+
+
+def test_slots_are_shared_by_both_lanes(calls):
+    dispatcher = PriorityDispatcher("test", 2, 1, max_defer=60)
+    holders = [Call(dispatcher, BACKGROUND), Call(dispatcher, INTERACTIVE)]
+    for holder in holders:
+        holder.start()
+        holder.running.wait(5)
+
+    blocked = Call(dispatcher, INTERACTIVE)
+    blocked.start()
+    wait_for(lambda: waiting(dispatcher, INTERACTIVE) == 1)
+    assert not blocked.running.is_set()
+
+    holders[0].release()
+    assert blocked.running.wait(5)
+
+
+def test_background_call_is_let_in_after_max_defer(calls):
+    dispatcher = PriorityDispatcher("test", 2, 1, max_defer=0.2)
+    forced = metrics.get_counter("test.background.forced")
+    # As if a user's call had been queued and not yet picked up.
+    with dispatcher._cond:
+        dispatcher._waiting[INTERACTIVE] += 1
+
+    background = Call(dispatcher, BACKGROUND)
+    background.start()
+    assert not background.running.wait(0.1)
+    assert background.running.wait(5)
+    assert metrics.get_counter("test.background.forced") == forced + 1
+
+
+def test_queued_call_gives_up_at_its_deadline(calls):
+    dispatcher = PriorityDispatcher("test", 1, 1, max_defer=60)
+    holder = Call(dispatcher, INTERACTIVE)
+    holder.start()
+    holder.running.wait(5)
+
+    late = Call(dispatcher, INTERACTIVE, deadline=Deadline(0.1))
+    late.start()
+
+    assert late.done.wait(5)
+    assert isinstance(late.error, DeadlineExceeded)
+    assert waiting(dispatcher, INTERACTIVE) == 0
+    assert running(dispatcher, INTERACTIVE) == 1
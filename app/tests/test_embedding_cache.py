@@ -0,0 +1,216 @@
+import json
+
+import numpy as np
+import pytest
+import requests
+from tools import embedding_cache
+from tools.deadline import Deadline, DeadlineExceeded
+
+MODEL = "nomic-embed-text:v1.5"
+
+
+def response(status: int, body: dict) -> requests.Response:
+    r = requests.Response()
+    r.status_code = status
+    r._content = json.dumps(body).encode()
+    return r
+
+
+def vector_for(text: str) -> list[float]:
+    return [float(len(text)), 1.0]
+
+
+class FakeOllama:
+    """Answers the embedding endpoints in place of `requests.post`."""
+
+    def __init__(self):
+        self.calls: list[tuple[str, list[str]]] = []
+        self.timeouts: list[float] = []
+        self.batch = True  # False answers /api/embed with 404, as older servers do
+
+    def post(self, url: str, json: dict, timeout: float):
+        self.timeouts.append(timeout)
+        if url.endswith("/api/embed"):
+            self.calls.append(("embed", json["input"]))
+            if not self.batch:
+                return response(404, {"error": "404 page not found"})
+            return response(
+                200, {"embeddings": [vector_for(text) for text in json["input"]]}
+            )
+        self.calls.append(("embeddings", [json["prompt"]]))
+        return response(200, {"embedding": vector_for(json["prompt"])})
+
+    def texts(self) -> list[str]:
+        return [text for _, texts in self.calls for text in texts]
+
+
+class FakeTable:
+    """Stands in for the embeddings table in tools.vector_db."""
+
+    def __init__(self):
+        self.rows: dict[str, np.ndarray] = {}
+
+    def get_embeddings_by_hash(self, keys: list[str]) -> dict[str, np.ndarray]:
+        return {key: self.rows[key] for key in keys if key in self.rows}
+
+    def save_embeddings(self, rows: list[tuple[str, str, object]]):
+        for key, _, vector in rows:
+            self.rows[key] = vector
+
+
+@pytest.fixture
+def ollama(monkeypatch) -> FakeOllama:
+    fake = FakeOllama()
+    monkeypatch.setattr(embedding_cache.requests, "post", fake.post)
+    monkeypatch.setattr(embedding_cache, "OLLAMA_HOST", "http://ollama")
+    monkeypatch.setattr(embedding_cache, "_memory", type(embedding_cache._memory)())
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_TABLE", False)
+    return fake
+
+
+@pytest.fixture
+def table(monkeypatch, ollama) -> FakeTable:
+    fake = FakeTable()
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_TABLE", True)
+    monkeypatch.setattr(
+        embedding_cache.vector_db, "get_embeddings_by_hash", fake.get_embeddings_by_hash
+    )
+    monkeypatch.setattr(
+        embedding_cache.vector_db, "save_embeddings", fake.save_embeddings
+    )
+    return fake
+
+
+def test_misses_are_fetched_once_then_served_from_memory(ollama):
+    first = embedding_cache.get_embeddings(["hello", "world", "hello"], MODEL)
+    second = embedding_cache.get_embeddings(["world", "hello"], MODEL)
+
+    assert sorted(ollama.texts()) == ["hello", "world"]
+    assert [list(v) for v in first] == [[5.0, 1.0], [5.0, 1.0], [5.0, 1.0]]
+    assert [list(v) for v in second] == [[5.0, 1.0], [5.0, 1.0]]
+
+
+def test_misses_are_fetched_in_one_batch(ollama):
+    embedding_cache.get_embeddings(["a"], MODEL)
+    vectors = embedding_cache.get_embeddings(["a", "bb", "ccc"], MODEL)
+
+    assert ollama.calls == [("embeddings", ["a"]), ("embed", ["bb", "ccc"])]
+    assert [v[0] for v in vectors] == [1.0, 2.0, 3.0]
+
+
+def test_falls_back_to_one_call_per_text_without_the_batch_endpoint(ollama):
+    ollama.batch = False
+
+    vectors = embedding_cache.get_embeddings(["a", "bb"], MODEL)
+
+    assert ollama.calls == [
+        ("embed", ["a", "bb"]),
+        ("embeddings", ["a"]),
+        ("embeddings", ["bb"]),
+    ]
+    assert [v[0] for v in vectors] == [1.0, 2.0]
+
+
+def test_trivially_different_text_shares_an_entry(ollama):
+    embedding_cache.get_embeddings(["hello  world"], MODEL)
+    embedding_cache.get_embeddings([" hello world "], MODEL)
+
+    assert len(ollama.calls) == 1
+
+
+def test_another_model_misses(ollama):
+    embedding_cache.get_embeddings(["hello"], MODEL)
+    embedding_cache.get_embeddings(["hello"], "other-model")
+
+    assert ollama.texts() == ["hello", "hello"]
+
+
+def test_memory_tier_evicts_the_least_recently_used(ollama, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_SIZE", 2)
+    embedding_cache.get_embeddings(["a"], MODEL)
+    embedding_cache.get_embeddings(["b"], MODEL)
+    embedding_cache.get_embeddings(["a"], MODEL)
+    embedding_cache.get_embeddings(["c"], MODEL)
+
+    embedding_cache.get_embeddings(["a"], MODEL)
+    embedding_cache.get_embeddings(["b"], MODEL)
+
+    assert ollama.texts() == ["a", "b", "c", "b"]
+
+
+def test_table_tier_is_read_before_ollama(table, ollama):
+    key = embedding_cache.embedding_key(MODEL, "stored")
+    table.rows[key] = np.array([7.0, 7.0], dtype=np.float32)
+
+    vectors = embedding_cache.get_embeddings(["stored", "new"], MODEL)
+
+    assert ollama.texts() == ["new"]
+    assert list(vectors[0]) == [7.0, 7.0]
+    assert embedding_cache.embedding_key(MODEL, "new") in table.rows
+
+
+def test_table_tier_is_skipped_when_disabled(table, ollama, monkeypatch):
+    monkeypatch.setattr(embedding_cache, "EMBEDDING_CACHE_TABLE", False)
+    table.rows[embedding_cache.embedding_key(MODEL, "stored")] = np.zeros(2)
+
+    embedding_cache.get_embeddings(["stored"], MODEL)
+
+    assert ollama.texts() == ["stored"]
+    assert len(table.rows) == 1
+
+
+def test_unpersisted_texts_skip_the_table(table, ollama):
+    table.rows[embedding_cache.embedding_key(MODEL, "stored")] = np.zeros(2)
+
+    embedding_cache.get_embeddings(["stored", "snippet"], MODEL, persist=False)
+
+    assert ollama.texts() == ["stored", "snippet"]
+    assert len(table.rows) == 1
+
+
+def test_a_short_batch_is_an_error(ollama, monkeypatch):
+    def post(url, json, timeout):
+        return response(200, {"embeddings": [vector_for(json["input"][0])]})
+
+    monkeypatch.setattr(embedding_cache.requests, "post", post)
+
+    with pytest.raises(ValueError, match="1 embeddings for 2 texts"):
+        embedding_cache.get_embeddings(["a", "b"], MODEL)
+    assert len(embedding_cache._memory) == 0
+
+
+def test_an_empty_embedding_is_an_error(ollama, monkeypatch):
+    def post(url, json, timeout):
+        return response(200, {"embedding": []})
+
+    monkeypatch.setattr(embedding_cache.requests, "post", post)
+
+    with pytest.raises(ValueError, match="no embedding"):
+        embedding_cache.get_embeddings(["a"], MODEL)
+
+
+def test_calls_are_bounded_by_the_deadline(ollama, clock):
+    embedding_cache.get_embeddings(["a"], MODEL)
+    embedding_cache.get_embeddings(["b", "c"], MODEL, deadline=Deadline(10), reserve=4)
+
+    assert ollama.timeouts == [embedding_cache.EMBED_TIMEOUT, 6]
+
+
+def test_no_call_is_made_without_time_left(ollama, clock):
+    deadline = Deadline(10)
+    clock.advance(7)
+
+    with pytest.raises(DeadlineExceeded):
+        embedding_cache.get_embeddings(["a"], MODEL, deadline=deadline, reserve=4)
+    assert ollama.calls == []
+
+
+def test_ollama_errors_are_raised(ollama, monkeypatch):
+    def post(url, json, timeout):
+        return response(500, {"error": "model crashed"})
+
+    monkeypatch.setattr(embedding_cache.requests, "post", post)
+
+    with pytest.raises(requests.HTTPError):
+        embedding_cache.get_embeddings(["hello"], MODEL)
+    assert len(embedding_cache._memory) == 0
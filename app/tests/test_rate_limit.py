@@ -0,0 +1,125 @@
+import importlib
+
+import pytest
+from tools import rate_limit
+from tools.rate_limit import MemoryBucketStore, RateLimiter, parse_limit
+
+
+@pytest.mark.parametrize(
+    "spec, expected",
+    [
+        ("5/60", (5.0, 5 / 60)),
+        ("20/10", (20.0, 2.0)),
+        ("off", None),
+        (" OFF ", None),
+        ("0/60", None),
+        ("5/0", None),
+        ("five/60", None),
+        ("5", None),
+    ],
+)
+def test_parse_limit(spec, expected):
+    assert parse_limit(spec) == expected
+
+
+def test_bucket_allows_a_burst_then_refills(clock):
+    store = MemoryBucketStore()
+    bucket = [("user:1", 2.0, 1.0)]
+
+    assert store.take(bucket) is None
+    assert store.take(bucket) is None
+    assert store.take(bucket) == pytest.approx(1.0)
+
+    clock.advance(0.5)
+    assert store.take(bucket) == pytest.approx(0.5)
+    clock.advance(0.5)
+    assert store.take(bucket) is None
+
+
+def test_bucket_never_refills_past_capacity(clock):
+    store = MemoryBucketStore()
+    bucket = [("user:1", 2.0, 1.0)]
+    store.take(bucket)
+    clock.advance(100)
+
+    assert store.take(bucket) is None
+    assert store.take(bucket) is None
+    assert store.take(bucket) is not None
+
+
+def test_throttled_take_spends_no_bucket(clock):
+    store = MemoryBucketStore()
+    user, channel = ("user:1", 1.0, 1.0), ("channel:1", 3.0, 1.0)
+    assert store.take([user, channel]) is None
+
+    # The user bucket is empty, so the channel must not pay either.
+    assert store.take([user, channel]) == pytest.approx(1.0)
+    assert store.take([channel]) is None
+    assert store.take([channel]) is None
+    assert store.take([channel]) is not None
+
+
+def test_retry_after_is_the_emptiest_bucket(clock):
+    store = MemoryBucketStore()
+    slow, fast = ("slow", 1.0, 0.1), ("fast", 1.0, 1.0)
+    store.take([slow, fast])
+
+    assert store.take([slow, fast]) == pytest.approx(10.0)
+
+
+def test_limiter_keeps_scopes_and_ids_apart(clock):
+    limiter = RateLimiter("test", {"user": (1.0, 0.1), "channel": (2.0, 0.1)})
+
+    assert limiter.check({"user": 1, "channel": 9}) is None
+    assert limiter.check({"user": 2, "channel": 9}) is None
+    # Another user, but channel 9 has spent both of its tokens.
+    assert limiter.check({"user": 3, "channel": 9}) == pytest.approx(10.0)
+    assert limiter.check({"user": 1, "channel": 8}) == pytest.approx(10.0)
+
+
+def test_limiter_skips_unset_ids_and_unlimited_scopes(clock):
+    limiter = RateLimiter("test", {"user": (1.0, 0.1)})
+    limiter.check({"user": 1})
+
+    assert limiter.check({"user": None, "guild": 5}) is None
+    assert limiter.check({"user": 1, "guild": 5}) is not None
+
+
+def test_limiter_allows_requests_when_the_store_fails():
+    class BrokenStore:
+        def take(self, buckets, cost=1.0):
+            raise ConnectionError("database is down")
+
+    limiter = RateLimiter("test", {"user": (1.0, 0.1)}, BrokenStore())
+
+    assert limiter.check({"user": 1}) is None
+    assert limiter.check({"user": 1}) is None
+
+
+def test_from_env_leaves_out_disabled_scopes(monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_USER", "5/60")
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_CHANNEL", "off")
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_GUILD", "60/30")
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_STORE", "memory")
+
+    limiter = rate_limit.from_env("bot")
+
+    assert limiter.limits == {"user": (5.0, 5 / 60), "guild": (60.0, 2.0)}
+    assert isinstance(limiter.store, rate_limit.MemoryBucketStore)
+
+
+def test_blank_settings_keep_the_defaults(monkeypatch):
+    for scope in ("USER", "CHANNEL", "GUILD", "STORE"):
+        monkeypatch.setenv(f"RATE_LIMIT_{scope}", "")
+    try:
+        importlib.reload(rate_limit)
+        limiter = rate_limit.from_env("bot")
+    finally:
+        monkeypatch.undo()
+        importlib.reload(rate_limit)
+
+    assert limiter.limits == {
+        "user": (5.0, 5 / 60),
+        "channel": (20.0, 20 / 60),
+        "guild": (60.0, 1.0),
+    }
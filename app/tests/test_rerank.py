@@ -0,0 +1,101 @@
+import numpy as np
+import pytest
+from tools import rerank
+from tools.deadline import Deadline, DeadlineExceeded, RequestCancelled
+
+VECTORS = {
+    "prompt": [1.0, 0.0],
+    "close": [0.9, 0.1],
+    "middle": [0.5, 0.5],
+    "far": [0.0, 1.0],
+}
+
+
+def candidate(name: str, content: str = "") -> dict:
+    return {"title": name, "content": content}
+
+
+@pytest.fixture
+def embed(monkeypatch):
+    """Replaces the embedding call with fixed vectors keyed by the first line."""
+    calls = []
+
+    def get_embeddings(texts, model, persist=True, deadline=None, reserve=0.0):
+        calls.append((texts, deadline, reserve))
+        return [np.array(VECTORS[text.split("\n")[0]]) for text in texts]
+
+    monkeypatch.setattr(rerank.embedding_cache, "get_embeddings", get_embeddings)
+    return calls
+
+
+def test_cosine_similarities():
+    matrix = np.array([[2.0, 0.0], [0.0, 3.0], [1.0, 1.0], [0.0, 0.0]])
+
+    scores = rerank.cosine_similarities(np.array([1.0, 0.0]), matrix)
+
+    assert scores == pytest.approx([1.0, 0.0, 2**-0.5, 0.0])
+
+
+def test_selects_the_most_similar_first(embed):
+    candidates = [candidate("far"), candidate("middle"), candidate("close")]
+
+    selected = rerank.select_results("prompt", candidates, 2, 1000)
+
+    assert [r["title"] for r in selected] == ["close", "middle"]
+    assert len(embed) == 1
+
+
+def test_skips_results_over_the_token_budget(embed):
+    candidates = [
+        candidate("close", "x" * 400),
+        candidate("middle", "y" * 20),
+        candidate("far", "z" * 20),
+    ]
+
+    selected = rerank.select_results("prompt", candidates, 5, 50)
+
+    assert [r["title"] for r in selected] == ["middle", "far"]
+
+
+def test_keeps_search_order_when_embedding_fails(monkeypatch):
+    def get_embeddings(*args, **kwargs):
+        raise ConnectionError("ollama is down")
+
+    monkeypatch.setattr(rerank.embedding_cache, "get_embeddings", get_embeddings)
+    candidates = [candidate("far"), candidate("close")]
+
+    assert rerank.select_results("prompt", candidates, 2, 1000) == candidates
+
+
+def test_keeps_search_order_without_time_to_rerank(embed):
+    candidates = [candidate("far"), candidate("middle"), candidate("close")]
+    deadline = Deadline(rerank.RERANK_MIN_SECONDS + 5)
+
+    selected = rerank.select_results("prompt", candidates, 2, 1000, deadline, 5)
+
+    assert [r["title"] for r in selected] == ["far", "middle"]
+    assert embed == []
+
+
+def test_reranks_within_the_deadline(embed):
+    candidates = [candidate("far"), candidate("close")]
+    deadline = Deadline(rerank.RERANK_MIN_SECONDS + 10)
+
+    selected = rerank.select_results("prompt", candidates, 1, 1000, deadline, 5)
+
+    assert [r["title"] for r in selected] == ["close"]
+    assert embed[0][1:] == (deadline, 5)
+
+
+@pytest.mark.parametrize(
+    "error", [DeadlineExceeded("no time left"), RequestCancelled("client went away")]
+)
+def test_deadline_errors_are_not_swallowed(monkeypatch, error):
+    def get_embeddings(*args, **kwargs):
+        raise error
+
+    monkeypatch.setattr(rerank.embedding_cache, "get_embeddings", get_embeddings)
+    candidates = [candidate("far"), candidate("close")]
+
+    with pytest.raises(type(error)):
+        rerank.select_results("prompt", candidates, 2, 1000, Deadline(60))
@@ -0,0 +1,119 @@
+import importlib
+
+import pytest
+import requests
+from tools import routing
+from tools.routing import LARGE, SMALL, Tier
+
+
+@pytest.fixture
+def routed(monkeypatch):
+    monkeypatch.setattr(routing, "MODEL_ROUTING", True)
+    monkeypatch.setattr(routing, "ROUTING_SHORT_PROMPT_CHARS", 20)
+
+
+def test_short_chit_chat_goes_to_the_small_tier(routed):
+    assert routing.choose_tier("hey there", False, False) is SMALL
+
+
+@pytest.mark.parametrize(
+    "prompt, search_needed, has_search_context",
+    [
+        ("what is the news", True, False),
+        ("what is the news", False, True),
+        ("tell me a long story about dragons", False, False),
+    ],
+)
+def test_searches_and_long_prompts_go_to_the_large_tier(
+    routed, prompt, search_needed, has_search_context
+):
+    assert routing.choose_tier(prompt, search_needed, has_search_context) is LARGE
+
+
+def test_a_requested_model_bypasses_routing(routed):
+    tier = routing.choose_tier("hey there", False, False, "mistral:7b")
+
+    assert tier == Tier("requested", "mistral:7b", 0)
+
+
+def test_without_routing_everything_goes_to_the_large_tier(monkeypatch):
+    monkeypatch.setattr(routing, "MODEL_ROUTING", False)
+
+    assert routing.choose_tier("hey there", False, False) is LARGE
+
+
+@pytest.mark.parametrize(
+    "tier_cap, deadline_cap, expected",
+    [
+        (256, None, 256),
+        (256, 100, 100),
+        (256, 1000, 256),
+        (0, 80, 80),
+        (0, None, None),
+    ],
+)
+def test_cap_is_the_tighter_of_the_tier_and_the_deadline(
+    tier_cap, deadline_cap, expected
+):
+    assert Tier("small", "llama3.2:3b", tier_cap).cap(deadline_cap) == expected
+
+
+def test_record_usage_counts_tokens_and_capped_answers():
+    from tools import metrics
+
+    before = metrics.snapshot()["counters"]
+    routing.record_usage(
+        SMALL,
+        {
+            "prompt_eval_count": 40,
+            "eval_count": 10,
+            "eval_duration": 500_000_000,
+            "done_reason": "length",
+        },
+        0.6,
+    )
+    after = metrics.snapshot()["counters"]
+
+    def added(name):
+        return after.get(name, 0) - before.get(name, 0)
+
+    assert added("routing.small.prompt_tokens") == 40
+    assert added("routing.small.output_tokens") == 10
+    assert added("routing.small.capped") == 1
+    assert metrics.snapshot()["gauges"]["routing.small.tokens_per_second"] == 20
+
+
+def http_error(status: int) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status}", response=response)
+
+
+def test_a_missing_small_model_falls_back_to_the_large_tier():
+    assert routing.fallback_tier(SMALL, http_error(404)) is LARGE
+
+
+@pytest.mark.parametrize(
+    "tier, error",
+    [
+        (SMALL, http_error(500)),
+        (SMALL, requests.ConnectionError()),
+        (LARGE, http_error(404)),
+        (Tier("requested", "mistral:7b", 0), http_error(404)),
+    ],
+)
+def test_other_errors_have_no_fallback(tier, error):
+    assert routing.fallback_tier(tier, error) is None
+
+
+def test_routing_is_off_and_both_tiers_use_one_model_by_default(monkeypatch):
+    for name in ("MODEL_ROUTING", "MODEL_TIER_LARGE", "MODEL_TIER_SMALL"):
+        monkeypatch.delenv(name, raising=False)
+    try:
+        importlib.reload(routing)
+        defaults = routing.MODEL_ROUTING, routing.LARGE.model, routing.SMALL.model
+    finally:
+        monkeypatch.undo()
+        importlib.reload(routing)
+
+    assert defaults == (False, "llama2-uncensored:7b", "llama2-uncensored:7b")
@@ -0,0 +1,114 @@
+import pytest
+from tools.search_dedupe import (
+    SEARCH_NEAR_DUP_DISTANCE,
+    canonical_url,
+    dedupe_results,
+    simhash,
+)
+
+RELEASE = (
+    "Python 3.13 was released today with a new interactive shell, an experimental "
+    "free-threaded build and a JIT compiler preview."
+)
+RELEASE_EDITED = RELEASE.replace("free-threaded build", "free-threaded mode")
+COUNCIL = (
+    "The city council approved a new budget for road repairs and public parks "
+    "after a long debate on Tuesday evening."
+)
+
+
+def distance(a: str, b: str) -> int:
+    return bin(simhash(a) ^ simhash(b)).count("1")
+
+
+@pytest.mark.parametrize(
+    "variant",
+    [
+        "https://www.example.com/news/story",
+        "http://example.com/news/story/",
+        "https://m.example.com/news/story#comments",
+        "https://example.com/news/story/amp",
+        "https://EXAMPLE.com/news/story?utm_source=feed&fbclid=abc",
+    ],
+)
+def test_canonical_url_ignores_trivial_variants(variant):
+    assert canonical_url(variant) == canonical_url("https://example.com/news/story")
+
+
+def test_canonical_url_keeps_meaningful_parameters():
+    assert canonical_url("https://example.com/s?b=2&a=1") == canonical_url(
+        "https://example.com/s?a=1&b=2"
+    )
+    assert canonical_url("https://example.com/s?a=1") != canonical_url(
+        "https://example.com/s?a=2"
+    )
+
+
+def test_simhash_ignores_case_and_punctuation():
+    assert simhash(RELEASE) == simhash(RELEASE.upper().replace(",", ""))
+
+
+def test_simhash_distance_separates_edits_from_unrelated_text():
+    assert distance(RELEASE, RELEASE_EDITED) <= SEARCH_NEAR_DUP_DISTANCE
+    assert distance(RELEASE, COUNCIL) > SEARCH_NEAR_DUP_DISTANCE
+
+
+def test_simhash_handles_short_and_empty_text():
+    assert simhash("hi") == simhash("HI")
+    assert isinstance(simhash(""), int)
+
+
+def test_dedupe_drops_same_page_and_keeps_the_richest_copy():
+    results = [
+        {"url": "https://www.example.com/a", "title": "A", "content": "short"},
+        {"url": "https://other.org/b", "title": "B", "content": COUNCIL},
+        {"url": "http://example.com/a/", "title": "A", "content": "much longer"},
+    ]
+
+    kept = dedupe_results(results)
+
+    assert [r["title"] for r in kept] == ["A", "B"]
+    assert kept[0]["content"] == "much longer"
+
+
+def test_dedupe_drops_near_identical_text_on_other_sites():
+    results = [
+        {"url": "https://news.example/python", "title": "", "content": RELEASE},
+        {"url": "https://council.example", "title": "", "content": COUNCIL},
+        {"url": "https://mirror.example/py", "title": "", "content": RELEASE_EDITED},
+    ]
+
+    kept = dedupe_results(results)
+
+    assert [r["url"] for r in kept] == [
+        "https://news.example/python",
+        "https://council.example",
+    ]
+
+
+def test_dedupe_keeps_distinct_results():
+    results = [
+        {"url": "https://a.example", "title": "", "content": RELEASE},
+        {"url": "https://b.example", "title": "", "content": COUNCIL},
+    ]
+
+    assert dedupe_results(results) == results
+
+
+def test_dedupe_matches_results_without_text_by_url_only():
+    results = [
+        {"url": "https://a.example/1", "title": "", "content": ""},
+        {"url": "https://b.example/2", "title": "", "content": "..."},
+        {"url": "https://c.example/3", "title": None, "content": None},
+        {"url": "https://www.a.example/1/", "title": "", "content": ""},
+        {"url": "https://d.example/4", "title": "", "content": RELEASE},
+    ]
+
+    kept = dedupe_results(results)
+
+    assert [r["url"] for r in kept] == [
+        "https://a.example/1",
+        "https://b.example/2",
+        "https://c.example/3",
+        "https://d.example/4",
+    ]
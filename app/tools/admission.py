@@ -0,0 +1,98 @@
+"""
+Admission control for `/generate`.
+
+A request that cannot finish within its deadline only wastes Ollama time
+and makes everyone behind it slower. Before a request starts, the wait is
+estimated from the number of requests already in flight and the recent
+time to answer one: with `concurrency` requests served at once, each one
+ahead beyond the free places adds `service_time / concurrency` seconds.
+When that wait plus one service time exceeds the request's remaining
+budget, it is turned away with a hint of when to retry.
+
+No request is shed until `min_samples` requests have completed, so a cold
+process never rejects on a guess.
+"""
+
+import logging
+import threading
+
+from tools import metrics
+from tools.hedging import LatencyTracker
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+
+class Overloaded(Exception):
+    """Raised when a request would not finish within its budget."""
+
+    def __init__(self, retry_after: float, estimated_wait: float, ahead: int):
+        super().__init__(
+            f"{ahead} requests ahead, about {estimated_wait:.0f}s of waiting."
+        )
+        self.retry_after = retry_after
+        self.estimated_wait = estimated_wait
+        self.ahead = ahead
+
+
+class AdmissionController:
+    """Counts requests in flight and sheds those that would time out."""
+
+    def __init__(self, name: str, concurrency: int, min_samples: int = 10):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self._service = LatencyTracker(window=100, min_samples=min_samples)
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def _estimate(self, ahead: int) -> tuple[float, float | None]:
+        service = self._service.percentile(50)
+        if service is None:
+            return 0.0, None
+        queued = max(0, ahead - self.concurrency + 1)
+        return queued * service / self.concurrency, service
+
+    def estimate(self) -> dict:
+        """The wait a request arriving now should expect."""
+        with self._lock:
+            ahead = self._in_flight
+        wait, service = self._estimate(ahead)
+        return {
+            "in_flight": ahead,
+            "concurrency": self.concurrency,
+            "estimated_wait": wait,
+            "service_time": service,
+        }
+
+    def admit(self, budget: float) -> float:
+        """
+        Takes a place in flight and returns the estimated wait, or raises
+        Overloaded if the wait and service time would exceed `budget`.
+        Every admitted request must be given back with `release`.
+        """
+        with self._lock:
+            ahead = self._in_flight
+            wait, service = self._estimate(ahead)
+            if service is not None and wait + service > budget:
+                metrics.increment(f"{self.name}.rejected")
+                # The backlog drains at `concurrency / service` requests per
+                # second; retry once it is short enough to fit the budget.
+                retry_after = max(1.0, wait + service - budget)
+                raise Overloaded(retry_after, wait, ahead)
+            self._in_flight += 1
+            metrics.set_gauge(f"{self.name}.in_flight", self._in_flight)
+        metrics.increment(f"{self.name}.admitted")
+        metrics.set_gauge(f"{self.name}.estimated_wait", wait)
+        return wait
+
+    def release(self, service_time: float | None = None):
+        """
+        Gives back an admitted request's place. Pass how long it took when it
+        was answered normally; failed and cancelled requests say little about
+        the service time and are left out.
+        """
+        if service_time is not None:
+            self._service.observe(service_time)
+        with self._lock:
+            self._in_flight -= 1
+            metrics.set_gauge(f"{self.name}.in_flight", self._in_flight)
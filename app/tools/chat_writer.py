@@ -0,0 +1,199 @@
+"""
+Write-behind buffer for chat logs.
+
+With CHAT_WRITE_BEHIND enabled, background tasks hand their chat rows to a
+single writer thread that saves them with one multi-row INSERT per batch,
+flushing when CHAT_WRITE_BATCH_SIZE rows are waiting or CHAT_WRITE_FLUSH_INTERVAL
+seconds have passed, whichever comes first.
+
+Durability:
+    * A chat is acknowledged to the user before it is written. If the
+      process is killed, rows still in the buffer (at most
+      CHAT_WRITE_BUFFER_SIZE) are lost.
+    * A clean shutdown drains and flushes the buffer.
+    * A failed batch is retried CHAT_WRITE_RETRIES times with backoff, then
+      logged and counted under `chat_writer.rows_dropped`.
+    * When the buffer is full, the caller writes its row directly instead
+      of dropping it, so load turns into backpressure rather than loss.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+
+from tools import metrics, vector_db
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "false").lower() == "true"
+CHAT_WRITE_BATCH_SIZE = int(os.getenv("CHAT_WRITE_BATCH_SIZE", 100))
+CHAT_WRITE_FLUSH_INTERVAL = float(os.getenv("CHAT_WRITE_FLUSH_INTERVAL", 1.0))
+CHAT_WRITE_BUFFER_SIZE = int(os.getenv("CHAT_WRITE_BUFFER_SIZE", 5000))
+CHAT_WRITE_RETRIES = int(os.getenv("CHAT_WRITE_RETRIES", 3))
+
+
+class _FlushRequest:
+    """Queued marker asking the writer to flush everything before it."""
+
+    def __init__(self):
+        self.done = threading.Event()
+
+
+class ChatWriteBuffer:
+    """A bounded queue drained in batches by one writer thread."""
+
+    def __init__(
+        self,
+        batch_size: int = CHAT_WRITE_BATCH_SIZE,
+        flush_interval: float = CHAT_WRITE_FLUSH_INTERVAL,
+        max_buffered: int = CHAT_WRITE_BUFFER_SIZE,
+    ):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max_buffered)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="chat-writer", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, chat: dict):
+        """Buffers a chat, or writes it directly when the buffer is full."""
+        try:
+            self._queue.put_nowait(chat)
+            metrics.set_gauge("chat_writer.buffered", self._queue.qsize())
+        except queue.Full:
+            metrics.increment("chat_writer.direct_writes")
+            log.warning("Chat write buffer is full, writing directly.")
+            self._write([chat])
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Blocks until everything submitted so far has been written, for at
+        most `timeout` seconds in all. Returns False if that did not happen,
+        including when the buffer stays full because the writer has stopped.
+        """
+        request = _FlushRequest()
+        give_up_at = time.monotonic() + timeout
+        try:
+            self._queue.put(request, timeout=timeout)
+        except queue.Full:
+            return False
+        return request.done.wait(max(0.0, give_up_at - time.monotonic()))
+
+    def close(self, timeout: float = 30.0):
+        """Stops the writer after flushing whatever is still buffered."""
+        self._stopping.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            log.error("Chat writer did not finish flushing before shutdown.")
+
+    def _run(self):
+        while True:
+            batch, flush_requests = [], []
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if isinstance(item, _FlushRequest):
+                    flush_requests.append(item)
+                    break
+                batch.append(item)
+
+            if batch:
+                self._write(batch)
+            for request in flush_requests:
+                request.done.set()
+            metrics.set_gauge("chat_writer.buffered", self._queue.qsize())
+
+            if self._stopping.is_set() and self._queue.empty():
+                return
+
+    def _write(self, batch: list[dict]):
+        for attempt in range(CHAT_WRITE_RETRIES + 1):
+            with metrics.timer("chat_writer.flush"):
+                saved = vector_db.save_chats(batch)
+            if saved:
+                metrics.increment("chat_writer.rows_written", len(batch))
+                return
+            if attempt < CHAT_WRITE_RETRIES:
+                time.sleep(min(2**attempt, 10))
+        metrics.increment("chat_writer.rows_dropped", len(batch))
+        log.error(f"Dropped {len(batch)} chat rows after {CHAT_WRITE_RETRIES} retries.")
+
+
+# --- Module Interface ---
+_writer: ChatWriteBuffer | None = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer() -> ChatWriteBuffer:
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = ChatWriteBuffer()
+        return _writer
+
+
+def save_chat(
+    username: str,
+    prompt: str,
+    response: str,
+    prompt_embedding,
+    response_embedding,
+    search_queries: list[str] | None = None,
+    embedding_model: str = vector_db.OLLAMA_EMBEDDING_MODEL,
+    channel_id: str | None = None,
+):
+    """Same contract as `vector_db.save_chat`, buffered when write-behind is on."""
+    if not CHAT_WRITE_BEHIND:
+        vector_db.save_chat(
+            username,
+            prompt,
+            response,
+            prompt_embedding,
+            response_embedding,
+            search_queries,
+            embedding_model=embedding_model,
+            channel_id=channel_id,
+        )
+        return
+
+    _get_writer().submit(
+        {
+            "username": username,
+            "prompt": prompt,
+            "response": response,
+            "prompt_embedding": prompt_embedding,
+            "response_embedding": response_embedding,
+            "search_queries": search_queries,
+            "embedding_model": embedding_model,
+            "channel_id": channel_id,
+        }
+    )
+
+
+def flush(timeout: float = 10.0) -> bool:
+    """Waits for buffered chats to reach the database (no-op when disabled)."""
+    if _writer is None:
+        return True
+    return _writer.flush(timeout)
+
+
+def shutdown():
+    """Flushes and stops the writer. Called on application shutdown."""
+    global _writer
+    with _writer_lock:
+        writer, _writer = _writer, None
+    if writer is not None:
+        log.info("Flushing buffered chat logs before shutdown.")
+        writer.close()
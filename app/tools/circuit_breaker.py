@@ -0,0 +1,157 @@
+"""
+Circuit breakers for the services the bot depends on.
+
+A breaker starts closed and counts consecutive failures. After
+`failure_threshold` of them it opens, and every call fails immediately with
+CircuitOpen instead of waiting for a timeout. Once `reset_timeout` seconds
+have passed it goes half-open and lets a single trial call through: success
+closes it again, failure reopens it for another `reset_timeout`.
+
+Only connection errors, timeouts and 5xx responses count as failures. A 4xx
+is the caller's mistake, and a request that runs out of its own deadline
+says nothing about the service, so neither moves the breaker. Calls whose
+timeout the deadline cut short run inside `deadline.bounded()`, which turns
+their timeout into DeadlineExceeded before the breaker sees it.
+
+Breakers are shared per service name within a process, e.g.
+`circuit_breaker.get("ollama")`.
+"""
+
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from tools import metrics
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5))
+CIRCUIT_RESET_SECONDS = float(os.getenv("CIRCUIT_RESET_SECONDS", 30))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+_STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a service whose breaker is open."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is unavailable, retry in {retry_after:.0f}s.")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_failure(error: BaseException) -> bool:
+    """Whether an error says the service itself is unhealthy."""
+    if isinstance(error, requests.exceptions.HTTPError):
+        response = error.response
+        return response is None or response.status_code >= 500
+    return isinstance(error, (requests.exceptions.RequestException, TimeoutError))
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        metrics.set_gauge(f"circuit.{name}.state", _STATE_GAUGE[CLOSED])
+
+    def _transition(self, state: str):
+        log.warning(f"Circuit for {self.name} is now {state} (was {self.state}).")
+        self.state = state
+        metrics.increment(f"circuit.{self.name}.{state}")
+        metrics.set_gauge(f"circuit.{self.name}.state", _STATE_GAUGE[state])
+
+    def retry_after(self) -> float | None:
+        """Seconds until a trial call is allowed, or None if calls go through."""
+        with self._lock:
+            if self.state == CLOSED:
+                return None
+            if self.state == HALF_OPEN:
+                return self.reset_timeout if self._trial_running else None
+            return max(0.0, self._opened_at + self.reset_timeout - time.monotonic())
+
+    def _before_call(self) -> bool:
+        """Admits a call or raises CircuitOpen. Returns True for a trial call."""
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._opened_at + self.reset_timeout - time.monotonic()
+                if remaining > 0:
+                    metrics.increment(f"circuit.{self.name}.rejected")
+                    raise CircuitOpen(self.name, remaining)
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._trial_running:
+                    metrics.increment(f"circuit.{self.name}.rejected")
+                    raise CircuitOpen(self.name, self.reset_timeout)
+                self._trial_running = True
+                return True
+            return False
+
+    def _after_call(self, trial: bool, error: BaseException | None):
+        with self._lock:
+            if trial:
+                self._trial_running = False
+            if error is None:
+                self._failures = 0
+                if self.state != CLOSED:
+                    self._transition(CLOSED)
+                return
+            if not is_failure(error):
+                return
+            self._failures += 1
+            metrics.increment(f"circuit.{self.name}.failures")
+            if self.state == HALF_OPEN or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                if self.state != OPEN:
+                    self._transition(OPEN)
+
+    @contextmanager
+    def guard(self):
+        """
+        Wraps one call to the service: raises CircuitOpen up front while the
+        breaker is open, and records how the call went.
+        """
+        trial = self._before_call()
+        try:
+            yield
+        except BaseException as e:
+            self._after_call(trial, e)
+            raise
+        self._after_call(trial, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self._failures}
+
+
+# --- Registry ---
+_breakers: dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def get(name: str) -> CircuitBreaker:
+    """Returns the process-wide breaker for `name`, creating it on first use."""
+    with _registry_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(
+                name, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RESET_SECONDS
+            )
+        return breaker
+
+
+def stats() -> dict:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
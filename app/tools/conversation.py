@@ -0,0 +1,100 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+
+from tools import metrics
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Turns remembered per channel and channels remembered overall. With the
+# per-turn character cap this bounds memory to roughly
+# channels x turns x 2 x chars (about 12 MB at the defaults).
+CONVERSATION_TURNS = int(os.getenv("CONVERSATION_TURNS", 6))
+CONVERSATION_MAX_CHANNELS = int(os.getenv("CONVERSATION_MAX_CHANNELS", 1000))
+CONVERSATION_MAX_CHARS = int(os.getenv("CONVERSATION_MAX_CHARS", 1000))
+# Turns older than this are no longer offered as context.
+CONVERSATION_MAX_AGE_SECONDS = int(os.getenv("CONVERSATION_MAX_AGE_SECONDS", 3600))
+
+
+@dataclass(frozen=True)
+class Turn:
+    username: str
+    prompt: str
+    response: str
+    timestamp: float  # time.time() of the turn
+
+
+def _clip(text: str) -> str:
+    if len(text) <= CONVERSATION_MAX_CHARS:
+        return text
+    return text[: CONVERSATION_MAX_CHARS - 3] + "..."
+
+
+# --- Per-Channel Ring Buffers ---
+_lock = threading.Lock()
+_channels: OrderedDict[str, deque] = OrderedDict()
+
+
+def record(channel_id: str, username: str, prompt: str, response: str, timestamp=None):
+    """Appends a turn to the channel's buffer, evicting the idlest channel if full."""
+    if not channel_id or CONVERSATION_TURNS <= 0:
+        return
+    turn = Turn(username, _clip(prompt), _clip(response), timestamp or time.time())
+    with _lock:
+        turns = _channels.get(channel_id)
+        if turns is None:
+            turns = _channels[channel_id] = deque(maxlen=CONVERSATION_TURNS)
+        turns.append(turn)
+        _channels.move_to_end(channel_id)
+        while len(_channels) > CONVERSATION_MAX_CHANNELS:
+            _channels.popitem(last=False)
+            metrics.increment("conversation.evictions")
+        metrics.set_gauge("conversation.channels", len(_channels))
+
+
+def recent(channel_id: str | None) -> list[Turn]:
+    """Returns the channel's recent turns, oldest first."""
+    if not channel_id:
+        return []
+    cutoff = time.time() - CONVERSATION_MAX_AGE_SECONDS
+    with _lock:
+        turns = _channels.get(channel_id)
+        if turns is None:
+            metrics.increment("conversation.misses")
+            return []
+        _channels.move_to_end(channel_id)
+        fresh = [turn for turn in turns if turn.timestamp >= cutoff]
+    metrics.increment("conversation.hits")
+    return fresh
+
+
+def format_turns(turns: list[Turn]) -> str:
+    """Renders turns compactly, one line per speaker."""
+    lines = []
+    for turn in turns:
+        lines.append(f"{turn.username}: {turn.prompt}")
+        lines.append(f"Oswald: {turn.response}")
+    return "\n".join(lines)
+
+
+def warm_up(rows):
+    """
+    Fills the buffers from (channel_id, username, prompt, response,
+    created_at) rows in chronological order, as returned by
+    `vector_db.get_recent_channel_turns`.
+    """
+    count = 0
+    for channel_id, username, prompt, response, created_at in rows:
+        record(channel_id, username, prompt, response, created_at.timestamp())
+        count += 1
+    log.info(f"Warmed conversation buffers with {count} turns.")
+
+
+def clear():
+    with _lock:
+        _channels.clear()
@@ -0,0 +1,102 @@
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from tools import metrics
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Header carrying the caller's remaining budget in seconds (relative, so the
+# bot and API clocks do not need to agree).
+DEADLINE_HEADER = "X-Request-Timeout"
+# Budget used when the caller does not send one.
+REQUEST_DEFAULT_TIMEOUT = float(os.getenv("REQUEST_DEFAULT_TIMEOUT", 65))
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage starts or runs after the request's budget is spent."""
+
+
+class RequestCancelled(DeadlineExceeded):
+    """Raised when the client went away while the request was running."""
+
+
+class Deadline:
+    """
+    The point in time by which a request must be answered, shared by every
+    stage of the pipeline. Stages ask it for their timeouts, and `cancel()`
+    lets another thread stop work the client no longer waits for.
+    """
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self._expires_at = time.monotonic() + budget
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def from_header(cls, value: str | None) -> "Deadline":
+        """Builds a deadline from the header value, falling back to the default."""
+        try:
+            budget = float(value) if value else REQUEST_DEFAULT_TIMEOUT
+        except ValueError:
+            log.warning(f"Ignoring invalid {DEADLINE_HEADER} header: {value!r}")
+            budget = REQUEST_DEFAULT_TIMEOUT
+        return cls(max(0.0, budget))
+
+    def remaining(self) -> float:
+        return max(0.0, self._expires_at - time.monotonic())
+
+    def elapsed(self) -> float:
+        return self.budget - (self._expires_at - time.monotonic())
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def check(self, stage: str):
+        """Raises if the request was cancelled or has no time left for `stage`."""
+        if self.cancelled:
+            raise RequestCancelled(f"Client disconnected before {stage}.")
+        if self.remaining() <= 0:
+            metrics.increment("deadline.exceeded")
+            raise DeadlineExceeded(f"No time left for {stage}.")
+
+    def timeout(self, cap: float, reserve: float = 0.0, stage: str = "call") -> float:
+        """
+        Timeout for one upstream call: the time left after holding back
+        `reserve` seconds for later stages, never more than `cap`.
+        """
+        self.check(stage)
+        available = self.remaining() - reserve
+        if available <= 0:
+            metrics.increment("deadline.exceeded")
+            raise DeadlineExceeded(f"No time left for {stage}.")
+        return min(cap, available)
+
+
+@contextmanager
+def bounded(deadline: Deadline | None, timeout: float, cap: float, stage: str):
+    """
+    Wraps an upstream call made with `timeout`, which the deadline may have
+    cut below `cap`. If the call then fails after using all of that time,
+    raises DeadlineExceeded instead: the request ran out of its own budget,
+    which says nothing about the service, so circuit breakers ignore it.
+    """
+    started = time.monotonic()
+    try:
+        yield
+    except OSError as e:
+        # requests' errors, including a timeout mid-stream, are OSErrors.
+        if deadline is None or timeout >= cap:
+            raise
+        if time.monotonic() - started < timeout:
+            raise
+        metrics.increment("deadline.exceeded")
+        raise DeadlineExceeded(f"Ran out of time during {stage}.") from e
@@ -0,0 +1,107 @@
+"""
+Priority lanes in front of a shared backend.
+
+Calls take a slot before they run. Interactive calls (a user is waiting on
+them) get the next free slot whenever one of them is queued; background
+calls (profiles, chat embeddings) only start while no interactive call is
+waiting, and never hold more than their own share of the slots. A
+background call deferred for longer than `max_defer` seconds is let in
+anyway, so a steady stream of users cannot starve it forever.
+"""
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from tools import metrics
+from tools.deadline import Deadline
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+LANES = (INTERACTIVE, BACKGROUND)
+# How often a waiting call with a deadline checks whether it was cancelled.
+DEADLINE_POLL_INTERVAL = 0.25
+
+
+class PriorityDispatcher:
+    """Admits at most `slots` concurrent calls, interactive ones first."""
+
+    def __init__(self, name: str, slots: int, background_slots: int, max_defer: float):
+        self.name = name
+        self.slots = max(1, slots)
+        self.background_slots = max(1, min(background_slots, self.slots))
+        self.max_defer = max_defer
+        self._cond = threading.Condition()
+        self._running = {lane: 0 for lane in LANES}
+        self._waiting = {lane: 0 for lane in LANES}
+
+    def _can_start(self, lane: str, queued_at: float) -> bool:
+        if sum(self._running.values()) >= self.slots:
+            return False
+        if lane == INTERACTIVE:
+            return True
+        if self._running[BACKGROUND] >= self.background_slots:
+            return False
+        if self._waiting[INTERACTIVE] == 0:
+            return True
+        if time.monotonic() - queued_at < self.max_defer:
+            return False
+        metrics.increment(f"{self.name}.{BACKGROUND}.forced")
+        log.info(
+            f"Background call deferred for {self.max_defer:.0f}s, running it anyway."
+        )
+        return True
+
+    def _publish(self):
+        for lane in LANES:
+            metrics.set_gauge(f"{self.name}.{lane}.waiting", self._waiting[lane])
+            metrics.set_gauge(f"{self.name}.{lane}.running", self._running[lane])
+
+    @contextmanager
+    def slot(self, lane: str = INTERACTIVE, deadline: Deadline | None = None):
+        """
+        Holds a slot in `lane` for the duration of the block. With a deadline,
+        a call still queued when the request is cancelled or out of time
+        raises instead of starting.
+        """
+        queued_at = time.monotonic()
+        with self._cond:
+            self._waiting[lane] += 1
+            self._publish()
+            try:
+                while not self._can_start(lane, queued_at):
+                    if deadline is not None:
+                        deadline.check(f"{self.name} queue")
+                        self._cond.wait(DEADLINE_POLL_INTERVAL)
+                    else:
+                        # Background calls re-check so `max_defer` can expire.
+                        self._cond.wait(self.max_defer if lane == BACKGROUND else None)
+            finally:
+                self._waiting[lane] -= 1
+                self._publish()
+                # Background calls may have been held back only by this one.
+                self._cond.notify_all()
+            self._running[lane] += 1
+            self._publish()
+
+        metrics.observe(f"{self.name}.{lane}.wait", time.monotonic() - queued_at)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running[lane] -= 1
+                self._publish()
+                self._cond.notify_all()
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "background_slots": self.background_slots,
+                "running": dict(self._running),
+                "waiting": dict(self._waiting),
+            }
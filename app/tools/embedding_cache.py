@@ -0,0 +1,197 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import requests
+from tools import metrics, ollama, tracing, vector_db
+from tools.deadline import Deadline, bounded
+from tools.dispatcher import INTERACTIVE
+from tools.embeddings import embedding_key
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+OLLAMA_HOST = os.getenv("OLLAMA_HOST_URL")
+# Entries kept in memory. Vectors are float32, so 768 dimensions is ~3 KB each.
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 4096))
+# Upper bound for a single embed call, with or without a deadline.
+EMBED_TIMEOUT = 60
+# Also look up and store vectors in the database's embeddings table. Off by
+# default with EMBEDDING_STORAGE=vector: chat_logs already holds those vectors
+# inline, so the table would store every one of them a second time.
+EMBEDDING_CACHE_TABLE = (
+    os.getenv("EMBEDDING_CACHE_TABLE")
+    or ("false" if vector_db.EMBEDDING_STORAGE == "vector" else "true")
+).lower() == "true"
+
+# --- In-Memory LRU Tier ---
+_lock = threading.Lock()
+_memory: OrderedDict[str, np.ndarray] = OrderedDict()
+
+
+def _memory_get(key: str) -> np.ndarray | None:
+    with _lock:
+        vector = _memory.get(key)
+        if vector is not None:
+            _memory.move_to_end(key)
+        return vector
+
+
+def _memory_put(key: str, vector: np.ndarray):
+    with _lock:
+        _memory[key] = vector
+        _memory.move_to_end(key)
+        while len(_memory) > EMBEDDING_CACHE_SIZE:
+            _memory.popitem(last=False)
+
+
+def _timeout(deadline: Deadline | None, reserve: float) -> float:
+    if deadline is None:
+        return EMBED_TIMEOUT
+    return deadline.timeout(EMBED_TIMEOUT, reserve, "embed")
+
+
+def _fetch_ollama_embedding(
+    text_to_embed: str,
+    model: str,
+    lane: str,
+    deadline: Deadline | None = None,
+    reserve: float = 0.0,
+) -> np.ndarray:
+    """Generates an embedding for a given text using the Ollama API."""
+    try:
+        with ollama.breaker.guard(), ollama.dispatcher.slot(lane, deadline):
+            timeout = _timeout(deadline, reserve)
+            with bounded(deadline, timeout, EMBED_TIMEOUT, "embed"):
+                response = requests.post(
+                    f"{OLLAMA_HOST}/api/embeddings",
+                    json={"model": model, "prompt": text_to_embed},
+                    timeout=timeout,
+                )
+            response.raise_for_status()
+        embedding = response.json().get("embedding")
+        if not embedding:
+            raise ValueError(f"Ollama returned no embedding with model '{model}'.")
+        return np.asarray(embedding, dtype=np.float32)
+    except requests.RequestException as e:
+        log.error(f"Failed to get embedding from Ollama for model '{model}': {e}")
+        raise
+
+
+def _fetch_ollama_embeddings(
+    texts: list[str],
+    model: str,
+    lane: str,
+    deadline: Deadline | None = None,
+    reserve: float = 0.0,
+) -> list[np.ndarray]:
+    """
+    Embeds several texts with one call to Ollama's batch /api/embed endpoint,
+    falling back to one /api/embeddings call per text on older servers.
+    """
+    if len(texts) == 1:
+        return [_fetch_ollama_embedding(texts[0], model, lane, deadline, reserve)]
+    try:
+        with ollama.breaker.guard(), ollama.dispatcher.slot(lane, deadline):
+            timeout = _timeout(deadline, reserve)
+            with bounded(deadline, timeout, EMBED_TIMEOUT, "embed"):
+                response = requests.post(
+                    f"{OLLAMA_HOST}/api/embed",
+                    json={"model": model, "input": texts},
+                    timeout=timeout,
+                )
+            if response.status_code != 404:
+                response.raise_for_status()
+        if response.status_code == 404:
+            log.debug("Ollama has no /api/embed, embedding texts one at a time.")
+            return [
+                _fetch_ollama_embedding(text, model, lane, deadline, reserve)
+                for text in texts
+            ]
+        embeddings = response.json().get("embeddings", [])
+        if len(embeddings) != len(texts):
+            raise ValueError(
+                f"Ollama returned {len(embeddings)} embeddings for "
+                f"{len(texts)} texts with model '{model}'."
+            )
+        return [np.asarray(vector, dtype=np.float32) for vector in embeddings]
+    except requests.RequestException as e:
+        log.error(f"Failed to get embeddings from Ollama for model '{model}': {e}")
+        raise
+
+
+def get_embeddings(
+    texts: list[str],
+    model: str,
+    persist: bool = True,
+    lane: str = INTERACTIVE,
+    deadline: Deadline | None = None,
+    reserve: float = 0.0,
+) -> list[np.ndarray]:
+    """
+    Returns one embedding per text, checking the in-memory LRU first, then
+    the embeddings table, and only asking Ollama (in one batch) for what is
+    left. With `persist=False` the table tier is skipped, which suits
+    throwaway text such as search snippets. `lane` is the dispatcher lane
+    the Ollama call waits in. With a deadline, the call stops waiting and
+    times out when the request runs out of time, less `reserve` seconds.
+
+    Entries are keyed by a hash of (model, normalized text), so a different
+    embedding model never sees another model's vectors.
+    """
+    use_table = persist and EMBEDDING_CACHE_TABLE
+    keys = [embedding_key(model, text) for text in texts]
+    found: dict[str, np.ndarray] = {}
+
+    for key in dict.fromkeys(keys):
+        vector = _memory_get(key)
+        if vector is not None:
+            found[key] = vector
+    metrics.increment("embedding_cache.hits.memory", len(found))
+
+    missing = [key for key in dict.fromkeys(keys) if key not in found]
+    if missing and use_table:
+        stored = vector_db.get_embeddings_by_hash(missing)
+        metrics.increment("embedding_cache.hits.table", len(stored))
+        for key, vector in stored.items():
+            _memory_put(key, vector)
+            found[key] = vector
+
+    to_fetch = {key: text for key, text in zip(keys, texts) if key not in found}
+    new_rows = []
+    if to_fetch:
+        metrics.increment("embedding_cache.misses", len(to_fetch))
+        with metrics.timer("embedding_cache.ollama"), tracing.span(
+            "ollama.embed", texts=len(to_fetch)
+        ):
+            vectors = _fetch_ollama_embeddings(
+                list(to_fetch.values()), model, lane, deadline, reserve
+            )
+        for key, vector in zip(to_fetch, vectors):
+            _memory_put(key, vector)
+            found[key] = vector
+            new_rows.append((key, model, vector))
+
+    if new_rows and use_table:
+        vector_db.save_embeddings(new_rows)
+
+    _update_hit_rate()
+    return [found[key] for key in keys]
+
+
+def get_embedding(text: str, model: str) -> np.ndarray:
+    """Single-text convenience wrapper around `get_embeddings`."""
+    return get_embeddings([text], model)[0]
+
+
+def _update_hit_rate():
+    hits = metrics.get_counter("embedding_cache.hits.memory") + metrics.get_counter(
+        "embedding_cache.hits.table"
+    )
+    total = hits + metrics.get_counter("embedding_cache.misses")
+    if total:
+        metrics.set_gauge("embedding_cache.hit_rate", hits / total)
+    metrics.set_gauge("embedding_cache.memory_entries", len(_memory))
@@ -0,0 +1,39 @@
+import hashlib
+import logging
+import unicodedata
+
+import numpy as np
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """Normalizes text so trivially different copies share one embedding."""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+def embedding_key(model: str, text: str) -> str:
+    """
+    Content address of an embedding.
+
+    The model name is part of the hash, so switching embedding models never
+    matches vectors produced by the previous one.
+    """
+    payload = f"{model}\0{normalize_text(text)}".encode("utf-8")
+    return hashlib.sha256(payload).hexdigest()
+
+
+# --- Quantization ---
+def quantize_int8(embedding) -> tuple[bytes, float]:
+    """Symmetric per-vector int8 quantization. Returns (bytes, scale)."""
+    vector = np.asarray(embedding, dtype=np.float32)
+    max_abs = float(np.max(np.abs(vector))) if vector.size else 0.0
+    scale = max_abs / 127 if max_abs else 1.0
+    quantized = np.clip(np.rint(vector / scale), -127, 127).astype(np.int8)
+    return quantized.tobytes(), scale
+
+
+def dequantize_int8(data: bytes, scale: float) -> np.ndarray:
+    """Inverse of `quantize_int8`."""
+    return np.frombuffer(data, dtype=np.int8).astype(np.float32) * scale
@@ -0,0 +1,91 @@
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from tools import metrics
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# Shared by every hedged call; abandoned attempts finish on their own timeout.
+_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="hedge")
+
+
+class LatencyTracker:
+    """Keeps a window of recent latencies and derives timeouts from them."""
+
+    def __init__(self, window: int = 200, min_samples: int = 20):
+        self.min_samples = min_samples
+        self._samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, pct: float) -> float | None:
+        """Returns the percentile, or None until enough samples are collected."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return metrics.percentile(ordered, pct)
+
+    def adaptive_timeout(
+        self, multiplier: float, minimum: float, maximum: float
+    ) -> float:
+        """`multiplier` x p99, clamped; falls back to `maximum` while warming up."""
+        p99 = self.percentile(99)
+        if p99 is None:
+            return maximum
+        return min(maximum, max(minimum, p99 * multiplier))
+
+
+def hedged_call(fn, hedge_delay: float | None, timeout: float, name: str):
+    """
+    Runs `fn` and, if it has not finished after `hedge_delay` seconds (or it
+    failed), starts one duplicate. Returns the first successful result.
+
+    Raises the last error if every attempt failed, or TimeoutError once
+    `timeout` seconds have passed without a result.
+    """
+    start = time.monotonic()
+    pending = [_executor.submit(fn)]
+    hedge, last_error = None, None
+
+    while True:
+        elapsed = time.monotonic() - start
+        remaining = timeout - elapsed
+        if remaining <= 0:
+            metrics.increment(f"{name}.timeouts")
+            raise TimeoutError(f"{name} did not answer within {timeout:.1f}s")
+
+        wait_for = remaining
+        if hedge is None and hedge_delay is not None:
+            wait_for = min(remaining, max(0.0, hedge_delay - elapsed))
+        done, _ = wait(pending, timeout=wait_for, return_when=FIRST_COMPLETED)
+
+        for future in done:
+            pending.remove(future)
+            if future.exception() is None:
+                if future is hedge:
+                    metrics.increment(f"{name}.hedge_wins")
+                return future.result()
+            last_error = future.exception()
+
+        hedge_due = hedge_delay is not None and (
+            time.monotonic() - start >= hedge_delay or not pending
+        )
+        if hedge is None and hedge_due:
+            log.debug(f"Hedging slow {name} request after {elapsed:.2f}s.")
+            metrics.increment(f"{name}.hedges")
+            hedge = _executor.submit(fn)
+            pending.append(hedge)
+        elif not pending:
+            raise last_error
@@ -3,12 +3,22 @@ import logging
 import os
 
 import requests
+from tools import metrics, ollama
+from tools.circuit_breaker import CircuitOpen
+from tools.deadline import Deadline, DeadlineExceeded
 
 # --- Logging Setup ---
 log = logging.getLogger(__name__)
 
 # --- Configuration ---
 OLLAMA_HOST = os.getenv("OLLAMA_HOST_URL")
+OLLAMA_INTENT_MODEL = os.getenv("OLLAMA_INTENT_MODEL", "intent_analysis:latest")
+
+
+def _fallback(reason: str, search_needed: bool) -> bool:
+    """Counts a result that came from a fallback rather than the model."""
+    metrics.increment(f"intent.fallback.{reason}")
+    return search_needed
 
 
 def _extract_json_from_string(text: str) -> str:
@@ -21,65 +31,76 @@ def _extract_json_from_string(text: str) -> str:
     return "{}"
 
 
-def decide_if_search_is_needed(prompt: str, model: str) -> bool:
+def decide_if_search_is_needed(
+    prompt: str, model: str, deadline: Deadline | None = None, reserve: float = 0.0
+) -> bool:
     """
     Uses a fine-tuned LLM to determine if the user's prompt requires a web search.
     This corresponds to the "Intent Analysis" step in the flowchart.
+
+    With a deadline, the call gets whatever time is left after `reserve`.
     """
     if not OLLAMA_HOST:
         log.error("OLLAMA_HOST_URL is not set. Defaulting to performing a search.")
-        return True
+        return _fallback("no_host", True)
 
-    fine_tuned_model = "intent_analysis:latest"
+    fine_tuned_model = OLLAMA_INTENT_MODEL
     clean_json_str = "{}"
 
     try:
         log.info(f"Performing intent analysis for prompt: '{prompt}'")
         log.debug(f"Sending prompt to intent model '{fine_tuned_model}'.")
-        response = requests.post(
-            f"{OLLAMA_HOST}/api/generate",
-            json={
+        ollama_envelope = ollama.generate(
+            {
                 "model": fine_tuned_model,
                 "prompt": prompt,
-                "stream": False,
                 "format": "json",
                 "keep_alive": "5m",
                 "options": {"temperature": 0.0},
             },
-            timeout=60,
+            deadline=deadline,
+            reserve=reserve,
+            stage="intent",
         )
 
-        response.raise_for_status()
-
-        ollama_envelope = response.json()
         response_json_str = ollama_envelope.get("response", "{}")
         clean_json_str = _extract_json_from_string(response_json_str)
 
         intent_data = json.loads(clean_json_str)
-        search_needed = intent_data.get("search_needed", False)
+        if "search_needed" not in intent_data:
+            log.warning(f"Model response has no search_needed key: {intent_data}")
+            return _fallback("missing_key", False)
+        search_needed = intent_data["search_needed"]
 
         if not isinstance(search_needed, bool):
             log.warning(
                 f"Model returned a non-boolean for search_needed. Defaulting to False. Response: {search_needed}"
             )
-            return False
+            return _fallback("non_boolean", False)
 
         log.info(f"Intent analysis result: search_needed = {search_needed}")
+        metrics.increment(f"intent.result.{'search' if search_needed else 'chat'}")
         return search_needed
 
+    except DeadlineExceeded:
+        raise
+    except CircuitOpen as e:
+        # Nothing could answer the searched prompt either, so skip the search.
+        log.warning(f"Skipping intent analysis: {e}")
+        return _fallback("circuit_open", False)
     except requests.exceptions.RequestException as e:
         log.error(
             f"Error contacting Ollama for intent analysis: {e}. Defaulting to search."
         )
-        return True
+        return _fallback("request_error", True)
     except json.JSONDecodeError:
         log.error(
             f"Failed to decode JSON from Ollama intent response: {clean_json_str}. Defaulting to search."
         )
-        return True
+        return _fallback("invalid_json", True)
     except Exception as e:
         log.error(
             f"Unexpected error during intent analysis: {e}. Defaulting to search.",
             exc_info=True,
         )
-        return True
+        return _fallback("error", True)
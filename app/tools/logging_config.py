@@ -1,17 +1,22 @@
 import logging
-import os
-import sys
 
-from dotenv import load_dotenv
 from rich.logging import RichHandler
+from tools.settings import get_settings
+from tools.tracing import TraceIdFilter
+
+_configured = False
 
 
 def setup_logging():
     """
     Sets up a configurable logger using Rich for beautiful, colored output.
+    Also loads the settings, so call it first; later calls do nothing.
     """
-    load_dotenv()
-    log_level_str = os.getenv("LOG_LEVEL", "INFO").upper()
+    global _configured
+    if _configured:
+        return
+    _configured = True
+    log_level_str = get_settings().log_level
     log_level = getattr(logging, log_level_str, logging.INFO)
 
     # --- HANDLER SETUP ---
@@ -21,6 +26,9 @@ def setup_logging():
         markup=True,  # This is the key to enabling color tags like [bold red]
         show_path=False,
     )
+    # Lines logged while handling a traced request start with its trace ID.
+    handler.addFilter(TraceIdFilter())
+    handler.setFormatter(logging.Formatter("%(trace)s%(message)s"))
 
     # --- ROOT LOGGER SETUP ---
     root_logger = logging.getLogger()
@@ -0,0 +1,99 @@
+import logging
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Only the most recent samples of each timing are kept, so memory stays flat
+# no matter how long the process has been running.
+MAX_SAMPLES = 2048
+
+# --- Registry ---
+_lock = threading.Lock()
+_counters: dict[str, float] = {}
+_gauges: dict[str, float] = {}
+_timings: dict[str, deque] = {}
+
+
+def increment(name: str, value: float = 1) -> None:
+    """Adds `value` to the named counter."""
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def set_gauge(name: str, value: float) -> None:
+    """Sets the named gauge to its current value."""
+    with _lock:
+        _gauges[name] = value
+
+
+def observe(name: str, seconds: float) -> None:
+    """Records a single duration sample (in seconds) for the named timing."""
+    with _lock:
+        samples = _timings.get(name)
+        if samples is None:
+            samples = _timings[name] = deque(maxlen=MAX_SAMPLES)
+        samples.append(seconds)
+
+
+@contextmanager
+def timer(name: str):
+    """Times the wrapped block and records it under `name`, even if it raises."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def percentile(sorted_samples: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_samples)))
+    return sorted_samples[rank - 1]
+
+
+def summarize(samples: list[float]) -> dict:
+    """Returns count, mean and p50/p95/p99 for a list of durations."""
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered) if ordered else 0.0,
+        "p50": percentile(ordered, 50),
+        "p95": percentile(ordered, 95),
+        "p99": percentile(ordered, 99),
+        "max": ordered[-1] if ordered else 0.0,
+    }
+
+
+def get_counter(name: str) -> float:
+    """Returns the current value of a counter (0 if it was never incremented)."""
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def snapshot() -> dict:
+    """Returns a JSON-serializable copy of every counter, gauge and timing."""
+    with _lock:
+        counters = dict(_counters)
+        gauges = dict(_gauges)
+        timings = {name: list(samples) for name, samples in _timings.items()}
+    return {
+        "counters": counters,
+        "gauges": gauges,
+        "timings": {name: summarize(samples) for name, samples in timings.items()},
+    }
+
+
+def reset() -> None:
+    """Clears every metric. Used by the benchmarks between runs."""
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
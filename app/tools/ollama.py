@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+
+import requests
+from tools import circuit_breaker, metrics, tracing
+from tools.deadline import Deadline, RequestCancelled, bounded
+from tools.dispatcher import INTERACTIVE, PriorityDispatcher
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+OLLAMA_HOST = os.getenv("OLLAMA_HOST_URL")
+# Upper bound for a single generate call, with or without a deadline.
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", 60))
+# Calls this process sends to Ollama at once; match Ollama's OLLAMA_NUM_PARALLEL
+# so requests queue here, by priority, rather than inside Ollama.
+OLLAMA_MAX_CONCURRENT = int(os.getenv("OLLAMA_MAX_CONCURRENT", 4))
+# Slots background work may hold, and how long it defers to waiting users.
+OLLAMA_BACKGROUND_CONCURRENCY = int(os.getenv("OLLAMA_BACKGROUND_CONCURRENCY", 1))
+OLLAMA_BACKGROUND_MAX_DEFER = float(os.getenv("OLLAMA_BACKGROUND_MAX_DEFER", 120))
+
+# Every Ollama call in this process, generate and embed alike, goes through
+# the breaker and then the dispatcher.
+breaker = circuit_breaker.get("ollama")
+dispatcher = PriorityDispatcher(
+    "ollama.queue",
+    OLLAMA_MAX_CONCURRENT,
+    OLLAMA_BACKGROUND_CONCURRENCY,
+    OLLAMA_BACKGROUND_MAX_DEFER,
+)
+
+
+def generate(
+    payload: dict,
+    deadline: Deadline | None = None,
+    reserve: float = 0.0,
+    stage: str = "generate",
+    lane: str = INTERACTIVE,
+) -> dict:
+    """
+    Calls Ollama's /api/generate and returns the response envelope, with the
+    streamed chunks joined into `response`. The call waits for a slot in
+    `lane` first, so background work never delays a waiting user, and
+    raises CircuitOpen straight away while Ollama is known to be down.
+
+    Without a deadline this is a plain blocking request. With one, the call
+    is streamed so it can stop between chunks once the request is cancelled
+    or out of time; closing the connection makes Ollama stop generating.
+    `reserve` seconds are held back for the stages that follow.
+    """
+    with tracing.span(
+        f"ollama.{stage}", model=payload.get("model"), lane=lane
+    ) as span, breaker.guard(), dispatcher.slot(lane, deadline):
+        # The rest of the span is Ollama itself.
+        span.set("queued_seconds", round(span.elapsed(), 3))
+        if deadline is None:
+            response = requests.post(
+                f"{OLLAMA_HOST}/api/generate",
+                json={**payload, "stream": False},
+                timeout=OLLAMA_TIMEOUT,
+            )
+            response.raise_for_status()
+            return response.json()
+        return _generate_streamed(payload, deadline, reserve, stage)
+
+
+def _generate_streamed(
+    payload: dict, deadline: Deadline, reserve: float, stage: str
+) -> dict:
+    timeout = deadline.timeout(OLLAMA_TIMEOUT, reserve, stage)
+    parts, envelope = [], {}
+    with bounded(deadline, timeout, OLLAMA_TIMEOUT, stage), requests.post(
+        f"{OLLAMA_HOST}/api/generate",
+        json={**payload, "stream": True},
+        timeout=timeout,
+        stream=True,
+    ) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if deadline.cancelled:
+                metrics.increment(f"ollama.{stage}.aborted")
+                raise RequestCancelled(f"Client disconnected during {stage}.")
+            if deadline.remaining() <= reserve:
+                # Keep what was generated so far rather than nothing at all.
+                metrics.increment(f"ollama.{stage}.truncated")
+                log.warning(f"Deadline reached during {stage}, stopping early.")
+                break
+            if not line:
+                continue
+            envelope = json.loads(line)
+            parts.append(envelope.get("response", ""))
+            if envelope.get("done"):
+                break
+
+    return {**envelope, "response": "".join(parts)}
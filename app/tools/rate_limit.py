@@ -0,0 +1,157 @@
+"""
+Token-bucket rate limiting for prompts.
+
+Each scope (author, channel, guild) has a bucket per id holding up to
+`capacity` tokens, refilled continuously at `capacity / period` tokens per
+second. A prompt costs one token from every applicable bucket and is only
+let through if all of them can pay, so a throttled request never drains
+another scope's budget.
+
+Limits are written as "capacity/period_seconds", e.g. RATE_LIMIT_USER=5/60
+allows bursts of 5 and one more prompt every 12 seconds. "off" disables
+that scope; an empty or unset value uses the default.
+
+With RATE_LIMIT_STORE=postgres the buckets live in the database, so every
+bot and API instance shares them; the default keeps them in memory.
+"""
+
+import logging
+import os
+import threading
+import time
+
+from tools import metrics
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+RATE_LIMIT_STORE = (os.getenv("RATE_LIMIT_STORE") or "memory").lower()
+RATE_LIMIT_USER = os.getenv("RATE_LIMIT_USER") or "5/60"
+RATE_LIMIT_CHANNEL = os.getenv("RATE_LIMIT_CHANNEL") or "20/60"
+RATE_LIMIT_GUILD = os.getenv("RATE_LIMIT_GUILD") or "60/60"
+# Buckets untouched for this long are full again and can be forgotten.
+RATE_LIMIT_IDLE_SECONDS = 3600
+
+
+def parse_limit(spec: str) -> tuple[float, float] | None:
+    """Parses "capacity/period" into (capacity, tokens per second), or "off"."""
+    if spec.strip().lower() == "off":
+        return None
+    try:
+        capacity, period = (float(part) for part in spec.split("/"))
+    except ValueError:
+        log.error(f"Invalid rate limit '{spec}', expected 'capacity/seconds'.")
+        return None
+    if capacity <= 0 or period <= 0:
+        return None
+    return capacity, capacity / period
+
+
+class MemoryBucketStore:
+    """Buckets kept in this process only."""
+
+    def __init__(self):
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+
+    def take(self, buckets: list[tuple[str, float, float]], cost: float = 1.0):
+        """
+        Takes `cost` tokens from every (key, capacity, rate) bucket, or from
+        none of them. Returns None when allowed, otherwise the seconds until
+        the emptiest bucket can pay.
+        """
+        now = time.monotonic()
+        with self._lock:
+            levels, retry_after = [], 0.0
+            for key, capacity, rate in buckets:
+                tokens, updated = self._buckets.get(key, (capacity, now))
+                tokens = min(capacity, tokens + (now - updated) * rate)
+                levels.append((key, tokens))
+                if tokens < cost:
+                    retry_after = max(retry_after, (cost - tokens) / rate)
+
+            if retry_after:
+                return retry_after
+            for key, tokens in levels:
+                self._buckets[key] = (tokens - cost, now)
+            self._sweep(now)
+        return None
+
+    def _sweep(self, now: float):
+        if now - self._last_sweep < RATE_LIMIT_IDLE_SECONDS:
+            return
+        self._last_sweep = now
+        self._buckets = {
+            key: value
+            for key, value in self._buckets.items()
+            if now - value[1] < RATE_LIMIT_IDLE_SECONDS
+        }
+
+
+class PostgresBucketStore:
+    """Buckets shared through the database, for multi-instance deployments."""
+
+    def take(self, buckets: list[tuple[str, float, float]], cost: float = 1.0):
+        # Imported here so the bot only needs database drivers when it uses them.
+        from tools import vector_db
+
+        return vector_db.take_rate_limit_tokens(buckets, cost)
+
+
+class RateLimiter:
+    """Applies the configured per-scope limits to a set of ids."""
+
+    def __init__(self, name: str, limits: dict[str, tuple[float, float]], store=None):
+        self.name = name
+        self.limits = limits
+        self.store = store or MemoryBucketStore()
+
+    def check(self, ids: dict[str, str | int | None]) -> float | None:
+        """
+        Spends one token for each scope in `ids` that has a limit, e.g.
+        `{"user": 123, "channel": 456, "guild": None}`. Returns None when
+        allowed, or the seconds to wait before trying again.
+
+        A store that fails lets the request through rather than blocking
+        every user because of an outage.
+        """
+        buckets = [
+            (f"{self.name}:{scope}:{value}", *self.limits[scope])
+            for scope, value in ids.items()
+            if value is not None and scope in self.limits
+        ]
+        if not buckets:
+            return None
+        try:
+            retry_after = self.store.take(buckets)
+        except Exception as e:
+            metrics.increment(f"rate_limit.{self.name}.errors")
+            log.error(f"Rate limit store failed, allowing request: {e}")
+            return None
+
+        if retry_after is None:
+            metrics.increment(f"rate_limit.{self.name}.allowed")
+            return None
+        metrics.increment(f"rate_limit.{self.name}.throttled")
+        log.info(f"Throttled {ids}, retry in {retry_after:.1f}s.")
+        return retry_after
+
+
+def from_env(name: str) -> RateLimiter:
+    """
+    Builds a limiter from the RATE_LIMIT_* settings. `name` keeps the
+    buckets (and metrics) of different callers apart in a shared store.
+    """
+    limits = {
+        scope: limit
+        for scope, limit in (
+            ("user", parse_limit(RATE_LIMIT_USER)),
+            ("channel", parse_limit(RATE_LIMIT_CHANNEL)),
+            ("guild", parse_limit(RATE_LIMIT_GUILD)),
+        )
+        if limit is not None
+    }
+    store = PostgresBucketStore() if RATE_LIMIT_STORE == "postgres" else None
+    return RateLimiter(name, limits, store)
@@ -0,0 +1,91 @@
+import logging
+import os
+
+import numpy as np
+from tools import embedding_cache, metrics
+from tools.deadline import Deadline, DeadlineExceeded
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+OLLAMA_EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL") or "nomic-embed-text:v1.5"
+# Rough characters-per-token ratio used to keep the context within budget.
+CHARS_PER_TOKEN = 4
+# Below this many seconds of spare budget, keep the search order instead.
+RERANK_MIN_SECONDS = float(os.getenv("RERANK_MIN_SECONDS", 2))
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _result_text(result: dict) -> str:
+    return f"{result.get('title', '')}\n{result.get('content', '')}".strip()
+
+
+def cosine_similarities(query: np.ndarray, matrix: np.ndarray) -> np.ndarray:
+    """Cosine similarity of one vector against every row of a matrix."""
+    norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+    norms[norms == 0] = 1.0
+    return (matrix @ query) / norms
+
+
+def _rank(prompt: str, texts: list[str], deadline: Deadline | None, reserve: float):
+    """Indices of `texts` from most to least similar to the prompt."""
+    try:
+        with metrics.timer("search.rerank"):
+            # Snippets are throwaway, so only the in-memory tier caches them.
+            vectors = embedding_cache.get_embeddings(
+                [prompt, *texts],
+                OLLAMA_EMBEDDING_MODEL,
+                persist=False,
+                deadline=deadline,
+                reserve=reserve,
+            )
+            scores = cosine_similarities(vectors[0], np.stack(vectors[1:]))
+            return np.argsort(-scores)
+    except DeadlineExceeded:
+        raise
+    except Exception as e:
+        log.warning(f"Reranking failed, keeping search order: {e}")
+        metrics.increment("search.rerank.errors")
+        return range(len(texts))
+
+
+def select_results(
+    prompt: str,
+    candidates: list[dict],
+    top_n: int,
+    token_budget: int,
+    deadline: Deadline | None = None,
+    reserve: float = 0.0,
+) -> list[dict]:
+    """
+    Scores every candidate against the prompt and returns the best `top_n`
+    that fit in `token_budget`, most relevant first.
+
+    The prompt and all snippets are embedded in a single batch. If embedding
+    fails, or the deadline leaves no room for it, candidates keep their
+    original search-engine order. The embedding call itself is bounded by
+    the deadline, less `reserve`; running out of it, or the client going
+    away, raises `DeadlineExceeded` like the rest of the search.
+    """
+    texts = [_result_text(r) for r in candidates]
+    if deadline is not None and deadline.remaining() - reserve < RERANK_MIN_SECONDS:
+        log.info("Not enough time left to rerank, keeping search order.")
+        metrics.increment("search.rerank.skipped")
+        order = range(len(candidates))
+    else:
+        order = _rank(prompt, texts, deadline, reserve)
+
+    selected, used_tokens = [], 0
+    for index in order:
+        cost = estimate_tokens(texts[index])
+        if used_tokens + cost > token_budget:
+            continue
+        selected.append(candidates[index])
+        used_tokens += cost
+        if len(selected) >= top_n:
+            break
+    return selected
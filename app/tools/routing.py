@@ -0,0 +1,110 @@
+"""
+Model cascade routing for the final answer.
+
+Most mentions are chit-chat that a small model answers well in a fraction
+of the time, so each request is routed to a tier:
+
+- "large" when the prompt needed a search (the answer has to work with the
+  search context), or is longer than ROUTING_SHORT_PROMPT_CHARS.
+- "small" for everything else: greetings, one-liners, banter.
+
+Each tier has its own model and `num_predict` cap. A client that names a
+model in its request bypasses routing and gets the "requested" tier.
+
+Routing is off unless MODEL_ROUTING is set, and the small tier uses the
+large model until MODEL_TIER_SMALL names another one. If Ollama does not
+have the small model, the answer falls back to the large tier.
+"""
+
+import logging
+import os
+from dataclasses import dataclass
+
+from tools import metrics
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "false").lower() == "true"
+MODEL_TIER_LARGE = os.getenv("MODEL_TIER_LARGE") or "llama2-uncensored:7b"
+MODEL_TIER_SMALL = os.getenv("MODEL_TIER_SMALL") or MODEL_TIER_LARGE
+# 0 leaves the answer length to the model.
+MODEL_TIER_LARGE_NUM_PREDICT = int(os.getenv("MODEL_TIER_LARGE_NUM_PREDICT", 1024))
+MODEL_TIER_SMALL_NUM_PREDICT = int(os.getenv("MODEL_TIER_SMALL_NUM_PREDICT", 256))
+ROUTING_SHORT_PROMPT_CHARS = int(os.getenv("ROUTING_SHORT_PROMPT_CHARS", 120))
+
+
+@dataclass(frozen=True)
+class Tier:
+    name: str
+    model: str
+    num_predict: int  # 0 means no cap
+
+    def cap(self, num_predict: int | None) -> int | None:
+        """The tighter of the tier's cap and `num_predict` (None = no cap)."""
+        caps = [n for n in (self.num_predict, num_predict) if n]
+        return min(caps) if caps else None
+
+
+LARGE = Tier("large", MODEL_TIER_LARGE, MODEL_TIER_LARGE_NUM_PREDICT)
+SMALL = Tier("small", MODEL_TIER_SMALL, MODEL_TIER_SMALL_NUM_PREDICT)
+
+
+def default_model() -> str:
+    """The model for work that is not routed, such as query generation."""
+    return LARGE.model
+
+
+def choose_tier(
+    prompt: str,
+    search_needed: bool,
+    has_search_context: bool,
+    requested_model: str | None = None,
+) -> Tier:
+    """Picks the tier that should write the final answer."""
+    if requested_model:
+        tier = Tier("requested", requested_model, 0)
+    elif not MODEL_ROUTING:
+        tier = LARGE
+    elif search_needed or has_search_context:
+        tier = LARGE
+    elif len(prompt) > ROUTING_SHORT_PROMPT_CHARS:
+        tier = LARGE
+    else:
+        tier = SMALL
+    log.info(f"Routing the answer to the {tier.name} tier ({tier.model}).")
+    metrics.increment(f"routing.{tier.name}.requests")
+    return tier
+
+
+def fallback_tier(tier: Tier, error: Exception) -> Tier | None:
+    """
+    The large tier if `error` is Ollama's 404 for a small model that is not
+    installed, so a missing model costs speed rather than the answer.
+    None for any other error.
+    """
+    response = getattr(error, "response", None)
+    if tier is not SMALL or response is None or response.status_code != 404:
+        return None
+    log.warning(
+        f"Model '{tier.model}' is not available in Ollama, answering with the "
+        f"large tier ({LARGE.model}) instead."
+    )
+    metrics.increment("routing.small.missing_model")
+    return LARGE
+
+
+def record_usage(tier: Tier, envelope: dict, seconds: float):
+    """Counts the latency and token usage of a tier's answer."""
+    metrics.observe(f"routing.{tier.name}.latency", seconds)
+    prompt_tokens = envelope.get("prompt_eval_count", 0)
+    output_tokens = envelope.get("eval_count", 0)
+    metrics.increment(f"routing.{tier.name}.prompt_tokens", prompt_tokens)
+    metrics.increment(f"routing.{tier.name}.output_tokens", output_tokens)
+    if envelope.get("done_reason") == "length":
+        metrics.increment(f"routing.{tier.name}.capped")
+    if output_tokens and envelope.get("eval_duration"):
+        # Ollama reports durations in nanoseconds.
+        rate = output_tokens / (envelope["eval_duration"] / 1e9)
+        metrics.set_gauge(f"routing.{tier.name}.tokens_per_second", rate)
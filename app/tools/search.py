@@ -1,9 +1,17 @@
 import json
 import logging
 import os
-from urllib.parse import quote_plus
+import random
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
 
 import requests
+from tools import circuit_breaker, metrics, ollama, rerank, search_dedupe, tracing
+from tools.circuit_breaker import CircuitOpen
+from tools.deadline import Deadline, DeadlineExceeded, bounded
+from tools.hedging import LatencyTracker, hedged_call
 from tools.system_prompts import get_search_query_generator_prompt
 
 # --- Logging Setup ---
@@ -12,6 +20,79 @@ log = logging.getLogger(__name__)
 # --- Configuration ---
 SEARXNG_URL = os.getenv("SEARXNG_URL")
 OLLAMA_HOST = os.getenv("OLLAMA_HOST_URL")
+# Rerank pooled results from all queries by similarity to the prompt instead
+# of concatenating the first few results of each query.
+SEARCH_RERANK = os.getenv("SEARCH_RERANK", "true").lower() == "true"
+SEARCH_CANDIDATES_PER_QUERY = int(os.getenv("SEARCH_CANDIDATES_PER_QUERY", 8))
+SEARCH_TOP_N = int(os.getenv("SEARCH_TOP_N", 5))
+SEARCH_TOKEN_BUDGET = int(os.getenv("SEARCH_TOKEN_BUDGET", 1200))
+# Timeouts adapt to observed latency: multiplier x p99, within [min, max].
+SEARXNG_TIMEOUT_MIN = float(os.getenv("SEARXNG_TIMEOUT_MIN", 3))
+SEARXNG_TIMEOUT_MAX = float(os.getenv("SEARXNG_TIMEOUT_MAX", 15))
+SEARXNG_TIMEOUT_MULTIPLIER = float(os.getenv("SEARXNG_TIMEOUT_MULTIPLIER", 2))
+# Send a duplicate request when the first is slower than the p95 latency.
+SEARXNG_HEDGE = os.getenv("SEARXNG_HEDGE", "true").lower() == "true"
+# Restrict each query to the N fastest engines seen so far (0 = all engines).
+SEARXNG_FAST_ENGINES = int(os.getenv("SEARXNG_FAST_ENGINES", 0))
+SEARXNG_CATEGORIES = os.getenv("SEARXNG_CATEGORIES", "")
+# Share of restricted queries that still go to every engine to refresh stats.
+SEARXNG_EXPLORE_RATE = float(os.getenv("SEARXNG_EXPLORE_RATE", 0.1))
+# Results are reused for SEARCH_CACHE_TTL seconds, and while SearXNG is failing
+# results up to SEARCH_CACHE_MAX_STALE seconds old are served instead of none.
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", 512))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 300))
+SEARCH_CACHE_MAX_STALE = float(os.getenv("SEARCH_CACHE_MAX_STALE", 86400))
+
+# --- SearXNG Latency Stats ---
+_searxng_latency = LatencyTracker()
+_engine_latency: dict[str, LatencyTracker] = {}
+_engine_outcomes: dict[str, list[int]] = {}  # engine -> [answered, unresponsive]
+_engine_lock = threading.Lock()
+_searxng_breaker = circuit_breaker.get("searxng")
+
+# --- Search Result Cache ---
+# normalized query -> (fetched_at, results), least recently used first.
+_result_cache: OrderedDict[str, tuple[float, list[dict]]] = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cache_key(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+def _cache_get(query: str) -> tuple[float, list[dict]] | None:
+    """Returns (age in seconds, results) for a cached query."""
+    key = _cache_key(query)
+    with _cache_lock:
+        entry = _result_cache.get(key)
+        if entry is None:
+            return None
+        _result_cache.move_to_end(key)
+    fetched_at, results = entry
+    return time.monotonic() - fetched_at, results
+
+
+def _cache_put(query: str, results: list[dict]):
+    if SEARCH_CACHE_SIZE <= 0:
+        return
+    key = _cache_key(query)
+    with _cache_lock:
+        _result_cache[key] = (time.monotonic(), results)
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > SEARCH_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+
+
+def _stale_results(query: str, max_results: int) -> list[dict]:
+    """Cached results for a query SearXNG cannot answer right now, if any."""
+    cached = _cache_get(query)
+    if cached is None or cached[0] > SEARCH_CACHE_MAX_STALE:
+        metrics.increment("search.cache.stale_misses")
+        return []
+    age, results = cached
+    metrics.increment("search.cache.stale_hits")
+    log.warning(f"Serving results for '{query}' from {age / 60:.0f} minutes ago.")
+    return results[:max_results]
 
 
 def _extract_json_from_string(text: str) -> str:
@@ -28,7 +109,9 @@ def _extract_json_from_string(text: str) -> str:
     return "{}"
 
 
-def _generate_search_queries(prompt: str, model: str) -> list[str]:
+def _generate_search_queries(
+    prompt: str, model: str, deadline: Deadline | None = None, reserve: float = 0.0
+) -> list[str]:
     """
     Uses an LLM to generate effective search queries.
     """
@@ -43,21 +126,18 @@ def _generate_search_queries(prompt: str, model: str) -> list[str]:
 
     try:
         log.info(f"Generating search queries for prompt: '{prompt}'")
-        response = requests.post(
-            f"{OLLAMA_HOST}/api/generate",
-            json={
+        ollama_envelope = ollama.generate(
+            {
                 "model": model,
                 "prompt": full_prompt,
-                "stream": False,
                 "format": "json",
                 "keep_alive": "5m",
                 "options": {"temperature": 0.0},
             },
-            timeout=60,
+            deadline=deadline,
+            reserve=reserve,
+            stage="search_queries",
         )
-        response.raise_for_status()
-
-        ollama_envelope = response.json()
         log.debug(f"Raw Ollama search query response: {ollama_envelope}")
         response_json_str = ollama_envelope.get("response", "{}")
         clean_json_str = _extract_json_from_string(response_json_str)
@@ -77,6 +157,11 @@ def _generate_search_queries(prompt: str, model: str) -> list[str]:
             log.info("LLM decided no search is necessary.")
         return search_queries
 
+    except DeadlineExceeded:
+        raise
+    except CircuitOpen as e:
+        log.warning(f"Searching for the prompt itself: {e}")
+        return [prompt]
     except requests.exceptions.RequestException as e:
         log.error(f"Error contacting Ollama to generate search queries: {e}")
         return [prompt]
@@ -88,61 +173,201 @@ def _generate_search_queries(prompt: str, model: str) -> list[str]:
         return [prompt]
 
 
-def query_searxng(query: str, max_results: int = 3) -> str:
+def _record_engine_stats(data: dict, elapsed: float):
     """
-    Queries the local SearXNG instance and returns a formatted string of results.
+    Attributes a response's latency to the engines that contributed results
+    and counts engines SearXNG reported as unresponsive.
+    """
+    answered = set()
+    for result in data.get("results", []):
+        answered.update(result.get("engines") or [result.get("engine")])
+    answered.discard(None)
+    unresponsive = {entry[0] for entry in data.get("unresponsive_engines", [])}
+
+    with _engine_lock:
+        for engine in answered:
+            tracker = _engine_latency.setdefault(engine, LatencyTracker(min_samples=5))
+            tracker.observe(elapsed)
+            _engine_outcomes.setdefault(engine, [0, 0])[0] += 1
+        for engine in unresponsive:
+            _engine_outcomes.setdefault(engine, [0, 0])[1] += 1
+    for engine in answered:
+        metrics.observe(f"searxng.engine.{engine}", elapsed)
+    for engine in unresponsive:
+        metrics.increment(f"searxng.engine.{engine}.unresponsive")
+
+
+def _choose_engines() -> list[str] | None:
+    """Returns the fastest reliable engines, or None to let SearXNG use all."""
+    if SEARXNG_FAST_ENGINES <= 0 or random.random() < SEARXNG_EXPLORE_RATE:
+        return None
+
+    ranked = []
+    with _engine_lock:
+        for engine, tracker in _engine_latency.items():
+            answered, unresponsive = _engine_outcomes.get(engine, [0, 0])
+            p75 = tracker.percentile(75)
+            if p75 is None or unresponsive > answered:
+                continue
+            ranked.append((p75, engine))
+    if len(ranked) < SEARXNG_FAST_ENGINES:
+        return None
+    return [engine for _, engine in sorted(ranked)[:SEARXNG_FAST_ENGINES]]
+
+
+def get_searxng_stats() -> dict:
+    """Latency percentiles for SearXNG overall and per engine."""
+    with _engine_lock:
+        engines = {
+            engine: {
+                "p50": tracker.percentile(50),
+                "p95": tracker.percentile(95),
+                "answered": _engine_outcomes.get(engine, [0, 0])[0],
+                "unresponsive": _engine_outcomes.get(engine, [0, 0])[1],
+            }
+            for engine, tracker in _engine_latency.items()
+        }
+    return {
+        "p50": _searxng_latency.percentile(50),
+        "p95": _searxng_latency.percentile(95),
+        "p99": _searxng_latency.percentile(99),
+        "engines": engines,
+    }
+
+
+def _fetch_searxng_results(
+    query: str,
+    max_results: int,
+    deadline: Deadline | None = None,
+    reserve: float = 0.0,
+) -> list[dict]:
+    """
+    Queries the local SearXNG instance and returns up to `max_results` raw
+    result dicts (title, content, url, ...).
+
+    The timeout adapts to recent latency (and never outlasts the deadline),
+    and a request still running after the p95 latency is hedged with a
+    duplicate; the first answer wins. Recent results for the same query are
+    reused, and older ones stand in while SearXNG is failing or its circuit
+    breaker is open.
     """
     if not SEARXNG_URL:
         log.error("SEARXNG_URL is not set in environment variables.")
-        return ""
+        return []
+
+    cached = _cache_get(query)
+    if cached is not None and cached[0] < SEARCH_CACHE_TTL:
+        metrics.increment("search.cache.hits")
+        log.debug(f"Using cached results for '{query}'.")
+        return cached[1][:max_results]
+    metrics.increment("search.cache.misses")
 
-    encoded_query = quote_plus(query)
-    search_url = f"{SEARXNG_URL}/search?q={encoded_query}&format=json"
+    params = {"q": query, "format": "json"}
+    engines = _choose_engines()
+    if engines:
+        params["engines"] = ",".join(engines)
+    if SEARXNG_CATEGORIES:
+        params["categories"] = SEARXNG_CATEGORIES
+    search_url = f"{SEARXNG_URL}/search?{urlencode(params)}"
+    adaptive_timeout = _searxng_latency.adaptive_timeout(
+        SEARXNG_TIMEOUT_MULTIPLIER, SEARXNG_TIMEOUT_MIN, SEARXNG_TIMEOUT_MAX
+    )
+    timeout = adaptive_timeout
+    if deadline is not None:
+        timeout = deadline.timeout(adaptive_timeout, reserve, "search")
+    hedge_delay = _searxng_latency.percentile(95) if SEARXNG_HEDGE else None
     log.info(f"Querying SearXNG for: '{query}'")
-    # This is the corrected line - it now logs the relevant URL
-    log.debug(f"Executing search URL: {search_url}")
+    log.debug(f"Executing search URL: {search_url} (timeout {timeout:.1f}s)")
 
-    try:
-        response = requests.get(search_url, timeout=15)
-        response.raise_for_status()
+    def attempt() -> dict:
+        start = time.monotonic()
+        try:
+            response = requests.get(search_url, timeout=timeout)
+            response.raise_for_status()
+        except requests.exceptions.Timeout:
+            # Count timeouts at the limit so percentiles drift up, not down.
+            _searxng_latency.observe(timeout)
+            raise
+        elapsed = time.monotonic() - start
+        _searxng_latency.observe(elapsed)
+        metrics.observe("searxng.request", elapsed)
         data = response.json()
+        _record_engine_stats(data, elapsed)
+        return data
+
+    try:
+        # A timeout the deadline cut short becomes DeadlineExceeded, which
+        # the breaker ignores and the caller stops searching on.
+        with _searxng_breaker.guard(), bounded(
+            deadline, timeout, adaptive_timeout, "search"
+        ):
+            data = hedged_call(attempt, hedge_delay, timeout, "searxng")
         log.debug(f"Received {len(data.get('results', []))} results from SearXNG.")
         results = data.get("results", [])
-        if not results:
+        if results:
+            _cache_put(query, results)
+        else:
             log.info(f"No results found for query: '{query}'")
-            return ""
-        context = [
-            f"Title: {r.get('title', 'N/A')}\nContent: {r.get('content', 'N/A')}"
-            for r in results[:max_results]
-        ]
-        return "\n\n".join(context)
-    except requests.exceptions.RequestException as e:
+        return results[:max_results]
+    except DeadlineExceeded:
+        raise
+    except CircuitOpen as e:
+        log.warning(f"Not querying SearXNG: {e}")
+        return _stale_results(query, max_results)
+    except (requests.exceptions.RequestException, TimeoutError) as e:
         log.error(f"Error connecting to SearXNG at {SEARXNG_URL}: {e}")
-        return ""
+        return _stale_results(query, max_results)
     except Exception as e:
         log.error(
             f"Unexpected error during SearXNG search for '{query}': {e}", exc_info=True
         )
-        return ""
+        return []
+
 
+def _format_result(result: dict) -> str:
+    title, content = result.get("title", "N/A"), result.get("content", "N/A")
+    return f"Title: {title}\nContent: {content}"
 
-def think_and_search(prompt: str, model: str) -> tuple[str | None, list[str]]:
+
+def query_searxng(query: str, max_results: int = 3) -> str:
+    """
+    Queries the local SearXNG instance and returns a formatted string of results.
+    """
+    results = _fetch_searxng_results(query, max_results)
+    return "\n\n".join(_format_result(r) for r in results)
+
+
+def think_and_search(
+    prompt: str, model: str, deadline: Deadline | None = None, reserve: float = 0.0
+) -> tuple[str | None, list[str]]:
     """
     Orchestrates the intelligent search process.
+
+    With a deadline, every call gets the time left after `reserve` seconds
+    are held back for the final answer. Queries that no longer fit are
+    skipped and the search works with whatever results it already has.
     """
-    search_queries = _generate_search_queries(prompt, model)
+    search_queries = _generate_search_queries(prompt, model, deadline, reserve)
     if not search_queries:
         return None, search_queries
 
+    if SEARCH_RERANK:
+        context = _search_and_rerank(prompt, search_queries, deadline, reserve)
+        return context, search_queries
+
+    # Dedupe across all queries, then keep each query's results together.
+    results_by_query = _fetch_all(search_queries, 3, deadline, reserve)
+    kept = {
+        id(r)
+        for r in search_dedupe.dedupe_results(
+            [r for results in results_by_query for r in results]
+        )
+    }
     all_results_context = []
-    seen_content = set()
-    for query in search_queries:
-        if not query.strip():
-            continue
-        query_results = query_searxng(query)
-        if query_results and query_results not in seen_content:
+    for results in results_by_query:
+        query_results = "\n\n".join(_format_result(r) for r in results if id(r) in kept)
+        if query_results:
             all_results_context.append(query_results)
-            seen_content.add(query_results)
 
     if not all_results_context:
         log.warning("All search queries returned no results.")
@@ -153,3 +378,74 @@ def think_and_search(prompt: str, model: str) -> tuple[str | None, list[str]]:
         f"Successfully combined results from {len(all_results_context)} search queries."
     )
     return final_context, search_queries
+
+
+def _fetch_all(
+    search_queries: list[str],
+    max_results: int,
+    deadline: Deadline | None,
+    reserve: float,
+) -> list[list[dict]]:
+    """Fetches each query in turn, stopping early once the budget is spent."""
+    results_by_query = []
+    for index, query in enumerate(search_queries):
+        if not query.strip():
+            continue
+        try:
+            with tracing.span("searxng", query=query) as span:
+                results = _fetch_searxng_results(query, max_results, deadline, reserve)
+                span.set("results", len(results))
+            results_by_query.append(results)
+        except DeadlineExceeded:
+            if deadline is not None and deadline.cancelled:
+                raise
+            skipped = len(search_queries) - index
+            metrics.increment("deadline.search_queries_skipped", skipped)
+            log.warning(f"Out of search budget, skipping {skipped} queries.")
+            break
+    return results_by_query
+
+
+def _search_and_rerank(
+    prompt: str,
+    search_queries: list[str],
+    deadline: Deadline | None = None,
+    reserve: float = 0.0,
+) -> str:
+    """
+    Pools the candidates from every query, keeps the ones most similar to the
+    prompt within the token budget, and formats them as search context.
+    """
+    candidates = [
+        r
+        for results in _fetch_all(
+            search_queries, SEARCH_CANDIDATES_PER_QUERY, deadline, reserve
+        )
+        for r in results
+    ]
+
+    if not candidates:
+        log.warning("All search queries returned no results.")
+        return ""
+    # Fewer candidates also means fewer snippets to embed.
+    candidates = search_dedupe.dedupe_results(candidates)
+
+    with tracing.span("search.rerank", candidates=len(candidates)):
+        selected = rerank.select_results(
+            prompt, candidates, SEARCH_TOP_N, SEARCH_TOKEN_BUDGET, deadline, reserve
+        )
+    final_context = "\n\n".join(_format_result(r) for r in selected)
+
+    candidate_chars = sum(len(_format_result(r)) for r in candidates)
+    metrics.increment("search.rerank.candidate_chars", candidate_chars)
+    metrics.increment("search.rerank.selected_chars", len(final_context))
+    total_candidate = metrics.get_counter("search.rerank.candidate_chars")
+    total_selected = metrics.get_counter("search.rerank.selected_chars")
+    metrics.set_gauge(
+        "search.rerank.context_reduction", 1 - total_selected / total_candidate
+    )
+    log.info(
+        f"Kept {len(selected)} of {len(candidates)} search results "
+        f"({len(final_context)} of {candidate_chars} characters)."
+    )
+    return final_context
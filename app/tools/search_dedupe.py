@@ -0,0 +1,115 @@
+import hashlib
+import logging
+import os
+import re
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from tools import metrics
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+# Results whose 64-bit SimHashes differ in at most this many bits are treated
+# as the same article (mirrors, syndicated copies, AMP pages). Snippets are
+# short, so a one-word edit already flips ~9 bits while unrelated snippets
+# sit around 32.
+SEARCH_NEAR_DUP_DISTANCE = int(os.getenv("SEARCH_NEAR_DUP_DISTANCE", 12))
+SHINGLE_SIZE = 3
+
+TRACKING_PARAMS = {"fbclid", "gclid", "mc_cid", "mc_eid", "ref", "ref_src", "igshid"}
+HOST_PREFIXES = ("www.", "m.", "amp.", "mobile.")
+WORD_RE = re.compile(r"\w+")
+
+
+def canonical_url(url: str) -> str:
+    """
+    Reduces a URL to the form shared by its trivial variants: scheme, host
+    prefixes like www./m., fragments, tracking parameters, parameter order,
+    trailing slashes and AMP suffixes are all ignored.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix) :]
+            break
+    path = parts.path.rstrip("/")
+    if path.endswith("/amp"):
+        path = path[: -len("/amp")]
+    query = urlencode(
+        sorted(
+            (key, value)
+            for key, value in parse_qsl(parts.query, keep_blank_values=True)
+            if not key.lower().startswith("utm_") and key.lower() not in TRACKING_PARAMS
+        )
+    )
+    return urlunsplit(("", host, path, query, ""))
+
+
+def simhash(text: str) -> int:
+    """64-bit SimHash over word shingles of the text."""
+    words = WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        shingles = [" ".join(words)]
+    else:
+        shingles = [
+            " ".join(words[i : i + SHINGLE_SIZE])
+            for i in range(len(words) - SHINGLE_SIZE + 1)
+        ]
+
+    weights = [0] * 64
+    for shingle in shingles:
+        digest = hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "big")
+        for bit in range(64):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(64) if weights[bit] > 0)
+
+
+def _richness(result: dict) -> int:
+    return len(result.get("content") or "") + len(result.get("title") or "")
+
+
+def dedupe_results(results: list[dict]) -> list[dict]:
+    """
+    Drops results that point at the same page or carry near-identical text,
+    keeping the richest variant of each in the position of its first copy.
+    Results without any title or content words are matched by URL only,
+    since their SimHashes would all be the same.
+    """
+    kept: list[dict] = []
+    by_url: dict[str, int] = {}
+    fingerprints: list[int | None] = []
+
+    for result in results:
+        url = canonical_url(result.get("url") or "")
+        text = f"{result.get('title') or ''} {result.get('content') or ''}"
+        fingerprint = simhash(text) if WORD_RE.search(text) else None
+
+        duplicate_of = by_url.get(url) if url else None
+        if duplicate_of is None and fingerprint is not None:
+            for index, existing in enumerate(fingerprints):
+                if existing is None:
+                    continue
+                distance = bin(existing ^ fingerprint).count("1")
+                if distance <= SEARCH_NEAR_DUP_DISTANCE:
+                    duplicate_of = index
+                    break
+
+        if duplicate_of is None:
+            if url:
+                by_url[url] = len(kept)
+            kept.append(result)
+            fingerprints.append(fingerprint)
+        elif _richness(result) > _richness(kept[duplicate_of]):
+            kept[duplicate_of] = result
+            fingerprints[duplicate_of] = fingerprint
+            if url:
+                by_url[url] = duplicate_of
+
+    removed = len(results) - len(kept)
+    if removed:
+        metrics.increment("search.dedupe.removed", removed)
+        log.info(f"Removed {removed} duplicate search results.")
+    return kept
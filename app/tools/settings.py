@@ -0,0 +1,79 @@
+"""
+Process-wide settings, loaded once.
+
+`get_settings()` reads the .env file the first time it is called and
+returns the same frozen object afterwards. It runs before anything else in
+every entry point (through `setup_logging`), so module-level `os.getenv`
+defaults elsewhere see the .env values too.
+
+Deliberately a plain dataclass rather than pydantic-settings: the bot never
+imports pydantic otherwise, and that import alone would slow its start.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() == "true"
+
+
+@dataclass(frozen=True)
+class Settings:
+    log_level: str
+    discord_token: str | None
+    api_base_url: str
+    # uvicorn's auto-reload, for development only: it adds a watcher process.
+    api_reload: bool
+    db_host: str | None
+    db_port: int | None
+    db_name: str | None
+    db_user: str | None
+    db_password: str | None
+    db_schema: str | None
+    # Sharding: shard_count 0 lets Discord recommend one. main.py sets
+    # shard_ids for each bot process when bot_processes is more than 1.
+    bot_sharding: bool
+    bot_shard_count: int
+    bot_shard_ids: tuple[int, ...] | None
+    bot_processes: int
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        port = os.getenv("DB_PORT")
+        shard_ids = os.getenv("BOT_SHARD_IDS", "")
+        return cls(
+            log_level=os.getenv("LOG_LEVEL", "INFO").upper(),
+            discord_token=os.getenv("DISCORD_TOKEN"),
+            api_base_url=os.getenv("API_BASE_URL", "http://localhost:8000"),
+            api_reload=_env_bool("API_RELOAD", "false"),
+            db_host=os.getenv("DB_HOST"),
+            db_port=int(port) if port else None,
+            db_name=os.getenv("DB_NAME"),
+            db_user=os.getenv("DB_USER"),
+            db_password=os.getenv("DB_PASSWORD"),
+            db_schema=os.getenv("DB_SCHEMA"),
+            bot_sharding=_env_bool("BOT_SHARDING", "false"),
+            bot_shard_count=int(os.getenv("BOT_SHARD_COUNT", 0)),
+            bot_shard_ids=(
+                tuple(int(i) for i in shard_ids.split(",")) if shard_ids else None
+            ),
+            bot_processes=max(1, int(os.getenv("BOT_PROCESSES", 1))),
+        )
+
+
+_settings: Settings | None = None
+_lock = threading.Lock()
+
+
+def get_settings() -> Settings:
+    """Loads .env (without overriding the real environment) on first use."""
+    global _settings
+    with _lock:
+        if _settings is None:
+            from dotenv import load_dotenv
+
+            load_dotenv()
+            _settings = Settings.from_env()
+        return _settings
@@ -0,0 +1,94 @@
+"""
+Shard layout and shard statistics for the Discord bot.
+
+With sharding on, the bot runs as an AutoShardedBot. `main.py` can also
+split the shards over BOT_PROCESSES bot processes, each given a contiguous
+range of shard IDs, so one busy process does not slow every guild down.
+
+Every BOT_STATS_INTERVAL seconds each bot process records, per shard, the
+gateway latency and how many messages it received, plus the process's
+memory and how much of it that comes to per 1,000 guilds.
+"""
+
+import json
+import logging
+import math
+import os
+import resource
+
+from tools import metrics
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+DISCORD_GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+
+
+def shard_ids_for(process_index: int, processes: int, shard_count: int) -> list[int]:
+    """The contiguous range of shard IDs run by one of `processes` processes."""
+    per_process, extra = divmod(shard_count, processes)
+    start = process_index * per_process + min(process_index, extra)
+    end = start + per_process + (1 if process_index < extra else 0)
+    return list(range(start, end))
+
+
+def recommended_shard_count(token: str) -> int:
+    """Asks Discord how many shards the bot should run."""
+    # Only needed when splitting shards over processes, so imported here.
+    from urllib.request import Request, urlopen
+
+    request = Request(DISCORD_GATEWAY_URL, headers={"Authorization": f"Bot {token}"})
+    with urlopen(request, timeout=10) as response:
+        return int(json.load(response)["shards"])
+
+
+def process_memory_mb() -> float:
+    """Resident memory of this process in MB (peak RSS where /proc is missing)."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in KB on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if os.uname().sysname == "Darwin" else peak / 1024
+
+
+class ShardStats:
+    """Message rates per shard between two reports."""
+
+    def __init__(self):
+        self._reported: dict[int, float] = {}
+
+    def record_message(self, shard_id: int):
+        metrics.increment(f"bot.shard.{shard_id}.messages")
+
+    def report(
+        self, latencies: list[tuple[int, float]], guilds: int, interval: float
+    ) -> dict:
+        """Updates the bot.* gauges and returns what it recorded."""
+        shards = {}
+        for shard_id, latency in latencies:
+            messages = metrics.get_counter(f"bot.shard.{shard_id}.messages")
+            rate = (messages - self._reported.get(shard_id, 0)) / interval
+            self._reported[shard_id] = messages
+            shard = {"messages_per_second": rate}
+            metrics.set_gauge(f"bot.shard.{shard_id}.messages_per_second", rate)
+            # Latency is inf until the shard's first heartbeat is acknowledged.
+            if math.isfinite(latency):
+                shard["latency"] = latency
+                metrics.set_gauge(f"bot.shard.{shard_id}.latency", latency)
+            shards[shard_id] = shard
+
+        memory_mb = process_memory_mb()
+        metrics.set_gauge("bot.guilds", guilds)
+        metrics.set_gauge("bot.memory_mb", memory_mb)
+        report = {"shards": shards, "guilds": guilds, "memory_mb": memory_mb}
+        if guilds:
+            per_1000 = memory_mb / guilds * 1000
+            metrics.set_gauge("bot.memory_mb_per_1000_guilds", per_1000)
+            report["memory_mb_per_1000_guilds"] = per_1000
+        return report
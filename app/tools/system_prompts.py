@@ -61,6 +61,7 @@ def get_final_answer_prompt(
     user_context: str | None,
     target_user_profile: str | None,
     target_user_name: str | None,
+    recent_conversation: str | None = None,
 ) -> str:
     """
     Creates the final prompt for Oswald to synthesize an answer.
@@ -105,9 +106,19 @@ def get_final_answer_prompt(
             "</target_user_profile>"
         )
 
+    conversation_section = ""
+    if recent_conversation and recent_conversation.strip():
+        conversation_section = (
+            "<recent_conversation>\n"
+            "  <instructions>The last few exchanges in this channel, oldest first. Use them to understand follow-up questions; do not answer them again.</instructions>\n"
+            f"  <turns>\n{recent_conversation}\n</turns>\n"
+            "</recent_conversation>\n"
+        )
+
     final_prompt = (
         f"{OSWALD_SYSTEM_PROMPT}\n\n"
         "<task_briefing>\n"
+        f"{conversation_section}"
         f"  <user_question>{user_prompt}</user_question>\n"
         f"{intel_section}\n"
         f"{user_context_section}\n"
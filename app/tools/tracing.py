@@ -0,0 +1,368 @@
+"""
+Per-request tracing across the bot, the API and its background task.
+
+The bot starts a trace for every mention it answers and sends the trace ID
+and its span ID to the API in the X-Trace-Id and X-Parent-Span-Id headers.
+The API continues that trace for the request and for its background task,
+so one ID ties together everything a single reply cost. Each stage is
+timed as a span:
+
+    with tracing.span("intent", model=model):
+        ...
+
+Spans nest through a context variable, so calls made inside a span (Ollama,
+SearXNG) become its children without passing anything around. Outside of
+a trace, such as in the jobs or during startup, spans are not recorded.
+Threads do not inherit the context; run functions with `bind()` to carry it
+over. Log lines written during a trace start with its ID.
+
+Finished spans are exported in batches by a background thread:
+
+    TRACE_EXPORTER=file   one JSON object per line in TRACE_FILE
+    TRACE_EXPORTER=otlp   OTLP/HTTP JSON posted to TRACE_OTLP_ENDPOINT
+    TRACE_EXPORTER=none   nothing is exported, IDs still reach the logs
+
+When the buffer is full, spans are dropped and counted under
+`tracing.dropped` rather than slowing requests down.
+"""
+
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from tools import metrics
+
+# --- Logging Setup ---
+log = logging.getLogger(__name__)
+
+# --- Configuration ---
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.getenv(
+    "TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"
+)
+TRACE_BATCH_SIZE = int(os.getenv("TRACE_BATCH_SIZE", 256))
+TRACE_FLUSH_INTERVAL = float(os.getenv("TRACE_FLUSH_INTERVAL", 2.0))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", 10000))
+
+TRACE_HEADER = "X-Trace-Id"
+PARENT_HEADER = "X-Parent-Span-Id"
+SCOPE_NAME = "joney-bot"
+
+
+def new_trace_id() -> str:
+    """A random 128-bit trace ID as 32 hex characters, as in OTLP."""
+    return secrets.token_hex(16)
+
+
+def _valid_id(value: str | None, length: int) -> bool:
+    """Whether a trace (32) or span (16) ID from a header is usable."""
+    if not value or len(value) != length:
+        return False
+    try:
+        int(value, 16)
+    except ValueError:
+        return False
+    return True
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str | None
+    parent_id: str | None
+    attributes: dict = field(default_factory=dict)
+    span_id: str = field(default_factory=lambda: secrets.token_hex(8))
+    start: float = field(default_factory=time.time)
+    duration: float | None = None
+    error: str | None = None
+
+    def set(self, key: str, value):
+        """Adds an attribute, e.g. a result only known once the stage ran."""
+        self.attributes[key] = value
+
+    def elapsed(self) -> float:
+        return time.time() - self.start
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "service": _service,
+            "start": self.start,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+_current: contextvars.ContextVar[Span | None] = contextvars.ContextVar(
+    "current_span", default=None
+)
+_service = "joney-bot"
+
+
+def set_service(name: str):
+    """Names the process in exported spans, e.g. "bot" or "api"."""
+    global _service
+    _service = name
+
+
+def current_trace_id() -> str | None:
+    span = _current.get()
+    return span.trace_id if span else None
+
+
+def headers() -> dict:
+    """Headers that continue the current trace in another process."""
+    span = _current.get()
+    if span is None or span.trace_id is None:
+        return {}
+    return {TRACE_HEADER: span.trace_id, PARENT_HEADER: span.span_id}
+
+
+@contextmanager
+def span(
+    name: str, trace_id: str | None = None, parent_id: str | None = None, **attributes
+):
+    """
+    Times the wrapped block as a span of the current trace. Pass `trace_id`
+    to start a trace or, with the IDs from another process's headers, to
+    continue one; an invalid trace ID starts a new trace instead.
+    """
+    parent = _current.get()
+    if trace_id is not None:
+        if not _valid_id(trace_id, 32):
+            log.debug(f"Ignoring invalid {TRACE_HEADER}: {trace_id!r}")
+            trace_id, parent_id = new_trace_id(), None
+        elif parent_id is not None and not _valid_id(parent_id, 16):
+            parent_id = None
+    else:
+        trace_id = parent.trace_id if parent else None
+        parent_id = parent.span_id if parent else None
+
+    current = Span(name, trace_id, parent_id, attributes)
+    token = _current.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current.duration = time.perf_counter() - started
+        _current.reset(token)
+        if current.trace_id is not None:
+            _export(current)
+
+
+def bind(fn):
+    """Wraps `fn` to run in a copy of the current context, e.g. in a thread."""
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.run(fn, *args, **kwargs)
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds the current trace ID to log records as `trace` (empty outside one)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace_id = current_trace_id()
+        record.trace = f"trace={trace_id[:8]} " if trace_id else ""
+        return True
+
+
+# --- OTLP ---
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _from_otlp_value(value: dict):
+    if "intValue" in value:
+        return int(value["intValue"])
+    return next(iter(value.values()), None)
+
+
+def to_otlp(spans: list[dict]) -> dict:
+    """Encodes exported spans as an OTLP/HTTP JSON request body."""
+    by_service: dict[str, list[dict]] = {}
+    for s in spans:
+        start_ns = int(s["start"] * 1e9)
+        otlp_span = {
+            "traceId": s["trace_id"],
+            "spanId": s["span_id"],
+            "name": s["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int(s["duration"] * 1e9)),
+            "attributes": [
+                {"key": key, "value": _otlp_value(value)}
+                for key, value in s["attributes"].items()
+            ],
+            "status": (
+                {"code": 2, "message": s["error"]} if s["error"] else {"code": 0}
+            ),
+        }
+        if s["parent_id"]:
+            otlp_span["parentSpanId"] = s["parent_id"]
+        by_service.setdefault(s["service"], []).append(otlp_span)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": service}}
+                    ]
+                },
+                "scopeSpans": [{"scope": {"name": SCOPE_NAME}, "spans": otlp_spans}],
+            }
+            for service, otlp_spans in by_service.items()
+        ]
+    }
+
+
+def from_otlp(body: dict) -> list[dict]:
+    """Decodes an OTLP/HTTP JSON request body into the exported span format."""
+    spans = []
+    for resource_spans in body.get("resourceSpans", []):
+        resource = resource_spans.get("resource", {}).get("attributes", [])
+        service = next(
+            (
+                a["value"].get("stringValue")
+                for a in resource
+                if a.get("key") == "service.name"
+            ),
+            None,
+        )
+        for scope_spans in resource_spans.get("scopeSpans", []):
+            for s in scope_spans.get("spans", []):
+                start_ns = int(s["startTimeUnixNano"])
+                status = s.get("status", {})
+                spans.append(
+                    {
+                        "trace_id": s["traceId"],
+                        "span_id": s["spanId"],
+                        "parent_id": s.get("parentSpanId") or None,
+                        "name": s["name"],
+                        "service": service,
+                        "start": start_ns / 1e9,
+                        "duration": (int(s["endTimeUnixNano"]) - start_ns) / 1e9,
+                        "attributes": {
+                            a["key"]: _from_otlp_value(a["value"])
+                            for a in s.get("attributes", [])
+                        },
+                        "error": (
+                            status.get("message", "error")
+                            if status.get("code") == 2
+                            else None
+                        ),
+                    }
+                )
+    return spans
+
+
+# --- Exporter ---
+class SpanExporter:
+    """A bounded queue of finished spans, written out in batches by one thread."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._queue: queue.Queue = queue.Queue(maxsize=TRACE_BUFFER_SIZE)
+        self._stopping = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="span-exporter", daemon=True
+        )
+        self._thread.start()
+
+    def submit(self, span_dict: dict):
+        try:
+            self._queue.put_nowait(span_dict)
+        except queue.Full:
+            metrics.increment("tracing.dropped")
+
+    def close(self, timeout: float = 5.0):
+        """Stops the exporter after writing whatever is still queued."""
+        self._stopping.set()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            batch = []
+            deadline = time.monotonic() + TRACE_FLUSH_INTERVAL
+            while len(batch) < TRACE_BATCH_SIZE:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or (self._stopping.is_set() and self._queue.empty()):
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=min(remaining, 0.5)))
+                except queue.Empty:
+                    continue
+            if batch:
+                try:
+                    self._write(batch)
+                    metrics.increment("tracing.exported", len(batch))
+                except Exception as e:
+                    metrics.increment("tracing.dropped", len(batch))
+                    log.warning(f"Could not export {len(batch)} spans: {e}")
+            if self._stopping.is_set() and self._queue.empty():
+                return
+
+    def _write(self, batch: list[dict]):
+        if self.kind == "file":
+            # One write per batch, so the bot and API can share the file.
+            lines = "".join(json.dumps(s) + "\n" for s in batch)
+            with open(TRACE_FILE, "a") as f:
+                f.write(lines)
+            return
+
+        # Only the otlp exporter needs it, so imported here.
+        from urllib.request import Request, urlopen
+
+        request = Request(
+            TRACE_OTLP_ENDPOINT,
+            data=json.dumps(to_otlp(batch)).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        with urlopen(request, timeout=5):
+            pass
+
+
+_exporter: SpanExporter | None = None
+_exporter_lock = threading.Lock()
+
+
+def _export(finished: Span):
+    global _exporter
+    if TRACE_EXPORTER not in ("file", "otlp"):
+        return
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                _exporter = SpanExporter(TRACE_EXPORTER)
+                atexit.register(shutdown)
+    _exporter.submit(finished.to_dict())
+
+
+def shutdown():
+    """Writes out the spans still queued. Called on shutdown and at exit."""
+    global _exporter
+    with _exporter_lock:
+        exporter, _exporter = _exporter, None
+    if exporter is not None:
+        exporter.close()
@@ -1,21 +1,86 @@
+import gzip
 import logging
 import os
+import re
+from datetime import datetime, timezone
 
+import numpy as np
 import psycopg2
 from pgvector.psycopg2 import register_vector
+from psycopg2.errors import UndefinedTable
+from psycopg2.extras import execute_values
+from tools.embeddings import dequantize_int8, embedding_key, quantize_int8
+from tools.settings import get_settings
 
 log = logging.getLogger(__name__)
 
+# --- Configuration ---
+# Read once; every query names its tables with this schema.
+DB_SCHEMA = get_settings().db_schema
+# Partition chat_logs by month on created_at. Existing unpartitioned tables
+# must be converted once with `python -m jobs.chat_log_retention --migrate`.
+CHAT_LOGS_PARTITIONED = os.getenv("CHAT_LOGS_PARTITIONED", "false").lower() == "true"
+CHAT_LOGS_PREMAKE_MONTHS = int(os.getenv("CHAT_LOGS_PREMAKE_MONTHS", 2))
+CHAT_LOGS_RETENTION_MONTHS = int(os.getenv("CHAT_LOGS_RETENTION_MONTHS") or 12)
+CHAT_LOGS_ARCHIVE_DIR = os.getenv("CHAT_LOGS_ARCHIVE_DIR") or "archive"
+# Recent-chat reads look this far back first, so they only touch hot partitions.
+RECENT_CHATS_LOOKBACK_DAYS = int(os.getenv("RECENT_CHATS_LOOKBACK_DAYS", 90))
+
+# Shared by the plain and partitioned layouts so both stay in sync.
+CHAT_LOGS_COLUMNS = """
+    username TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    response TEXT NOT NULL,
+    prompt_embedding VECTOR(768),
+    response_embedding VECTOR(768),
+    search_queries TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+"""
+# Added after the table was first released; applied with ADD COLUMN IF NOT EXISTS.
+CHAT_LOGS_ADDED_COLUMNS = [
+    ("prompt_embedding_hash", "TEXT"),
+    ("response_embedding_hash", "TEXT"),
+    # Model that produced the row's vectors; NULL for rows written before it.
+    ("embedding_model", "TEXT"),
+    # Discord channel the chat happened in, for conversation context.
+    ("channel_id", "TEXT"),
+]
+PARTITION_NAME_RE = re.compile(r"^chat_logs_p(\d{4})(\d{2})$")
+
+# How embeddings are stored:
+#   vector   full precision, inline in chat_logs (original behaviour)
+#   halfvec  16-bit floats in the shared embeddings table, ~half the size
+#   int8     8-bit quantized bytes in the shared embeddings table, ~quarter size
+# The compact modes store each distinct (model, text) once and chat_logs
+# references it by hash, so repeated prompts and responses share a vector.
+EMBEDDING_STORAGE = (os.getenv("EMBEDDING_STORAGE") or "vector").lower()
+EMBEDDING_COLUMN_TYPES = {
+    "vector": "VECTOR(768)",
+    "halfvec": "HALFVEC(768)",
+    "int8": "BYTEA",
+}
+EMBEDDING_VALUE_TEMPLATES = {
+    "vector": "%s::vector",
+    "halfvec": "%s::halfvec",
+    "int8": "%s",
+}
+OLLAMA_EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL") or "nomic-embed-text:v1.5"
+
+# Bump whenever the DDL in setup_database changes, so existing databases
+# run it again on their next start.
+SCHEMA_VERSION = 1
+
 
 def get_db_connection():
     """Establishes a connection to the PostgreSQL database."""
+    settings = get_settings()
     try:
         conn = psycopg2.connect(
-            dbname=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASSWORD"),
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT"),
+            dbname=settings.db_name,
+            user=settings.db_user,
+            password=settings.db_password,
+            host=settings.db_host,
+            port=settings.db_port,
         )
         register_vector(conn)
         log.debug("Database connection successful.")
@@ -25,31 +90,93 @@ def get_db_connection():
         return None
 
 
+def _schema_fingerprint() -> str:
+    """
+    The settings the DDL depends on. With partitioning it includes the
+    month, so the first start of each month creates the new partitions.
+    """
+    layout = "plain"
+    if CHAT_LOGS_PARTITIONED:
+        layout = f"partitioned-{datetime.now(timezone.utc):%Y%m}"
+    return f"{layout}/{EMBEDDING_STORAGE}"
+
+
+def _schema_is_current(conn, schema_name: str) -> bool:
+    """One query: has this schema version and layout already been set up?"""
+    try:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT version, fingerprint FROM {schema_name}.schema_version;"
+            )
+            row = cur.fetchone()
+    except UndefinedTable:
+        conn.rollback()
+        return False
+    return row == (SCHEMA_VERSION, _schema_fingerprint())
+
+
 def setup_database():
-    """Sets up the database tables if they don't exist."""
+    """
+    Sets up the database tables if they don't exist. When the recorded schema
+    version and layout already match, this is a single query.
+    """
     conn = get_db_connection()
     if conn is None:
         return
 
     try:
+        schema_name = DB_SCHEMA
+        if _schema_is_current(conn, schema_name):
+            log.info(f"Database is ready (schema version {SCHEMA_VERSION})")
+            return
+
+        complete = True
         with conn.cursor() as cur:
-            schema_name = os.getenv("DB_SCHEMA")
             cur.execute(f"CREATE SCHEMA IF NOT EXISTS {schema_name};")
 
             # Create chat_logs table
+            layout = _get_chat_logs_layout(cur, schema_name)
+            if CHAT_LOGS_PARTITIONED and layout == "plain":
+                complete = False
+                log.warning(
+                    "CHAT_LOGS_PARTITIONED is set but chat_logs is not partitioned. "
+                    "Run 'python -m jobs.chat_log_retention --migrate' to convert it."
+                )
+            elif CHAT_LOGS_PARTITIONED:
+                _create_partitioned_chat_logs(cur, schema_name)
+            else:
+                cur.execute(
+                    f"""
+                    CREATE TABLE IF NOT EXISTS {schema_name}.chat_logs (
+                        id SERIAL PRIMARY KEY,
+                        {CHAT_LOGS_COLUMNS}
+                    );
+                """
+                )
             cur.execute(
                 f"""
-                CREATE TABLE IF NOT EXISTS {schema_name}.chat_logs (
-                    id SERIAL PRIMARY KEY,
-                    username TEXT NOT NULL,
-                    prompt TEXT NOT NULL,
-                    response TEXT NOT NULL,
-                    prompt_embedding VECTOR(768),
-                    response_embedding VECTOR(768),
-                    search_queries TEXT,
-                    created_at TIMESTAMPTZ DEFAULT NOW()
+                CREATE INDEX IF NOT EXISTS chat_logs_username_created_at_idx
+                ON {schema_name}.chat_logs (username, created_at DESC);
+                """
+            )
+            for column, definition in CHAT_LOGS_ADDED_COLUMNS:
+                cur.execute(
+                    f"ALTER TABLE {schema_name}.chat_logs "
+                    f"ADD COLUMN IF NOT EXISTS {column} {definition};"
+                )
+
+            # Create the content-addressed embeddings table
+            complete &= _create_embeddings_table(cur, schema_name)
+
+            # Create the shared rate limit buckets
+            cur.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {schema_name}.rate_limit_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens DOUBLE PRECISION NOT NULL,
+                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
                 );
-            """
+                """
             )
 
             # Create users table for context
@@ -87,7 +214,28 @@ def setup_database():
                 """
             )
 
-            log.info(f"Database is ready")
+            # Record what was set up so the next start can skip all of this.
+            # A layout that still needs a migration is checked again.
+            cur.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {schema_name}.schema_version (
+                    version INTEGER NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                );
+                DELETE FROM {schema_name}.schema_version;
+                """
+            )
+            if complete:
+                cur.execute(
+                    f"""
+                    INSERT INTO {schema_name}.schema_version (version, fingerprint)
+                    VALUES (%s, %s);
+                    """,
+                    (SCHEMA_VERSION, _schema_fingerprint()),
+                )
+
+            log.info(f"Database is ready (schema version {SCHEMA_VERSION} applied)")
         conn.commit()
     except Exception as e:
         log.error(f"An error occurred during database setup: {e}")
@@ -96,6 +244,579 @@ def setup_database():
             conn.close()
 
 
+# --- Partitioning ---
+def _get_chat_logs_layout(cur, schema_name: str) -> str | None:
+    """Returns 'plain', 'partitioned' or None when chat_logs does not exist."""
+    cur.execute(
+        """
+        SELECT c.relkind FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = 'chat_logs';
+        """,
+        (schema_name,),
+    )
+    result = cur.fetchone()
+    if not result:
+        return None
+    return "partitioned" if result[0] == "p" else "plain"
+
+
+def _month_start(moment: datetime) -> datetime:
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _add_months(month: datetime, months: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + months
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def _create_partitioned_chat_logs(cur, schema_name: str):
+    """Creates the range-partitioned chat_logs table with its default partition."""
+    # The partition key must be part of the primary key.
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema_name}.chat_logs (
+            id SERIAL,
+            {CHAT_LOGS_COLUMNS},
+            PRIMARY KEY (id, created_at)
+        ) PARTITION BY RANGE (created_at);
+        """
+    )
+    # Catches rows outside every monthly partition so inserts never fail.
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema_name}.chat_logs_default
+        PARTITION OF {schema_name}.chat_logs DEFAULT;
+        """
+    )
+    now = _month_start(datetime.now(timezone.utc))
+    _create_month_partitions(
+        cur, schema_name, now, _add_months(now, CHAT_LOGS_PREMAKE_MONTHS)
+    )
+
+
+def _create_month_partitions(cur, schema_name: str, first: datetime, last: datetime):
+    """Creates one partition per month from `first` through `last` (inclusive)."""
+    month = _month_start(first)
+    while month <= last:
+        next_month = _add_months(month, 1)
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {schema_name}.chat_logs_p{month:%Y%m}
+            PARTITION OF {schema_name}.chat_logs
+            FOR VALUES FROM (%s) TO (%s);
+            """,
+            (month, next_month),
+        )
+        month = next_month
+
+
+def ensure_chat_log_partitions(months_ahead: int = CHAT_LOGS_PREMAKE_MONTHS):
+    """Makes sure partitions exist for the current month and the next few."""
+    conn = get_db_connection()
+    if conn is None:
+        return
+
+    try:
+        with conn.cursor() as cur:
+            schema_name = DB_SCHEMA
+            if _get_chat_logs_layout(cur, schema_name) != "partitioned":
+                log.warning("chat_logs is not partitioned, nothing to do.")
+                return
+            now = _month_start(datetime.now(timezone.utc))
+            _create_month_partitions(
+                cur, schema_name, now, _add_months(now, months_ahead)
+            )
+        conn.commit()
+        log.info(f"chat_logs partitions ensured {months_ahead} months ahead.")
+    except Exception as e:
+        log.error(f"Error creating chat_logs partitions: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
+def archive_old_chat_log_partitions(
+    retention_months: int = CHAT_LOGS_RETENTION_MONTHS,
+    archive_dir: str = CHAT_LOGS_ARCHIVE_DIR,
+) -> list[str]:
+    """
+    Detaches monthly partitions older than the retention window, writes each
+    one to a gzipped CSV in `archive_dir` and then drops it.
+
+    Each partition is detached and committed before it is archived, and only
+    dropped once the archive file is fully written, so an interrupted run can
+    simply be repeated. Old rows in the default partition are archived too.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        return []
+
+    archived = []
+    try:
+        os.makedirs(archive_dir, exist_ok=True)
+        schema_name = DB_SCHEMA
+        cutoff = _add_months(
+            _month_start(datetime.now(timezone.utc)), -retention_months
+        )
+        with conn.cursor() as cur:
+            # Detached leftovers from an interrupted run are picked up too.
+            cur.execute(
+                """
+                SELECT c.relname, c.relispartition FROM pg_class c
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relkind = 'r'
+                AND c.relname LIKE 'chat_logs\\_p%%'
+                ORDER BY c.relname;
+                """,
+                (schema_name,),
+            )
+            partitions = cur.fetchall()
+
+        for name, is_attached in partitions:
+            match = PARTITION_NAME_RE.match(name)
+            if not match:
+                continue
+            month = datetime(int(match[1]), int(match[2]), 1, tzinfo=timezone.utc)
+            if month >= cutoff:
+                continue
+
+            with conn.cursor() as cur:
+                if is_attached:
+                    log.info(f"Detaching partition '{name}'.")
+                    cur.execute(
+                        f"ALTER TABLE {schema_name}.chat_logs "
+                        f"DETACH PARTITION {schema_name}.{name};"
+                    )
+                    conn.commit()
+
+                path = os.path.join(archive_dir, f"{schema_name}.{name}.csv.gz")
+                partial_path = f"{path}.partial"
+                with gzip.open(partial_path, "wt", encoding="utf-8") as f:
+                    cur.copy_expert(
+                        f"COPY {schema_name}.{name} TO STDOUT "
+                        "WITH (FORMAT csv, HEADER)",
+                        f,
+                    )
+                os.replace(partial_path, path)
+
+                cur.execute(f"DROP TABLE {schema_name}.{name};")
+                conn.commit()
+                log.info(f"Archived partition '{name}' to '{path}'.")
+                archived.append(path)
+
+        path = _archive_default_partition_rows(conn, schema_name, cutoff, archive_dir)
+        if path:
+            archived.append(path)
+    except Exception as e:
+        log.error(f"Error archiving chat_logs partitions: {e}")
+    finally:
+        if conn:
+            conn.close()
+    return archived
+
+
+def _archive_default_partition_rows(
+    conn, schema_name: str, cutoff: datetime, archive_dir: str
+) -> str | None:
+    """
+    Archives and deletes the rows of chat_logs_default older than `cutoff`.
+    Rows only land there when their month had no partition yet, for example
+    when this job has not run for a while, so no monthly partition covers them.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT to_regclass(%s) IS NOT NULL;",
+            (f"{schema_name}.chat_logs_default",),
+        )
+        if not cur.fetchone()[0]:
+            return None
+        cur.execute(
+            f"SELECT COUNT(*) FROM {schema_name}.chat_logs_default "
+            "WHERE created_at < %s;",
+            (cutoff,),
+        )
+        count = cur.fetchone()[0]
+        if not count:
+            return None
+
+        stamp = datetime.now(timezone.utc)
+        path = os.path.join(
+            archive_dir, f"{schema_name}.chat_logs_default.{stamp:%Y%m%d%H%M%S}.csv.gz"
+        )
+        partial_path = f"{path}.partial"
+        # The rows written out are exactly the rows deleted, and the delete
+        # is only committed once the file is complete.
+        delete = cur.mogrify(
+            f"DELETE FROM {schema_name}.chat_logs_default "
+            "WHERE created_at < %s RETURNING *",
+            (cutoff,),
+        ).decode()
+        with gzip.open(partial_path, "wt", encoding="utf-8") as f:
+            cur.copy_expert(f"COPY ({delete}) TO STDOUT WITH (FORMAT csv, HEADER)", f)
+        os.replace(partial_path, path)
+    conn.commit()
+    log.info(f"Archived {count} old rows of 'chat_logs_default' to '{path}'.")
+    return path
+
+
+def migrate_chat_logs_to_partitioned():
+    """
+    Converts an existing unpartitioned chat_logs table into the partitioned
+    layout in a single transaction, keeping ids and timestamps.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        return
+
+    try:
+        with conn.cursor() as cur:
+            schema_name = DB_SCHEMA
+            layout = _get_chat_logs_layout(cur, schema_name)
+            if layout == "partitioned":
+                log.info("chat_logs is already partitioned.")
+                return
+            if layout is None:
+                _create_partitioned_chat_logs(cur, schema_name)
+                conn.commit()
+                log.info("Created partitioned chat_logs table.")
+                return
+
+            log.info("Migrating chat_logs to the partitioned layout.")
+            cur.execute(f"LOCK TABLE {schema_name}.chat_logs IN ACCESS EXCLUSIVE MODE;")
+            cur.execute(
+                "SELECT pg_get_serial_sequence(%s, 'id');",
+                (f"{schema_name}.chat_logs",),
+            )
+            old_sequence = cur.fetchone()[0]
+            cur.execute(
+                f"ALTER TABLE {schema_name}.chat_logs RENAME TO chat_logs_unpartitioned;"
+            )
+            if old_sequence:
+                cur.execute(
+                    f"ALTER SEQUENCE {old_sequence} "
+                    "RENAME TO chat_logs_unpartitioned_id_seq;"
+                )
+            # Index names are unique per schema, so move the old ones aside.
+            for index in ("chat_logs_pkey", "chat_logs_username_created_at_idx"):
+                cur.execute(
+                    f"ALTER INDEX IF EXISTS {schema_name}.{index} "
+                    f"RENAME TO {index.replace('chat_logs', 'chat_logs_old', 1)};"
+                )
+            _create_partitioned_chat_logs(cur, schema_name)
+
+            # created_at is the partition key, so it can no longer be NULL.
+            cur.execute(
+                f"UPDATE {schema_name}.chat_logs_unpartitioned "
+                "SET created_at = NOW() WHERE created_at IS NULL;"
+            )
+            cur.execute(
+                f"SELECT MIN(created_at) FROM {schema_name}.chat_logs_unpartitioned;"
+            )
+            oldest = cur.fetchone()[0]
+            if oldest:
+                # MIN() comes back in the session time zone; the monthly
+                # bounds are UTC everywhere else.
+                _create_month_partitions(
+                    cur,
+                    schema_name,
+                    oldest.astimezone(timezone.utc),
+                    datetime.now(timezone.utc),
+                )
+
+            # Copy every column both tables share, whatever has been added since.
+            cur.execute(
+                """
+                SELECT column_name FROM information_schema.columns
+                WHERE table_schema = %s AND table_name = 'chat_logs_unpartitioned'
+                ORDER BY ordinal_position;
+                """,
+                (schema_name,),
+            )
+            columns = ", ".join(row[0] for row in cur.fetchall())
+            cur.execute(
+                f"""
+                INSERT INTO {schema_name}.chat_logs ({columns})
+                SELECT {columns} FROM {schema_name}.chat_logs_unpartitioned;
+                """
+            )
+            log.info(f"Copied {cur.rowcount} rows into the partitioned table.")
+            cur.execute(
+                f"""
+                SELECT setval(
+                    pg_get_serial_sequence(%s, 'id'),
+                    COALESCE((SELECT MAX(id) FROM {schema_name}.chat_logs), 0) + 1,
+                    false
+                );
+                """,
+                (f"{schema_name}.chat_logs",),
+            )
+            cur.execute(f"DROP TABLE {schema_name}.chat_logs_unpartitioned;")
+            cur.execute(
+                f"""
+                CREATE INDEX IF NOT EXISTS chat_logs_username_created_at_idx
+                ON {schema_name}.chat_logs (username, created_at DESC);
+                """
+            )
+        conn.commit()
+        log.info("chat_logs migration to the partitioned layout is complete.")
+    except Exception as e:
+        conn.rollback()
+        log.error(f"Error migrating chat_logs to the partitioned layout: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
+# --- Embedding Storage ---
+def _create_embeddings_table(cur, schema_name: str) -> bool:
+    """
+    Creates the shared embeddings table in the configured storage format.
+    Returns False if an existing table is in another format.
+    """
+    if EMBEDDING_STORAGE not in EMBEDDING_COLUMN_TYPES:
+        raise ValueError(f"Unknown EMBEDDING_STORAGE '{EMBEDDING_STORAGE}'.")
+
+    cur.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {schema_name}.embeddings (
+            content_hash TEXT PRIMARY KEY,
+            model TEXT NOT NULL,
+            embedding {EMBEDDING_COLUMN_TYPES[EMBEDDING_STORAGE]} NOT NULL,
+            embedding_scale REAL,
+            created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        """
+    )
+    cur.execute(
+        """
+        SELECT format_type(a.atttypid, a.atttypmod) FROM pg_attribute a
+        JOIN pg_class c ON c.oid = a.attrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE n.nspname = %s AND c.relname = 'embeddings'
+        AND a.attname = 'embedding';
+        """,
+        (schema_name,),
+    )
+    existing_type = cur.fetchone()[0]
+    if existing_type.lower() != EMBEDDING_COLUMN_TYPES[EMBEDDING_STORAGE].lower():
+        log.error(
+            f"embeddings.embedding is '{existing_type}' but EMBEDDING_STORAGE is "
+            f"'{EMBEDDING_STORAGE}'. Recreate the table or change the setting."
+        )
+        return False
+    return True
+
+
+def _embedding_row(content_hash: str, model: str, embedding) -> tuple:
+    """Converts an embedding into an embeddings table row for the storage mode."""
+    if EMBEDDING_STORAGE == "int8":
+        data, scale = quantize_int8(embedding)
+        return (content_hash, model, data, scale)
+    return (content_hash, model, np.asarray(embedding, dtype=np.float32), None)
+
+
+def _decode_embedding(value, scale) -> np.ndarray:
+    """Turns a stored embedding of any storage mode back into float32."""
+    if isinstance(value, (bytes, memoryview)):
+        return dequantize_int8(bytes(value), scale)
+    if hasattr(value, "to_numpy"):
+        value = value.to_numpy()
+    return np.asarray(value, dtype=np.float32)
+
+
+def _upsert_embeddings(cur, schema_name: str, rows: list[tuple]):
+    """Inserts embeddings rows, keeping the existing row when the hash is known."""
+    if not rows:
+        return
+    value_template = EMBEDDING_VALUE_TEMPLATES[EMBEDDING_STORAGE]
+    execute_values(
+        cur,
+        f"""
+        INSERT INTO {schema_name}.embeddings
+        (content_hash, model, embedding, embedding_scale)
+        VALUES %s
+        ON CONFLICT (content_hash) DO NOTHING
+        """,
+        rows,
+        template=f"(%s, %s, {value_template}, %s)",
+    )
+
+
+def get_embeddings_by_hash(content_hashes: list[str]) -> dict[str, np.ndarray]:
+    """Looks up stored embeddings by content hash in a single query."""
+    if not content_hashes:
+        return {}
+    conn = get_db_connection()
+    if conn is None:
+        return {}
+
+    found = {}
+    try:
+        with conn.cursor() as cur:
+            schema_name = DB_SCHEMA
+            cur.execute(
+                f"""
+                SELECT content_hash, embedding, embedding_scale
+                FROM {schema_name}.embeddings
+                WHERE content_hash = ANY(%s);
+                """,
+                (list(content_hashes),),
+            )
+            for content_hash, value, scale in cur.fetchall():
+                found[content_hash] = _decode_embedding(value, scale)
+    except Exception as e:
+        log.error(f"Error looking up stored embeddings: {e}")
+    finally:
+        if conn:
+            conn.close()
+    return found
+
+
+def save_embeddings(rows: list[tuple[str, str, object]]):
+    """Stores (content_hash, model, embedding) rows, ignoring known hashes."""
+    if not rows:
+        return
+    conn = get_db_connection()
+    if conn is None:
+        return
+
+    try:
+        with conn.cursor() as cur:
+            schema_name = DB_SCHEMA
+            _upsert_embeddings(
+                cur,
+                schema_name,
+                [_embedding_row(key, model, vector) for key, model, vector in rows],
+            )
+        conn.commit()
+    except Exception as e:
+        log.error(f"Error storing embeddings: {e}")
+    finally:
+        if conn:
+            conn.close()
+
+
+def migrate_embeddings_to_compact(
+    model: str = OLLAMA_EMBEDDING_MODEL, batch_size: int = 500
+) -> int:
+    """
+    Moves inline chat_logs vectors into the shared embeddings table.
+
+    Rows are processed in id order and committed per batch, so the migration
+    can be interrupted and rerun. Existing vectors are assumed to come from
+    `model`. Returns the number of chat rows migrated.
+    """
+    if EMBEDDING_STORAGE == "vector":
+        log.error("EMBEDDING_STORAGE is 'vector'; set halfvec or int8 to migrate.")
+        return 0
+
+    conn = get_db_connection()
+    if conn is None:
+        return 0
+
+    migrated, last_id = 0, 0
+    try:
+        schema_name = DB_SCHEMA
+        while True:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    SELECT id, prompt, response, prompt_embedding, response_embedding
+                    FROM {schema_name}.chat_logs
+                    WHERE id > %s
+                    AND (prompt_embedding IS NOT NULL
+                         OR response_embedding IS NOT NULL)
+                    ORDER BY id
+                    LIMIT %s;
+                    """,
+                    (last_id, batch_size),
+                )
+                batch = cur.fetchall()
+                if not batch:
+                    break
+
+                embedding_rows, updates = {}, []
+                for chat_id, prompt, response, prompt_vec, response_vec in batch:
+                    hashes = []
+                    pairs = ((prompt, prompt_vec), (response, response_vec))
+                    for text, vector in pairs:
+                        if vector is None:
+                            hashes.append(None)
+                            continue
+                        key = embedding_key(model, text)
+                        embedding_rows[key] = _embedding_row(key, model, vector)
+                        hashes.append(key)
+                    updates.append((chat_id, *hashes))
+
+                _upsert_embeddings(cur, schema_name, list(embedding_rows.values()))
+                execute_values(
+                    cur,
+                    f"""
+                    UPDATE {schema_name}.chat_logs AS c
+                    SET prompt_embedding_hash = v.prompt_hash,
+                        response_embedding_hash = v.response_hash,
+                        prompt_embedding = NULL,
+                        response_embedding = NULL,
+                        embedding_model = COALESCE(c.embedding_model, v.model)
+                    FROM (VALUES %s) AS v(id, prompt_hash, response_hash, model)
+                    WHERE c.id = v.id
+                    """,
+                    [(*update, model) for update in updates],
+                    template="(%s, %s::text, %s::text, %s::text)",
+                )
+            conn.commit()
+            migrated += len(batch)
+            last_id = batch[-1][0]
+            log.info(f"Migrated embeddings for {migrated} chat rows.")
+
+        log.info(
+            "Embedding migration complete. Run VACUUM FULL on chat_logs to "
+            "return the freed space to the operating system."
+        )
+    except Exception as e:
+        conn.rollback()
+        log.error(f"Error migrating embeddings after chat id {last_id}: {e}")
+    finally:
+        if conn:
+            conn.close()
+    return migrated
+
+
+def _fetch_recent_prompts(cur, schema_name: str, username: str, limit: int):
+    """
+    Returns the newest prompts for a user, newest first.
+
+    The first query is bounded by the lookback window so partition pruning
+    keeps it on recent partitions; only users with fewer recent chats than
+    `limit` fall back to scanning the full history.
+    """
+    cur.execute(
+        f"""
+        SELECT prompt FROM {schema_name}.chat_logs
+        WHERE username = %s
+        AND created_at >= NOW() - %s * INTERVAL '1 day'
+        ORDER BY created_at DESC
+        LIMIT %s;
+        """,
+        (username, RECENT_CHATS_LOOKBACK_DAYS, limit),
+    )
+    rows = cur.fetchall()
+    if len(rows) >= limit:
+        return rows
+
+    cur.execute(
+        f"""
+        SELECT prompt FROM {schema_name}.chat_logs
+        WHERE username = %s
+        ORDER BY created_at DESC
+        LIMIT %s;
+        """,
+        (username, limit),
+    )
+    return cur.fetchall()
+
+
 def get_user_context(username: str) -> str | None:
     """Retrieves the context for a given user."""
     conn = get_db_connection()
@@ -105,7 +826,7 @@ def get_user_context(username: str) -> str | None:
     context = None
     try:
         with conn.cursor() as cur:
-            schema_name = os.getenv("DB_SCHEMA")
+            schema_name = DB_SCHEMA
             cur.execute(
                 f"SELECT context FROM {schema_name}.users WHERE username = %s",
                 (username,),
@@ -124,27 +845,50 @@ def get_user_context(username: str) -> str | None:
     return context
 
 
-def get_recent_chats(username: str, limit: int) -> str:
-    """Retrieves only the user's most recent prompts for analysis."""
+def get_user_contexts(usernames: list[str]) -> dict[str, tuple[str, datetime]]:
+    """
+    Retrieves several users' contexts in one query, keyed by username, as
+    (context, updated_at). Users without a context are left out.
+    """
+    usernames = [name for name in dict.fromkeys(usernames) if name]
+    if not usernames:
+        return {}
     conn = get_db_connection()
     if conn is None:
-        return ""
+        return {}
 
-    user_prompts = []
+    contexts = {}
     try:
         with conn.cursor() as cur:
-            schema_name = os.getenv("DB_SCHEMA")
+            schema_name = DB_SCHEMA
             cur.execute(
                 f"""
-                SELECT prompt FROM {schema_name}.chat_logs
-                WHERE username = %s
-                ORDER BY created_at DESC
-                LIMIT %s;
+                SELECT username, context, updated_at FROM {schema_name}.users
+                WHERE username = ANY(%s) AND context IS NOT NULL;
                 """,
-                (username, limit),
+                (usernames,),
             )
+            for username, context, updated_at in cur.fetchall():
+                contexts[username] = (context, updated_at)
+    except Exception as e:
+        log.error(f"Error retrieving contexts for users {usernames}: {e}")
+    finally:
+        conn.close()
+    return contexts
+
+
+def get_recent_chats(username: str, limit: int) -> str:
+    """Retrieves only the user's most recent prompts for analysis."""
+    conn = get_db_connection()
+    if conn is None:
+        return ""
+
+    user_prompts = []
+    try:
+        with conn.cursor() as cur:
+            schema_name = DB_SCHEMA
             # Fetch just the prompts and reverse for chronological order
-            results = reversed(cur.fetchall())
+            results = reversed(_fetch_recent_prompts(cur, schema_name, username, limit))
             for row in results:
                 user_prompts.append(row[0])
     except Exception as e:
@@ -165,17 +909,9 @@ def get_single_most_recent_chat(username: str) -> str | None:
 
     try:
         with conn.cursor() as cur:
-            schema_name = os.getenv("DB_SCHEMA")
-            cur.execute(
-                f"""
-                SELECT prompt FROM {schema_name}.chat_logs
-                WHERE username = %s
-                ORDER BY created_at DESC
-                LIMIT 1;
-                """,
-                (username,),
-            )
-            result = cur.fetchone()
+            schema_name = DB_SCHEMA
+            rows = _fetch_recent_prompts(cur, schema_name, username, 1)
+            result = rows[0] if rows else None
             if result:
                 # Return only the prompt text
                 return result[0]
@@ -196,7 +932,7 @@ def update_user_profile(username: str, profile: str):
 
     try:
         with conn.cursor() as cur:
-            schema_name = os.getenv("DB_SCHEMA")
+            schema_name = DB_SCHEMA
             log.info(f"Updating profile for user '{username}'.")
             log.debug(f"New profile for '{username}': {profile}")
 
@@ -218,6 +954,436 @@ def update_user_profile(username: str, profile: str):
             conn.close()
 
 
+# --- History Export ---
+def iter_chat_history(
+    username: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    after_id: int = 0,
+    limit: int | None = None,
+    include_embeddings: bool = False,
+    fetch_size: int = 500,
+):
+    """
+    Yields chat_logs rows as dicts in id order, for keyset pagination on
+    `after_id`. Filters are optional; `since` is inclusive, `until` is not.
+
+    Rows stream through a server-side cursor, so memory stays constant no
+    matter how much history matches. Embeddings are only read (and decoded
+    from compact storage) when `include_embeddings` is set. Database errors
+    are raised, so a caller can tell a failed export from a finished one.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise ConnectionError("Could not connect to the database.")
+
+    schema_name = DB_SCHEMA
+    conditions, params = ["c.id > %s"], [after_id]
+    if username is not None:
+        conditions.append("c.username = %s")
+        params.append(username)
+    if since is not None:
+        conditions.append("c.created_at >= %s")
+        params.append(since)
+    if until is not None:
+        conditions.append("c.created_at < %s")
+        params.append(until)
+
+    columns = (
+        "c.id, c.username, c.prompt, c.response, c.search_queries, c.created_at, "
+        "c.channel_id"
+    )
+    joins = ""
+    if include_embeddings:
+        columns += """,
+            c.embedding_model,
+            c.prompt_embedding, pe.embedding, pe.embedding_scale,
+            c.response_embedding, re.embedding, re.embedding_scale"""
+        joins = f"""
+            LEFT JOIN {schema_name}.embeddings pe
+            ON pe.content_hash = c.prompt_embedding_hash
+            LEFT JOIN {schema_name}.embeddings re
+            ON re.content_hash = c.response_embedding_hash"""
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = "LIMIT %s"
+        params.append(limit)
+
+    try:
+        with conn.cursor(name="chat_history_export") as cur:
+            cur.itersize = fetch_size
+            cur.execute(
+                f"""
+                SELECT {columns}
+                FROM {schema_name}.chat_logs c{joins}
+                WHERE {" AND ".join(conditions)}
+                ORDER BY c.id
+                {limit_clause};
+                """,
+                params,
+            )
+            for row in cur:
+                chat = {
+                    "id": row[0],
+                    "username": row[1],
+                    "prompt": row[2],
+                    "response": row[3],
+                    "search_queries": row[4],
+                    "created_at": row[5].isoformat() if row[5] else None,
+                    "channel_id": row[6],
+                }
+                if include_embeddings:
+                    chat["embedding_model"] = row[7]
+                    chat["prompt_embedding"] = _export_embedding(*row[8:11])
+                    chat["response_embedding"] = _export_embedding(*row[11:14])
+                yield chat
+    except Exception as e:
+        log.error(f"Error exporting chat history: {e}")
+        raise
+    finally:
+        conn.close()
+
+
+def _export_embedding(inline, stored, scale) -> list[float] | None:
+    """Returns whichever of the inline or compact vector is set, as a list."""
+    if inline is not None:
+        return _decode_embedding(inline, None).tolist()
+    if stored is not None:
+        return _decode_embedding(stored, scale).tolist()
+    return None
+
+
+# --- Embedding Backfill ---
+def _missing_embeddings_condition() -> str:
+    """SQL condition for chat rows lacking a vector in the current storage mode."""
+    if EMBEDDING_STORAGE == "vector":
+        return "(prompt_embedding IS NULL OR response_embedding IS NULL)"
+    return "(prompt_embedding_hash IS NULL OR response_embedding_hash IS NULL)"
+
+
+def label_unlabelled_embeddings(model: str) -> int:
+    """
+    Records `model` as the producer of vectors written before chat rows
+    tracked their embedding model, so a backfill does not redo them.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        return 0
+
+    try:
+        with conn.cursor() as cur:
+            schema_name = DB_SCHEMA
+            cur.execute(
+                f"""
+                UPDATE {schema_name}.chat_logs SET embedding_model = %s
+                WHERE embedding_model IS NULL
+                AND NOT {_missing_embeddings_condition()};
+                """,
+                (model,),
+            )
+            labelled = cur.rowcount
+        conn.commit()
+        return labelled
+    except Exception as e:
+        conn.rollback()
+        log.error(f"Error labelling existing embeddings: {e}")
+        return 0
+    finally:
+        conn.close()
+
+
+def count_chats_needing_embeddings(model: str, after_id: int = 0) -> int:
+    """Number of chat rows `iter_chats_needing_embeddings` would yield."""
+    conn = get_db_connection()
+    if conn is None:
+        return 0
+
+    try:
+        with conn.cursor() as cur:
+            schema_name = DB_SCHEMA
+            cur.execute(
+                f"""
+                SELECT COUNT(*) FROM {schema_name}.chat_logs
+                WHERE id > %s
+                AND (embedding_model IS DISTINCT FROM %s
+                     OR {_missing_embeddings_condition()});
+                """,
+                (after_id, model),
+            )
+            return cur.fetchone()[0]
+    except Exception as e:
+        log.error(f"Error counting chats to embed: {e}")
+        return 0
+    finally:
+        conn.close()
+
+
+def iter_chats_needing_embeddings(
+    model: str, after_id: int = 0, fetch_size: int = 1000
+):
+    """
+    Yields (id, prompt, response) in id order for chat rows whose vectors
+    are missing or were produced by a model other than `model`.
+
+    Streams through a server-side cursor, so the table is never loaded into
+    memory at once.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        return
+
+    try:
+        schema_name = DB_SCHEMA
+        with conn.cursor(name="chats_needing_embeddings") as cur:
+            cur.itersize = fetch_size
+            cur.execute(
+                f"""
+                SELECT id, prompt, response FROM {schema_name}.chat_logs
+                WHERE id > %s
+                AND (embedding_model IS DISTINCT FROM %s
+                     OR {_missing_embeddings_condition()})
+                ORDER BY id;
+                """,
+                (after_id, model),
+            )
+            yield from cur
+    finally:
+        conn.close()
+
+
+def update_chat_embeddings(model: str, rows: list[tuple]) -> bool:
+    """
+    Writes back (id, prompt, response, prompt_vec, response_vec) rows with
+    one bulk UPDATE, recording `model` as their producer. In the compact
+    modes the vectors go to the embeddings table and the rows get hashes.
+    """
+    if not rows:
+        return True
+    conn = get_db_connection()
+    if conn is None:
+        return False
+
+    try:
+        with conn.cursor() as cur:
+            schema_name = DB_SCHEMA
+            if EMBEDDING_STORAGE == "vector":
+                execute_values(
+                    cur,
+                    f"""
+                    UPDATE {schema_name}.chat_logs AS c
+                    SET prompt_embedding = v.prompt_embedding,
+                        response_embedding = v.response_embedding,
+                        embedding_model = v.model
+                    FROM (VALUES %s)
+                    AS v(id, model, prompt_embedding, response_embedding)
+                    WHERE c.id = v.id
+                    """,
+                    [
+                        (chat_id, model, np.asarray(p_vec), np.asarray(r_vec))
+                        for chat_id, _, _, p_vec, r_vec in rows
+                    ],
+                    template="(%s, %s::text, %s::vector, %s::vector)",
+                )
+            else:
+                embedding_rows, updates = {}, []
+                for chat_id, prompt, response, prompt_vec, response_vec in rows:
+                    prompt_hash = embedding_key(model, prompt)
+                    response_hash = embedding_key(model, response)
+                    embedding_rows[prompt_hash] = _embedding_row(
+                        prompt_hash, model, prompt_vec
+                    )
+                    embedding_rows[response_hash] = _embedding_row(
+                        response_hash, model, response_vec
+                    )
+                    updates.append((chat_id, model, prompt_hash, response_hash))
+                _upsert_embeddings(cur, schema_name, list(embedding_rows.values()))
+                execute_values(
+                    cur,
+                    f"""
+                    UPDATE {schema_name}.chat_logs AS c
+                    SET prompt_embedding_hash = v.prompt_hash,
+                        response_embedding_hash = v.response_hash,
+                        prompt_embedding = NULL,
+                        response_embedding = NULL,
+                        embedding_model = v.model
+                    FROM (VALUES %s) AS v(id, model, prompt_hash, response_hash)
+                    WHERE c.id = v.id
+                    """,
+                    updates,
+                    template="(%s, %s::text, %s::text, %s::text)",
+                )
+        conn.commit()
+        return True
+    except Exception as e:
+        conn.rollback()
+        log.error(f"Error writing back {len(rows)} chat embeddings: {e}")
+        return False
+    finally:
+        conn.close()
+
+
+# --- Conversation Context ---
+def get_recent_channel_turns(per_channel: int, max_age_seconds: int) -> list[tuple]:
+    """
+    Returns the newest `per_channel` turns of every channel active in the
+    last `max_age_seconds`, as (channel_id, username, prompt, response,
+    created_at) rows in chronological order, using one query.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        return []
+
+    try:
+        with conn.cursor() as cur:
+            schema_name = DB_SCHEMA
+            cur.execute(
+                f"""
+                SELECT channel_id, username, prompt, response, created_at
+                FROM (
+                    SELECT channel_id, username, prompt, response, created_at,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY channel_id ORDER BY created_at DESC
+                           ) AS turn
+                    FROM {schema_name}.chat_logs
+                    WHERE channel_id IS NOT NULL
+                    AND created_at >= NOW() - %s * INTERVAL '1 second'
+                ) recent
+                WHERE turn <= %s
+                ORDER BY created_at;
+                """,
+                (max_age_seconds, per_channel),
+            )
+            return cur.fetchall()
+    except Exception as e:
+        log.error(f"Error loading recent channel turns: {e}")
+        return []
+    finally:
+        conn.close()
+
+
+# --- Batch Profile Recomputation ---
+def count_users(after_username: str | None = None) -> int:
+    """Number of users, optionally only those sorting after `after_username`."""
+    conn = get_db_connection()
+    if conn is None:
+        return 0
+
+    try:
+        with conn.cursor() as cur:
+            schema_name = DB_SCHEMA
+            cur.execute(
+                f"SELECT COUNT(*) FROM {schema_name}.users WHERE username > %s;",
+                (after_username or "",),
+            )
+            return cur.fetchone()[0]
+    except Exception as e:
+        log.error(f"Error counting users: {e}")
+        return 0
+    finally:
+        conn.close()
+
+
+def iter_user_histories(
+    limit: int,
+    after_username: str | None = None,
+    fetch_size: int = 100,
+    usernames: list[str] | None = None,
+):
+    """
+    Yields (username, recent prompts as text) for every user in username
+    order, starting after `after_username`, or only for `usernames`.
+
+    Uses a server-side cursor so only `fetch_size` users are held in memory
+    at a time; each user's prompts are the newest `limit`, oldest first,
+    joined the same way as `get_recent_chats`.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        return
+
+    where, param = "u.username > %s", after_username or ""
+    if usernames is not None:
+        where, param = "u.username = ANY(%s)", list(usernames)
+    try:
+        schema_name = DB_SCHEMA
+        with conn.cursor(name="user_histories") as cur:
+            cur.itersize = fetch_size
+            cur.execute(
+                f"""
+                SELECT u.username, ARRAY(
+                    SELECT c.prompt FROM {schema_name}.chat_logs c
+                    WHERE c.username = u.username
+                    ORDER BY c.created_at DESC
+                    LIMIT %s
+                )
+                FROM {schema_name}.users u
+                WHERE {where}
+                ORDER BY u.username;
+                """,
+                (limit, param),
+            )
+            for username, prompts in cur:
+                yield username, "\n".join(reversed(prompts))
+    finally:
+        conn.close()
+
+
+def _insert_chats(cur, schema_name: str, chats: list[dict]):
+    """
+    Inserts chat rows with one multi-row INSERT.
+
+    Each chat is a dict with the keyword arguments of `save_chat`. In the
+    compact storage modes the vectors go to the embeddings table first and
+    the chat rows only reference them by hash.
+    """
+    embedding_rows, values = {}, []
+    for chat in chats:
+        model = chat.get("embedding_model") or OLLAMA_EMBEDDING_MODEL
+        prompt_embedding = chat.get("prompt_embedding")
+        response_embedding = chat.get("response_embedding")
+        has_embeddings = prompt_embedding is not None or response_embedding is not None
+        prompt_hash, response_hash = None, None
+        if EMBEDDING_STORAGE != "vector":
+            # Store each vector once in the embeddings table and reference it.
+            if prompt_embedding is not None:
+                prompt_hash = embedding_key(model, chat["prompt"])
+                embedding_rows[prompt_hash] = _embedding_row(
+                    prompt_hash, model, prompt_embedding
+                )
+            if response_embedding is not None:
+                response_hash = embedding_key(model, chat["response"])
+                embedding_rows[response_hash] = _embedding_row(
+                    response_hash, model, response_embedding
+                )
+            prompt_embedding, response_embedding = None, None
+
+        search_queries = chat.get("search_queries")
+        values.append(
+            (
+                chat["username"],
+                chat["prompt"],
+                chat["response"],
+                prompt_embedding,
+                response_embedding,
+                ", ".join(search_queries) if search_queries else None,
+                prompt_hash,
+                response_hash,
+                model if has_embeddings else None,
+                chat.get("channel_id"),
+            )
+        )
+
+    _upsert_embeddings(cur, schema_name, list(embedding_rows.values()))
+    execute_values(
+        cur,
+        f"""
+        INSERT INTO {schema_name}.chat_logs (username, prompt, response, prompt_embedding, response_embedding, search_queries, prompt_embedding_hash, response_embedding_hash, embedding_model, channel_id)
+        VALUES %s
+        """,
+        values,
+    )
+
+
 def save_chat(
     username: str,
     prompt: str,
@@ -225,6 +1391,8 @@ def save_chat(
     prompt_embedding,
     response_embedding,
     search_queries: list[str] | None = None,
+    embedding_model: str = OLLAMA_EMBEDDING_MODEL,
+    channel_id: str | None = None,
 ):
     """Saves a chat prompt, its response, the user, embeddings, and search queries to the database."""
     conn = get_db_connection()
@@ -232,24 +1400,24 @@ def save_chat(
         log.error("Could not save chat log due to no database connection.")
         return
 
-    queries_str = ", ".join(search_queries) if search_queries else None
-
     try:
         with conn.cursor() as cur:
-            schema_name = os.getenv("DB_SCHEMA")
-            cur.execute(
-                f"""
-                INSERT INTO {schema_name}.chat_logs (username, prompt, response, prompt_embedding, response_embedding, search_queries)
-                VALUES (%s, %s, %s, %s, %s, %s)
-                """,
-                (
-                    username,
-                    prompt,
-                    response,
-                    prompt_embedding,
-                    response_embedding,
-                    queries_str,
-                ),
+            schema_name = DB_SCHEMA
+            _insert_chats(
+                cur,
+                schema_name,
+                [
+                    {
+                        "username": username,
+                        "prompt": prompt,
+                        "response": response,
+                        "prompt_embedding": prompt_embedding,
+                        "response_embedding": response_embedding,
+                        "search_queries": search_queries,
+                        "embedding_model": embedding_model,
+                        "channel_id": channel_id,
+                    }
+                ],
             )
         conn.commit()
         log.info(f"SUCCESS: Saved chat from '{username}'.")
@@ -258,3 +1426,94 @@ def save_chat(
     finally:
         if conn:
             conn.close()
+
+
+def save_chats(chats: list[dict]) -> bool:
+    """Saves a batch of chats in one transaction. Returns True on success."""
+    if not chats:
+        return True
+    conn = get_db_connection()
+    if conn is None:
+        log.error("Could not save chat batch due to no database connection.")
+        return False
+
+    try:
+        with conn.cursor() as cur:
+            schema_name = DB_SCHEMA
+            _insert_chats(cur, schema_name, chats)
+        conn.commit()
+        log.debug(f"SUCCESS: Saved a batch of {len(chats)} chats.")
+        return True
+    except Exception as e:
+        conn.rollback()
+        log.error(f"An error occurred while saving a batch of {len(chats)} chats: {e}")
+        return False
+    finally:
+        if conn:
+            conn.close()
+
+
+# --- Rate Limiting ---
+def take_rate_limit_tokens(
+    buckets: list[tuple[str, float, float]], cost: float = 1.0
+) -> float | None:
+    """
+    Shared-store version of the token bucket in tools.rate_limit: takes
+    `cost` tokens from every (key, capacity, rate) bucket or from none.
+    Returns None when allowed, otherwise the seconds until all can pay.
+
+    The rows are locked for the transaction and refilled using the
+    database clock, so concurrent instances see consistent levels.
+    """
+    conn = get_db_connection()
+    if conn is None:
+        raise ConnectionError("Rate limit store is unavailable.")
+
+    try:
+        with conn.cursor() as cur:
+            schema_name = DB_SCHEMA
+            limits = {key: (capacity, rate) for key, capacity, rate in buckets}
+            execute_values(
+                cur,
+                f"""
+                INSERT INTO {schema_name}.rate_limit_buckets (key, tokens)
+                VALUES %s ON CONFLICT (key) DO NOTHING;
+                """,
+                [(key, capacity) for key, (capacity, _) in limits.items()],
+            )
+            cur.execute(
+                f"""
+                SELECT key, tokens, EXTRACT(EPOCH FROM NOW() - updated_at)
+                FROM {schema_name}.rate_limit_buckets
+                WHERE key = ANY(%s)
+                ORDER BY key
+                FOR UPDATE;
+                """,
+                (list(limits),),
+            )
+            levels, retry_after = [], 0.0
+            for key, tokens, idle in cur.fetchall():
+                capacity, rate = limits[key]
+                tokens = min(capacity, tokens + max(0.0, float(idle)) * rate)
+                levels.append((key, tokens - cost))
+                if tokens < cost:
+                    retry_after = max(retry_after, (cost - tokens) / rate)
+
+            if not retry_after:
+                execute_values(
+                    cur,
+                    f"""
+                    UPDATE {schema_name}.rate_limit_buckets AS b
+                    SET tokens = v.tokens, updated_at = NOW()
+                    FROM (VALUES %s) AS v (key, tokens)
+                    WHERE b.key = v.key;
+                    """,
+                    levels,
+                )
+        conn.commit()
+        return retry_after or None
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()